@@ -0,0 +1,2 @@
+#!/usr/bin/env bash
+staticjinja build --outpath=build
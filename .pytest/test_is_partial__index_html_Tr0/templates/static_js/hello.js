@@ -0,0 +1 @@
+var a = function () {return true};
\ No newline at end of file
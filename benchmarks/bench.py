@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+"""
+Benchmarks staticjinja on a synthetic site.
+
+Generates a site of templates, partials, contexts, rules and static files in a
+temporary directory, times the main operations on it and prints the median of
+several runs of each. The results can be saved as a baseline, and later
+results compared against it, failing if any operation got slower by more than
+a tolerance. It only needs staticjinja and the standard library, and runs
+offline.
+
+Usage::
+
+    python benchmarks/bench.py --output baseline.json
+    # ...upgrade or change something...
+    python benchmarks/bench.py --baseline baseline.json
+
+A baseline is only meaningful on the machine it was made on, so none is kept
+in the repository.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import typing as t
+import warnings
+from pathlib import Path
+
+import staticjinja
+
+#: The operations that are timed, in the order they are run.
+BENCHMARKS = (
+    "discover",
+    "render",
+    "render_threads",
+    "render_incremental",
+    "get_dependents",
+    "reloader",
+    "copy_static",
+)
+
+
+def generate_site(
+    root: Path,
+    pages: int = 200,
+    depth: int = 3,
+    fanout: int = 3,
+    static_files: int = 50,
+    static_size: int = 16384,
+) -> None:
+    """Write the templates and static files of a synthetic site to *root*.
+
+    Every page extends a base layout and includes *fanout* partials, each of
+    which includes the next partial in a chain *depth* long. Pages are split
+    over subdirectories of 50 pages each.
+
+    :param root: the directory to write to.
+    :param pages: the number of pages.
+    :param depth: the length of each chain of partials.
+    :param fanout: the number of chains each page includes.
+    :param static_files: the number of static files.
+    :param static_size: the size of each static file, in bytes.
+    """
+    partials = root / "_partials"
+    partials.mkdir(parents=True)
+    (root / "_base.html").write_text(
+        "<html><title>{% block title %}{% endblock %}</title>\n"
+        "<body>{% block body %}{% endblock %}</body></html>\n"
+    )
+    for chain in range(fanout):
+        for level in range(depth):
+            body = f"<p>Chain {chain}, level {level}: {{{{ title }}}}</p>\n"
+            if level + 1 < depth:
+                body += f"{{% include '_partials/{chain}_{level + 1}.html' %}}\n"
+            partials.joinpath(f"{chain}_{level}.html").write_text(body)
+
+    includes = "".join(
+        f"{{% include '_partials/{chain}_0.html' %}}\n" for chain in range(fanout)
+    )
+    for page in range(pages):
+        directory = root / "pages" / str(page // 50)
+        directory.mkdir(parents=True, exist_ok=True)
+        directory.joinpath(f"page{page}.html").write_text(
+            "{% extends '_base.html' %}\n"
+            "{% block title %}{{ title }}{% endblock %}\n"
+            "{% block body %}\n"
+            f"{includes}"
+            "{% for item in items %}<li>{{ item|upper }}</li>{% endfor %}\n"
+            "{% endblock %}\n"
+        )
+
+    # Seeded, so the same sizes always make the same site.
+    rng = random.Random(0)
+    static = root / "static"
+    static.mkdir()
+    for i in range(static_files):
+        data = bytes(rng.getrandbits(8) for _ in range(static_size))
+        static.joinpath(f"asset{i}.bin").write_bytes(data)
+
+
+def page_context(template: t.Any) -> dict[str, t.Any]:
+    return {"title": template.name, "items": [f"item {i}" for i in range(20)]}
+
+
+def rule_render(site: staticjinja.Site, template: t.Any, **kwargs: t.Any) -> None:
+    site.write(template.name, template.generate(**kwargs))
+
+
+def make_site(
+    searchpath: Path, outpath: Path, contexts: int = 10, rules: int = 10
+) -> staticjinja.Site:
+    """Make a Site for a generated site, with *contexts* contexts and *rules*
+    rules. Each context and rule matches the pages whose number starts with
+    a different number, so every page is matched by one of each at most."""
+    patterns = [rf"pages/\d+/page{i}\d*\.html" for i in range(max(contexts, rules))]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        return staticjinja.Site.make_site(
+            searchpath=str(searchpath),
+            outpath=str(outpath),
+            contexts=[(p, page_context) for p in patterns[:contexts]],
+            rules=[(p, rule_render) for p in patterns[:rules]],
+            staticpaths=["static"],
+            cache_dir=str(outpath.parent / "cache"),
+        )
+
+
+def timeit(
+    func: t.Callable[[], object],
+    repeat: int,
+    setup: t.Callable[[], object] | None = None,
+) -> float:
+    """Get the median seconds *func* takes over *repeat* runs, calling
+    *setup* untimed before each."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def run(args: argparse.Namespace) -> dict[str, float]:
+    """Generate a site as configured by *args*, and time each benchmark on
+    it. Returns the median seconds of each."""
+    only = set(args.only.split(",")) if args.only else set(BENCHMARKS)
+    unknown = only - set(BENCHMARKS)
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results: dict[str, float] = {}
+    with tempfile.TemporaryDirectory(prefix="staticjinja-bench-") as tmp:
+        searchpath = Path(tmp) / "templates"
+        outpath = Path(tmp) / "build"
+        generate_site(
+            searchpath,
+            pages=args.pages,
+            depth=args.depth,
+            fanout=args.fanout,
+            static_files=args.static_files,
+            static_size=args.static_size,
+        )
+        site = make_site(searchpath, outpath, args.contexts, args.rules)
+        partial = f"_partials/0_{args.depth - 1}.html"
+
+        def clean() -> None:
+            shutil.rmtree(outpath, ignore_errors=True)
+            shutil.rmtree(Path(tmp) / "cache", ignore_errors=True)
+
+        def render(**kwargs: t.Any) -> None:
+            site.render(**kwargs)
+
+        def dependents() -> None:
+            site._dependencies = None
+            site.get_dependents(partial)
+
+        def reload() -> None:
+            reloader = staticjinja.Reloader(site)
+            reloader.handle_batch([("modified", str(searchpath / partial))])
+
+        def copy() -> None:
+            site.copy_static(site.static_names, threads=args.threads)
+
+        benchmarks: dict[str, tuple[t.Callable[[], object], t.Any]] = {
+            "discover": (lambda: list(site.discover()), None),
+            "render": (render, clean),
+            "render_threads": (lambda: render(threads=args.threads), clean),
+            "render_incremental": (lambda: render(incremental=True), None),
+            "get_dependents": (dependents, None),
+            "reloader": (reload, None),
+            "copy_static": (copy, clean),
+        }
+        for name in BENCHMARKS:
+            if name in only:
+                func, setup = benchmarks[name]
+                if name == "render_incremental":
+                    # Prime the manifest, so only no-op builds are timed.
+                    clean()
+                    render(incremental=True)
+                results[name] = timeit(func, args.repeat, setup)
+                print(f"{name:<20} {results[name]:10.4f}s", file=sys.stderr)
+    return results
+
+
+def compare(
+    results: dict[str, float],
+    baseline: dict[str, float],
+    tolerance: float,
+    min_delta: float = 0.001,
+) -> list[str]:
+    """Compare *results* against *baseline*, and get the names of the
+    benchmarks that got slower by more than *tolerance*, as a fraction of
+    their baseline time. Differences under *min_delta* seconds are ignored as
+    noise."""
+    regressions = []
+    for name, seconds in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        change = (seconds - before) / before if before else 0.0
+        slower = change > tolerance and seconds - before > min_delta
+        mark = "  REGRESSION" if slower else ""
+        print(f"{name:<20} {before:10.4f}s -> {seconds:10.4f}s {change:+8.1%}{mark}")
+        if slower:
+            regressions.append(name)
+    return regressions
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark staticjinja on a synthetic site."
+    )
+    size = parser.add_argument_group("site size")
+    size.add_argument("--pages", type=int, default=200, help="number of pages")
+    size.add_argument("--depth", type=int, default=3, help="depth of partials")
+    size.add_argument(
+        "--fanout", type=int, default=3, help="partials included by each page"
+    )
+    size.add_argument("--contexts", type=int, default=10, help="number of contexts")
+    size.add_argument("--rules", type=int, default=10, help="number of rules")
+    size.add_argument(
+        "--static-files", type=int, default=50, help="number of static files"
+    )
+    size.add_argument(
+        "--static-size", type=int, default=16384, help="bytes per static file"
+    )
+    parser.add_argument(
+        "--threads", type=int, default=4, help="threads for the threaded benchmarks"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark")
+    parser.add_argument(
+        "--only", help="comma separated benchmarks to run: " + ", ".join(BENCHMARKS)
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="fraction a benchmark may slow down by before failing",
+    )
+    args = parser.parse_args(argv)
+    if args.pages < 1 or args.depth < 1 or args.fanout < 0:
+        parser.error("--pages and --depth must be at least 1, --fanout at least 0")
+    return args
+
+
+#: The arguments that determine the site, which must match for results to be
+#: comparable.
+PARAMS = (
+    "pages",
+    "depth",
+    "fanout",
+    "contexts",
+    "rules",
+    "static_files",
+    "static_size",
+    "threads",
+)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    params = {name: getattr(args, name) for name in PARAMS}
+    results = run(args)
+    report = {
+        "staticjinja": staticjinja.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=1) + "\n")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline["params"] != params:
+            print(
+                f"The baseline was made with different parameters: "
+                f"{baseline['params']}",
+                file=sys.stderr,
+            )
+            return 2
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"Slower than the baseline: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    # Logging every file would be timed too.
+    staticjinja.logger.setLevel(logging.WARNING)
+    sys.exit(main())
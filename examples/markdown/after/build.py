@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 # build.py
-import os
 from pathlib import Path
 
 import markdown
@@ -17,11 +16,10 @@ def md_context(template):
 
 def render_md(site, template, **kwargs):
     # i.e. posts/post1.md -> build/posts/post1.html
-    out = site.outpath / Path(template.name).with_suffix(".html")
+    out = Path(template.name).with_suffix(".html")
 
     # Compile and stream the result
-    os.makedirs(out.parent, exist_ok=True)
-    site.get_template("_post.html").stream(**kwargs).dump(str(out), encoding="utf-8")
+    site.write(out, site.get_template("_post.html").generate(**kwargs))
 
 
 site = Site.make_site(
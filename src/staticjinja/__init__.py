@@ -27,5 +27,28 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler())
 
+from .assets import AssetManifest as AssetManifest  # noqa: E402
+from .contexts import Lazy as Lazy  # noqa: E402
+from .contexts import cached_context as cached_context  # noqa: E402
+from .dependencies import DependencyGraph as DependencyGraph  # noqa: E402
+from .livereload import LiveReload as LiveReload  # noqa: E402
+from .manifest import BuildManifest as BuildManifest  # noqa: E402
+from .outputs import ArchiveOutput as ArchiveOutput  # noqa: E402
+from .outputs import FileSystemOutput as FileSystemOutput  # noqa: E402
+from .outputs import MemoryOutput as MemoryOutput  # noqa: E402
+from .outputs import Output as Output  # noqa: E402
+from .outputs import RecordingOutput as RecordingOutput  # noqa: E402
+from .pages import CSVRows as CSVRows  # noqa: E402
+from .pages import Page as Page  # noqa: E402
+from .pages import Pages as Pages  # noqa: E402
+from .precompress import Precompressor as Precompressor  # noqa: E402
+from .profiler import BuildProfile as BuildProfile  # noqa: E402
 from .reloader import Reloader as Reloader  # noqa: E402
+from .selection import Selection as Selection  # noqa: E402
+from .selection import changed_since as changed_since  # noqa: E402
+from .server import Server as Server  # noqa: E402
+from .shards import Shard as Shard  # noqa: E402
+from .shards import merge_shards as merge_shards  # noqa: E402
+from .staticjinja import BuildError as BuildError  # noqa: E402
+from .staticjinja import BuildSummary as BuildSummary  # noqa: E402
 from .staticjinja import Site as Site  # noqa: E402
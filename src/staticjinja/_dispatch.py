@@ -0,0 +1,78 @@
+"""
+Match template names against the regexes of a Site's contexts and rules.
+
+The regexes are compiled once. When they allow it, they are also combined into
+single regexes, so that finding the first (or every) regex that matches a name
+takes one call into the regex engine instead of one per regex.
+"""
+
+from __future__ import annotations
+
+import re
+import typing as t
+
+_DEFAULT_FLAGS = re.compile("").flags
+
+
+def _combinable(regex: re.Pattern[str]) -> bool:
+    # Groups would be renumbered, and so break backreferences, and global
+    # flags can only appear at the start of a regex.
+    return regex.groups == 0 and regex.flags == _DEFAULT_FLAGS
+
+
+class RegexTable:
+    """The compiled form of a list of regexes, each matched like
+    :func:`re.match` (ie anchored at the start of the name).
+
+    :param regexes: the regexes, as strings or compiled patterns.
+    """
+
+    def __init__(self, regexes: t.Sequence[str | re.Pattern[str]]) -> None:
+        self.regexes = tuple(regexes)
+        self._compiled = [re.compile(regex) for regex in self.regexes]
+        self._first: re.Pattern[str] | None = None
+        self._all: re.Pattern[str] | None = None
+        if self._compiled and all(_combinable(c) for c in self._compiled):
+            # Alternatives are tried in order, so the first one to match wins.
+            # With no other groups, m.lastindex is the (1-based) index of it.
+            self._first = re.compile("|".join(f"({c.pattern})" for c in self._compiled))
+            # Each optional lookahead matches without consuming anything, so
+            # the empty group after it is set exactly when the regex matches.
+            self._all = re.compile(
+                "".join(f"(?:(?={c.pattern})())?" for c in self._compiled)
+            )
+
+    def first(self, name: str) -> int | None:
+        """Get the index of the first regex that matches *name*, if any."""
+        if self._first is not None:
+            m = self._first.match(name)
+            return None if m is None else t.cast(int, m.lastindex) - 1
+        for i, regex in enumerate(self._compiled):
+            if regex.match(name):
+                return i
+        return None
+
+    def all(self, name: str) -> list[int]:
+        """Get the indices of all the regexes that match *name*, in order."""
+        if self._all is not None:
+            m = self._all.match(name)
+            assert m is not None, "every group is optional"
+            return [i for i, g in enumerate(m.groups()) if g is not None]
+        return [i for i, regex in enumerate(self._compiled) if regex.match(name)]
+
+
+class CachedTable:
+    """The :class:`RegexTable` of a list of *(regex, value)* pairs, such as
+    the contexts or rules of a Site, which may be changed in place at any
+    time. Only the regexes are compared on each lookup, and the table is only
+    built again when they change."""
+
+    def __init__(self) -> None:
+        self._table: RegexTable | None = None
+
+    def get(self, pairs: t.Iterable[tuple[str, t.Any]]) -> RegexTable:
+        """Get the table of the regexes of *pairs*."""
+        regexes = tuple(regex for regex, _ in pairs)
+        if self._table is None or self._table.regexes != regexes:
+            self._table = RegexTable(regexes)
+        return self._table
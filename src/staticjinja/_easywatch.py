@@ -13,20 +13,27 @@ from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
 
 
-def watch(path: str | Path, handler) -> None:
+def watch(path: str | Path, handler, main=None) -> None:
     """Watch a directory for events.
     -   path should be the directory to watch
     -   handler should a function which takes an event_type and src_path
         and does something interesting. event_type will be one of 'created',
         'deleted', 'modified', or 'moved'. src_path will be the absolute
-        path to the file that triggered the event.
+        path to the file that triggered the event. For 'moved' events, the
+        path the file was moved to is passed too, as dest_path. It is called
+        from the observer's thread.
+    -   main, if given, is called in this thread while watching, and should
+        run until interrupted.
     """
 
     # let the user just deal with events
     @functools.wraps(handler)
     def wrapper(self, event):
-        if not event.is_directory:
-            return handler(event.event_type, event.src_path)
+        if event.is_directory:
+            return
+        if event.event_type == "moved":
+            return handler(event.event_type, event.src_path, event.dest_path)
+        return handler(event.event_type, event.src_path)
 
     attrs = {"on_any_event": wrapper}
     EventHandler = type("EventHandler", (FileSystemEventHandler,), attrs)
@@ -34,6 +41,8 @@ def watch(path: str | Path, handler) -> None:
     observer.schedule(EventHandler(), path=str(path), recursive=True)
     observer.start()
     try:
+        if main is not None:
+            main()
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
@@ -0,0 +1,365 @@
+"""
+Run build tasks in pools of worker processes or threads.
+
+Each worker process rebuilds its own :class:`Site <staticjinja.Site>` (and so
+its own :class:`jinja2.Environment`) from the arguments that were originally
+given to :meth:`Site.make_site <staticjinja.Site.make_site>`, so everything
+those arguments reference must be picklable. Worker threads share the Site
+they were started from. See :ref:`parallel-rendering`.
+
+Tasks are submitted lazily, with only a bounded number in flight at once, and
+a failing task doesn't stop the others: errors are collected per file name.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import itertools
+import logging
+import logging.handlers
+import multiprocessing
+import pickle
+import typing as t
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+if t.TYPE_CHECKING:
+    from .manifest import Entry
+    from .pages import Page
+    from .profiler import BuildProfile
+    from .staticjinja import BuildSummary, Site
+
+    # What each batch of templates rendered in a worker process sends back.
+    _BatchResult = t.Tuple[
+        t.Dict[str, BaseException],
+        BuildSummary,
+        t.Dict[str, Entry],
+        t.Optional[BuildProfile],
+        t.Dict[str, str],
+        t.List[str],
+    ]
+
+logger = logging.getLogger(__name__)
+
+_T = t.TypeVar("_T")
+
+# How many tasks may be queued per worker before we wait for some to finish.
+PENDING_PER_WORKER = 4
+
+# How many pages of Pages rules are sent to a worker process at once.
+PAGES_PER_BATCH = 64
+
+# The Site that lives in each worker process, built by _init_worker().
+_site: Site | None = None
+
+
+class _ForwardHandler(logging.Handler):
+    """Re-emit records received from workers through the parent's loggers, so
+    that however the user configured ``staticjinja.logger`` is respected."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        logging.getLogger(record.name).handle(record)
+
+
+def _init_worker(
+    site_cls: type[Site],
+    site_kwargs: dict[str, t.Any],
+    log_queue: t.Any,
+    log_level: int,
+    incremental: bool,
+    profile: bool,
+) -> None:
+    global _site
+    package_logger = logging.getLogger(__package__)
+    package_logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    package_logger.setLevel(log_level)
+    # The parent already propagates forwarded records to the root logger.
+    package_logger.propagate = False
+    _site = site_cls.make_site(**site_kwargs)
+    if incremental:
+        from .manifest import BuildManifest
+
+        _site.manifest = BuildManifest.load(_site.manifest_path)
+    if profile:
+        from .profiler import BuildProfile
+
+        _site.profile = BuildProfile()
+
+
+def _picklable(e: BaseException) -> BaseException:
+    try:
+        pickle.dumps(e)
+    except Exception:
+        return RuntimeError(f"{type(e).__name__}: {e}")
+    return e
+
+
+def _start_batch() -> Site:
+    """Reset what the worker's Site records, so each batch reports its own."""
+    from .profiler import BuildProfile
+    from .staticjinja import BuildSummary
+
+    assert _site is not None, "worker was not initialized"
+    _site.summary = BuildSummary()
+    if _site.manifest is not None:
+        _site.manifest.entries = {}
+    if _site.profile is not None:
+        _site.profile = BuildProfile()
+    return _site
+
+
+@contextlib.contextmanager
+def _recording_errors(name: str, errors: dict[str, BaseException]) -> t.Iterator[None]:
+    """Record what is raised while building *name* in *errors*, so that the
+    parent reports the file that actually failed rather than the batch it was
+    in. Only interrupts stop the batch."""
+    try:
+        yield
+    except KeyboardInterrupt:
+        raise
+    except BaseException as e:
+        errors[name] = _picklable(e)
+
+
+def _render_names(template_names: list[str]) -> _BatchResult:
+    site = _start_batch()
+    errors: dict[str, BaseException] = {}
+    for name in template_names:
+        with _recording_errors(name, errors):
+            site.render_template(site.get_template(name))
+    return _batch_result(site, errors)
+
+
+def _render_pages(batch: tuple[str, list[Page]]) -> _BatchResult:
+    template_name, pages = batch
+    site = _start_batch()
+    errors: dict[str, BaseException] = {}
+    with _recording_errors(template_name, errors):
+        rule = site._pages_rule(template_name)
+        if rule is None:
+            raise ValueError(f"{template_name} has no Pages rule in the worker")
+        template = site.get_template(template_name)
+        context = site.get_context(template)
+    if errors:
+        # Like with threads, none of the pages can be rendered.
+        return _batch_result(site, errors)
+    for page in pages:
+        with _recording_errors(page.name, errors):
+            site._render_page(template, context, rule, page)
+    return _batch_result(site, errors)
+
+
+def _batch_result(site: Site, errors: dict[str, BaseException]) -> _BatchResult:
+    entries = site.manifest.entries if site.manifest is not None else {}
+    precompressed: dict[str, str] = {}
+    uncompressed: list[str] = []
+    if site.precompressor is not None:
+        # The parent saves the hashes of the files compressed in every worker,
+        # and forgets those whose compressed copies a worker removed.
+        failed = site.precompressor.wait(save=False)
+        errors.update({name: _picklable(e) for name, e in failed.items()})
+        precompressed = site.precompressor.pop_updates()
+        uncompressed = site.precompressor.pop_removals()
+    summary, profile = site.summary, site.profile
+    return errors, summary, entries, profile, precompressed, uncompressed
+
+
+def run_bounded(
+    executor: Executor,
+    fn: t.Callable[[_T], t.Any],
+    items: t.Iterable[tuple[str, _T]],
+    max_pending: int,
+    on_result: t.Callable[[t.Any], dict[str, BaseException]] | None = None,
+) -> dict[str, BaseException]:
+    """Call ``fn(item)`` in *executor* for each *(name, item)* pair.
+
+    At most *max_pending* calls are queued at any time, and *items* is only
+    consumed as calls finish, so memory use doesn't grow with the number of
+    items.
+
+    If given, *on_result* is called in this thread with the result of each
+    call, and returns a mapping of any further errors to report. This is how a
+    batch of files reports its failures, under the names of the files that
+    failed. An error raised by the call itself is reported under its *name*.
+
+    :return: a mapping from name to the exception raised while handling it.
+    """
+    errors: dict[str, BaseException] = {}
+    pending: dict[Future[t.Any], str] = {}
+
+    def collect(futures: t.Iterable[Future[t.Any]]) -> None:
+        for future in futures:
+            name = pending.pop(future)
+            e = future.exception()
+            if e is not None:
+                errors[name] = e
+            elif on_result is not None:
+                errors.update(on_result(future.result()))
+
+    for name, item in items:
+        if len(pending) >= max_pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+        pending[executor.submit(fn, item)] = name
+    collect(wait(pending).done)
+    for name, e in errors.items():
+        logger.error("Error building %s: %s", name, e)
+    return errors
+
+
+def run_in_threads(
+    fn: t.Callable[[_T], t.Any],
+    items: t.Iterable[tuple[str, _T]],
+    threads: int,
+) -> dict[str, BaseException]:
+    """Call ``fn(item)`` for each *(name, item)* pair in a pool of *threads*.
+
+    :return: a mapping from name to the exception raised while handling it.
+    """
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return run_bounded(pool, fn, items, threads * PENDING_PER_WORKER)
+
+
+def worker_kwargs(site: Site) -> dict[str, t.Any]:
+    """Get the keyword arguments to rebuild *site* with in a worker process.
+
+    Attributes that may have been changed on the Site after it was created
+    are read from the Site itself, everything else comes from the original
+    call to :meth:`Site.make_site <staticjinja.Site.make_site>`.
+    """
+    if site._make_site_kwargs is None:
+        raise ValueError(
+            "Rendering with workers requires a Site created with Site.make_site()"
+        )
+    from .outputs import FileSystemOutput
+
+    if not isinstance(site.output, FileSystemOutput):
+        raise ValueError(
+            "Rendering with workers requires the output to be on the filesystem"
+        )
+    kwargs = dict(site._make_site_kwargs)
+    kwargs.update(
+        output=None if site._default_output else site.output,
+        outpath=site.outpath,
+        contexts=site.contexts,
+        rules=site.rules,
+        staticpaths=site.staticpaths,
+        mergecontexts=site.mergecontexts,
+        cache_dir=site.cache_dir,
+        write_if_changed=site.write_if_changed,
+    )
+    return kwargs
+
+
+def _batches(items: t.Iterable[_T], size: int) -> t.Iterator[tuple[_T, list[_T]]]:
+    it = iter(items)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch[0], batch
+
+
+def _page_batches(
+    pages: t.Iterable[tuple[str, Page]], size: int
+) -> t.Iterator[tuple[str, tuple[str, list[Page]]]]:
+    for template_name, group in itertools.groupby(pages, key=lambda p: p[0]):
+        for first, batch in _batches((page for _, page in group), size):
+            yield first.name, (template_name, batch)
+
+
+def render_in_processes(
+    site: Site, template_names: t.Sequence[str], workers: int
+) -> dict[str, BaseException]:
+    """Render *template_names* using a pool of *workers* processes.
+
+    Raises a :exc:`TypeError` if the Site can't be sent to the workers.
+
+    :return: a mapping from template name to the exception raised while
+        rendering it.
+    """
+    # Send names in batches to keep the IPC overhead per template low.
+    size = max(1, min(64, len(template_names) // (workers * 4)))
+    batches = _batches(template_names, size)
+    return _run_in_processes(site, _render_names, batches, workers)
+
+
+def render_pages_in_processes(
+    site: Site, pages: t.Iterable[tuple[str, Page]], workers: int
+) -> dict[str, BaseException]:
+    """Render the pages of :class:`Pages <staticjinja.Pages>` rules using a
+    pool of *workers* processes, each given as a *(template name, page)*
+    pair. The pages are sent in batches, and only consumed as batches finish,
+    since there may be too many to hold in memory.
+
+    Raises a :exc:`TypeError` if the Site can't be sent to the workers.
+
+    :return: a mapping from page name to the exception raised while rendering
+        it.
+    """
+    batches = _page_batches(pages, PAGES_PER_BATCH)
+    return _run_in_processes(site, _render_pages, batches, workers)
+
+
+def _run_in_processes(
+    site: Site,
+    fn: t.Callable[[_T], _BatchResult],
+    batches: t.Iterable[tuple[str, _T]],
+    workers: int,
+) -> dict[str, BaseException]:
+    site_cls = type(site)
+    site_kwargs = worker_kwargs(site)
+    try:
+        pickle.dumps((site_cls, site_kwargs))
+    except Exception as e:
+        raise TypeError(
+            "Rendering with workers requires the Site class, contexts, rules, "
+            "filters and env_globals to be picklable (for example, "
+            f"module-level functions instead of lambdas): {e}"
+        ) from e
+
+    def on_result(result: _BatchResult) -> dict[str, BaseException]:
+        errors, summary, entries, profile, precompressed, uncompressed = result
+        site.summary.merge(summary)
+        if site.manifest is not None:
+            site.manifest.update(entries)
+        if site.precompressor is not None:
+            site.precompressor.update(precompressed)
+            for name in uncompressed:
+                # The copies are gone already, this forgets their hashes.
+                site.precompressor.remove(site.output, name)
+        if site.profile is not None and profile is not None:
+            site.profile.merge(profile)
+        return errors
+
+    incremental = site.manifest is not None
+    profile = site.profile is not None
+    log_level = logging.getLogger(__package__).getEffectiveLevel()
+    log_queue: multiprocessing.Queue[logging.LogRecord] = multiprocessing.Queue()
+    listener = logging.handlers.QueueListener(log_queue, _ForwardHandler())
+    listener.start()
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(
+                site_cls,
+                site_kwargs,
+                log_queue,
+                log_level,
+                incremental,
+                profile,
+            ),
+        ) as pool:
+            return run_bounded(
+                pool, fn, batches, workers * PENDING_PER_WORKER, on_result
+            )
+    finally:
+        listener.stop()
+        log_queue.close()
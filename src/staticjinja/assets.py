@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import typing as t
+from pathlib import Path, PurePosixPath
+
+from .manifest import hash_bytes, hash_file, write_atomic
+
+if t.TYPE_CHECKING:
+    from .types import FilePath
+
+logger = logging.getLogger(__name__)
+
+#: The name of the asset manifest, inside the outpath or the cache directory.
+ASSETS_NAME = ".staticjinja-assets.json"
+
+#: How many hex digits of the hash of a static file go in its name.
+HASH_LENGTH = 8
+
+
+def fingerprinted_name(name: str, digest: str) -> str:
+    """Put the first :data:`HASH_LENGTH` digits of *digest* in *name*, before
+    its extension, e.g. ``css/app.css`` becomes ``css/app.3f9a1c2e.css``."""
+    path = PurePosixPath(name)
+    return str(path.with_name(f"{path.stem}.{digest[:HASH_LENGTH]}{path.suffix}"))
+
+
+class AssetManifest:
+    """
+    The hashes of the static files of a Site, which are copied to fingerprinted
+    names when it is created with ``fingerprint_static=True``. See
+    :ref:`fingerprinting`.
+
+    Each hash is stored with the size and modification time of the file it
+    was computed from, and files are only hashed again once those change.
+
+    :param path:
+        The path of the JSON file the manifest is stored in.
+
+    :param entries:
+        The entries loaded by :meth:`load`.
+    """
+
+    version = 1
+
+    def __init__(
+        self, path: FilePath, entries: dict[str, dict[str, t.Any]] | None = None
+    ) -> None:
+        self.path = Path(path)
+        #: Maps the name of each static file to its size, modification time
+        #: and hash.
+        self.entries = entries or {}
+        self._dirty = False
+        self._key: str | None = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: FilePath) -> AssetManifest:
+        """Load the manifest stored at *path*, or an empty one if there is no
+        manifest there or it can't be read."""
+        try:
+            data = json.loads(Path(path).read_text(encoding="utf8"))
+        except FileNotFoundError:
+            return cls(path)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable asset manifest %s: %s", path, e)
+            return cls(path)
+        if not isinstance(data, dict) or data.get("version") != cls.version:
+            logger.warning("Ignoring asset manifest %s from another version", path)
+            return cls(path)
+        return cls(path, data.get("assets", {}))
+
+    def digest(self, name: str, path: FilePath) -> str:
+        """Get the hash of the static file *name*, which is at *path*."""
+        st = os.stat(path)
+        with self._lock:
+            entry = self.entries.get(name)
+        stamp = (st.st_size, st.st_mtime_ns)
+        if entry and (entry["size"], entry["mtime_ns"]) == stamp:
+            return entry["hash"]
+        digest = hash_file(path)
+        with self._lock:
+            self.entries[name] = {
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "hash": digest,
+            }
+            self._dirty = True
+            self._key = None
+        return digest
+
+    def fingerprint(self, name: str, path: FilePath) -> str:
+        """Get the fingerprinted name of the static file *name*, which is at
+        *path*."""
+        return fingerprinted_name(name, self.digest(name, path))
+
+    def get(self, name: str) -> str | None:
+        """Get the fingerprinted name *name* was last copied to, if any."""
+        with self._lock:
+            entry = self.entries.get(name)
+        return fingerprinted_name(name, entry["hash"]) if entry else None
+
+    def remove(self, name: str) -> None:
+        """Forget the static file *name*, such as after it was deleted."""
+        with self._lock:
+            if self.entries.pop(name, None) is not None:
+                self._dirty = True
+                self._key = None
+
+    def retain(self, names: t.Iterable[str]) -> None:
+        """Forget all the static files but *names*."""
+        names = set(names)
+        with self._lock:
+            for name in set(self.entries) - names:
+                del self.entries[name]
+                self._dirty = True
+                self._key = None
+
+    def key(self) -> str:
+        """Get a hash of the hashes of all the static files, which changes
+        whenever any of their fingerprinted names does."""
+        with self._lock:
+            if self._key is None:
+                hashes = {name: e["hash"] for name, e in self.entries.items()}
+                dumped = json.dumps(hashes, sort_keys=True)
+                self._key = hash_bytes(dumped.encode("utf8"))
+            return self._key
+
+    def save(self) -> None:
+        """Write the entries to :attr:`path`, if they changed since they were
+        loaded or last saved."""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"version": self.version, "assets": self.entries}
+            dumped = json.dumps(data, indent=1, sort_keys=True)
+            self._dirty = False
+        write_atomic(self.path, dumped.encode("utf8"))
@@ -3,33 +3,73 @@
 """staticjinja
 
 Usage:
-  staticjinja build [options]
+  staticjinja build [options] [<pattern>...]
   staticjinja watch [options]
+  staticjinja serve [options]
+  staticjinja merge [options] <shard>...
   staticjinja -h | --help
   staticjinja --version
 
 Commands:
-  build      Render the site
+  build      Render the site, or only the files matching the glob <pattern>s and
+             the templates that depend on them
   watch      Render the site, and re-render on changes to <srcpath>
+  serve      Serve the site over HTTP, rendering pages when they are requested
+  merge      Combine the outpaths of the shards of a build into <outpath>
 
 Options:
-  --srcpath=<srcpath>   Directory in which to build from [default: ./templates]
-  --outpath=<outpath>   Directory in which to build to [default: ./]
-  --static=<a,b,c>      Directory(s) within <srcpath> containing static files
-  --log=<level>         Log level {debug,info,warn,error,critical} [default: info]
-  -h --help             Show this screen.
-  --version             Show version.
+  --srcpath=<srcpath>     Directory in which to build from [default: ./templates]
+  --outpath=<outpath>     Directory in which to build to [default: ./]
+  --archive=<file>        Build into a .zip, .tar, .tar.gz, .tar.bz2 or .tar.xz
+                          archive instead of <outpath>
+  --static=<a,b,c>        Directory(s) within <srcpath> containing static files
+  --jobs=<n>              Number of processes to render templates with [default: 1]
+  --threads=<n>           Number of threads to render and copy files with [default: 1]
+  --shard=<i/n>           Only build the <i>th of <n> parts of the site, to merge
+                          with the others
+  --shard-costs=<a,b,c>   Balance the shards by the time each template took in
+                          these --profile-out files, instead of by hash
+  --regex                 Match the <pattern>s as regexes instead of globs
+  --changed-since=<rev>   Only build the files changed since a git revision, or
+                          since a file such as a build manifest was written, and
+                          the templates that depend on them
+  --incremental           Skip templates whose inputs are unchanged since the last
+                          incremental build
+  --cache-dir=<dir>       Directory to store the incremental build manifest in
+                          (defaults to <outpath>)
+  --write-if-changed      Only write output files whose content has changed
+  --bytecode-cache=<dir>  Directory to cache compiled templates in
+  --static-copy=<how>     How to put static files in <outpath>, one of
+                          {copy,hardlink,symlink,reflink} [default: copy]
+  --static-check=<by>     Skip static files whose copy is up to date, comparing
+                          their size and {mtime,hash}
+  --fingerprint-static    Copy static files to names with a hash of their content
+  --precompress           Write gzip (and brotli) compressed copies of text files
+                          next to them
+  --profile=<n>           Time each template, and print the <n> slowest
+  --profile-out=<file>    Write the time of each template to <file>, as CSV if it
+                          ends with .csv, otherwise as JSON
+  --host=<host>           Host for serve to listen on [default: localhost]
+  --port=<port>           Port for serve to listen on [default: 8000]
+  --livereload=<port>     With watch, tell browsers which pages changed, on <port>
+                          on <host> (35729 is the usual one)
+  --log=<level>           Log level {debug,info,warn,error,critical} [default: info]
+  -h --help               Show this screen.
+  --version               Show version.
 """
 
 from __future__ import annotations
 
 import logging
 import os
+import re
 import sys
+import typing as t
 
 from docopt import ParsedOptions, docopt
 
 import staticjinja
+from staticjinja.static import CHECKS, STRATEGIES
 
 
 def setup_logging(log_string: str) -> None:
@@ -39,6 +79,30 @@ def setup_logging(log_string: str) -> None:
     staticjinja.logger.setLevel(numeric_level)
 
 
+def parse_count(value: str, name: str) -> int:
+    """Parse a positive integer option, exiting if it is invalid."""
+    try:
+        count = int(value)
+    except ValueError:
+        count = 0
+    if count < 1:
+        print("The number of {} '{}' is invalid.".format(name, value))
+        sys.exit(1)
+    return count
+
+
+def parse_port(value: str, name: str) -> int:
+    """Parse a port number option, exiting if it is invalid."""
+    try:
+        port = int(value)
+    except ValueError:
+        port = -1
+    if not 0 <= port <= 65535:
+        print("The {} '{}' is invalid.".format(name, value))
+        sys.exit(1)
+    return port
+
+
 def render(args: ParsedOptions) -> None:
     """
     Render a site.
@@ -47,13 +111,37 @@ def render(args: ParsedOptions) -> None:
         A map from command-line options to their values. For example:
 
             {
+                '--archive': None,
+                '--bytecode-cache': None,
+                '--cache-dir': None,
+                '--changed-since': None,
+                '--fingerprint-static': False,
                 '--help': False,
+                '--host': 'localhost',
+                '--incremental': False,
+                '--jobs': '1',
+                '--livereload': None,
                 '--log': 'info',
                 '--outpath': './',
+                '--port': '8000',
+                '--precompress': False,
+                '--profile': None,
+                '--profile-out': None,
+                '--regex': False,
+                '--shard': None,
+                '--shard-costs': None,
                 '--srcpath': './templates',
                 '--static': None,
+                '--static-check': None,
+                '--static-copy': 'copy',
+                '--threads': '1',
                 '--version': False,
+                '--write-if-changed': False,
+                '<pattern>': [],
+                '<shard>': [],
                 'build': True,
+                'merge': False,
+                'serve': False,
                 'watch': False
             }
     """
@@ -64,6 +152,10 @@ def render(args: ParsedOptions) -> None:
             path = os.path.join(os.getcwd(), path)
         return os.path.normpath(path)
 
+    if args["merge"]:
+        merge(args, resolve)
+        return
+
     srcpath: str = resolve(args["--srcpath"])
     if not os.path.isdir(srcpath):
         print("The templates directory '{}' is invalid.".format(srcpath))
@@ -81,10 +173,170 @@ def render(args: ParsedOptions) -> None:
                 print("The static files directory '{}' is invalid.".format(path))
                 sys.exit(1)
 
-    site = staticjinja.Site.make_site(
-        searchpath=srcpath, outpath=outpath, staticpaths=staticpaths
-    )
-    site.render(use_reloader=args["watch"])
+    static_strategy = args["--static-copy"]
+    if static_strategy not in STRATEGIES:
+        print("The static copy strategy '{}' is invalid.".format(static_strategy))
+        sys.exit(1)
+    static_check = args["--static-check"]
+    if static_check is not None and static_check not in CHECKS:
+        print("The static check '{}' is invalid.".format(static_check))
+        sys.exit(1)
+
+    jobs = parse_count(args["--jobs"], "jobs")
+    threads = parse_count(args["--threads"], "threads")
+
+    shard = None
+    if args["--shard"] is not None:
+        if not args["build"]:
+            print("--shard can only be used with build.")
+            sys.exit(1)
+        costs = None
+        if args["--shard-costs"] is not None:
+            costs_profile = staticjinja.BuildProfile()
+            for path in args["--shard-costs"].split(","):
+                try:
+                    costs_profile.merge(staticjinja.BuildProfile.load(resolve(path)))
+                except (OSError, ValueError) as e:
+                    print(e)
+                    sys.exit(1)
+            costs = {n: costs_profile.total(n) for n in costs_profile.timings}
+        try:
+            shard = staticjinja.Shard.parse(args["--shard"], costs)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+
+    archive = args["--archive"]
+    if archive is not None and (args["watch"] or args["serve"] or jobs > 1):
+        print("--archive can't be used with watch, serve or --jobs.")
+        sys.exit(1)
+    if archive is not None and args["--incremental"]:
+        # Each archive starts empty, so skipped templates would be missing.
+        print("--archive can't be used with --incremental.")
+        sys.exit(1)
+
+    port = parse_port(args["--port"], "port")
+    livereload_port = args["--livereload"]
+    if livereload_port is not None:
+        if not args["watch"]:
+            print("--livereload can only be used with watch.")
+            sys.exit(1)
+        livereload_port = parse_port(livereload_port, "live reload port")
+
+    only = None
+    since = args["--changed-since"]
+    if since is not None and not args["build"]:
+        print("--changed-since can only be used with build.")
+        sys.exit(1)
+    if args["<pattern>"] or since is not None:
+        try:
+            changed = None
+            if since is not None:
+                changed = staticjinja.changed_since(srcpath, since)
+            only = staticjinja.Selection(args["<pattern>"], args["--regex"], changed)
+        except (ValueError, re.error) as e:
+            print(e)
+            sys.exit(1)
+
+    cache_dir = args["--cache-dir"]
+    if cache_dir is not None:
+        cache_dir = resolve(cache_dir)
+    bytecode_cache_dir = args["--bytecode-cache"]
+    if bytecode_cache_dir is not None:
+        bytecode_cache_dir = resolve(bytecode_cache_dir)
+    profile_top = args["--profile"]
+    if profile_top is not None:
+        profile_top = parse_count(profile_top, "slowest templates")
+    profile_report = args["--profile-out"]
+    profile = profile_top is not None or profile_report is not None
+    # Watch here, rather than in render(), to report on the first build before
+    # watching, or to give the Reloader a callback.
+    watch = args["watch"] and (profile or livereload_port is not None)
+
+    output = None
+    if archive is not None:
+        try:
+            output = staticjinja.ArchiveOutput(resolve(archive))
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+    try:
+        site = staticjinja.Site.make_site(
+            searchpath=srcpath,
+            outpath=outpath,
+            staticpaths=staticpaths,
+            cache_dir=cache_dir,
+            write_if_changed=args["--write-if-changed"],
+            bytecode_cache_dir=bytecode_cache_dir,
+            static_strategy=static_strategy,
+            static_check=static_check,
+            fingerprint_static=args["--fingerprint-static"],
+            output=output,
+            precompress=args["--precompress"],
+        )
+        if args["serve"]:
+            staticjinja.Server(site, args["--host"], port).serve()
+            return
+        site.render(
+            use_reloader=args["watch"] and not watch,
+            workers=jobs,
+            threads=threads,
+            incremental=args["--incremental"],
+            profile=profile,
+            shard=shard,
+            only=only,
+        )
+    finally:
+        # An archive is only complete once it is closed.
+        if output is not None:
+            output.close()
+    if profile:
+        assert site.profile is not None
+        if profile_top is not None:
+            print(site.profile.format(profile_top))
+        if profile_report is not None:
+            site.profile.write(resolve(profile_report))
+    if watch:
+        callbacks = []
+        if livereload_port is not None:
+            livereload = staticjinja.LiveReload()
+            livereload.serve_in_thread(args["--host"], livereload_port)
+            callbacks.append(livereload.publish)
+        staticjinja.Reloader(site, callbacks=callbacks).watch()
+
+
+def merge(args: ParsedOptions, resolve: t.Callable[[str], str]) -> None:
+    """Merge the outpaths of the shards of a build, as given by the
+    ``<shard>`` arguments of *args*, into its ``--outpath`` or ``--archive``.
+
+    :param resolve: makes the paths in *args* absolute.
+    """
+    sources = [resolve(path) for path in args["<shard>"]]
+    for path in sources:
+        if not os.path.isdir(path):
+            print("The shard outpath '{}' is invalid.".format(path))
+            sys.exit(1)
+    strategy = args["--static-copy"]
+    if strategy not in STRATEGIES:
+        print("The static copy strategy '{}' is invalid.".format(strategy))
+        sys.exit(1)
+
+    records_dir = args["--cache-dir"]
+    if records_dir is not None:
+        records_dir = resolve(records_dir)
+    output: staticjinja.Output
+    if args["--archive"] is not None:
+        try:
+            output = staticjinja.ArchiveOutput(resolve(args["--archive"]))
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+    else:
+        outpath = resolve(args["--outpath"])
+        output = staticjinja.FileSystemOutput(outpath)
+        records_dir = records_dir or outpath
+    with output:
+        staticjinja.merge_shards(sources, output, records_dir, strategy)
 
 
 def main(argv: list[str] | None = None) -> None:
@@ -0,0 +1,248 @@
+"""
+Compute the contexts of a Site's templates, evaluating each context callable
+as few times as possible, and each :class:`Lazy` value only if a template uses
+it. See :ref:`cached-contexts` and :ref:`lazy-contexts`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+import threading
+import typing as t
+from collections import OrderedDict
+
+from jinja2 import Template
+from jinja2.runtime import Context as JinjaContext
+
+if t.TYPE_CHECKING:
+    from .types import Context, ContextLike
+
+_KeyFunc = t.Callable[[Template], t.Hashable]
+_T = t.TypeVar("_T")
+_MISSING = object()
+
+
+class Lazy(t.Generic[_T]):
+    """A context value that is only computed when a template first reads it.
+
+    :param func: a callable that takes no arguments and returns the value.
+    """
+
+    def __init__(self, func: t.Callable[[], _T]) -> None:
+        self.func = func
+        self._value: t.Any = _MISSING
+        self._lock = threading.Lock()
+
+    def get(self) -> _T:
+        """Get the value, computing it the first time this is called."""
+        if self._value is _MISSING:
+            with self._lock:
+                if self._value is _MISSING:
+                    self._value = self.func()
+        return t.cast(_T, self._value)
+
+    @property
+    def computed(self) -> bool:
+        """Whether the value has been computed yet."""
+        return self._value is not _MISSING
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.func!r})"
+
+
+async def maybe_await(value: t.Any) -> t.Any:
+    """Await *value* if it is awaitable, so that callables may be sync or
+    async."""
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+def resolve_lazy(value: t.Any) -> t.Any:
+    """Get the value of *value* if it is :class:`Lazy`, or *value* itself."""
+    return value.get() if isinstance(value, Lazy) else value
+
+
+class LazyContext(JinjaContext):
+    """A :class:`jinja2.runtime.Context` that computes :class:`Lazy` values
+    when templates read them."""
+
+    def resolve_or_missing(self, key: str) -> t.Any:
+        return resolve_lazy(super().resolve_or_missing(key))
+
+
+class CachedContext:
+    """A context callable whose results are cached by a key computed from
+    each template. Made with :func:`cached_context`.
+
+    :param func: the context callable, which takes the current template.
+    :param key: a callable that takes the current template and returns the
+        (hashable) key to cache *func*'s result under.
+    :param maxsize: the number of results to keep. When there are more, the
+        least recently used one is dropped. If ``None``, results are never
+        dropped.
+    """
+
+    def __init__(
+        self,
+        func: t.Callable[[Template], Context],
+        key: _KeyFunc,
+        maxsize: int | None = 128,
+    ) -> None:
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.key = key
+        self.maxsize = maxsize
+        self._cache: OrderedDict[t.Hashable, Context] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, template: Template) -> Context:
+        key = self.key(template)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        context = self.func(template)
+        with self._lock:
+            self._cache[key] = context
+            if self.maxsize is not None and len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return context
+
+    def cache_clear(self) -> None:
+        """Drop all the cached results."""
+        with self._lock:
+            self._cache.clear()
+
+    def __reduce__(self) -> str:
+        # Pickle by reference to the decorated function's name, like
+        # functions are, so that worker processes get their own cache.
+        return self.__qualname__  # type: ignore[attr-defined]
+
+
+def cached_context(
+    key: _KeyFunc, maxsize: int | None = 128
+) -> t.Callable[[t.Callable[[Template], Context]], CachedContext]:
+    """Decorate a (sync) context callable that takes the current template, so
+    that templates with the same *key* share a single call to it.
+
+    For example, to load the data for each section of a site just once::
+
+        def section(template):
+            return template.name.split("/")[0]
+
+        @staticjinja.cached_context(key=section)
+        def section_context(template):
+            ...
+
+    The cache is emptied at the start of each build. Contexts that don't take
+    a template are always computed just once per build, and don't need this.
+
+    :param key: a callable that takes the current template and returns the
+        (hashable) key to cache the context under.
+    :param maxsize: the number of contexts to keep. When there are more, the
+        least recently used one is dropped. If ``None``, contexts are never
+        dropped.
+    """
+
+    def decorator(func: t.Callable[[Template], Context]) -> CachedContext:
+        return CachedContext(func, key, maxsize)
+
+    return decorator
+
+
+class ContextCache:
+    """Computes contexts for a Site, caching what can be reused.
+
+    The number of arguments each context callable takes is only looked up
+    once. Callables that take no arguments don't depend on the template, so
+    they are only called once until :meth:`clear` is called, unless they
+    raise, in which case they are called again the next time.
+    """
+
+    def __init__(self) -> None:
+        # Keyed by id(), and holding on to the callable so the id isn't reused.
+        self._arities: dict[int, tuple[t.Callable[..., t.Any], int]] = {}
+        self._results: dict[int, tuple[t.Callable[..., t.Any], Context]] = {}
+        self._locks: dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+        # The same, for async callables awaited by acompute().
+        self._tasks: dict[int, tuple[t.Callable[..., t.Any], asyncio.Future[t.Any]]]
+        self._tasks = {}
+
+    def clear(self, contexts: t.Iterable[ContextLike] = ()) -> None:
+        """Forget the contexts computed so far, and empty the caches of any
+        :class:`CachedContext` in *contexts*."""
+        with self._lock:
+            self._results.clear()
+            self._locks.clear()
+            self._tasks.clear()
+        for context_like in contexts:
+            if isinstance(context_like, CachedContext):
+                context_like.cache_clear()
+
+    def _arity(self, func: t.Callable[..., t.Any]) -> int:
+        entry = self._arities.get(id(func))
+        if entry is None or entry[0] is not func:
+            entry = func, len(inspect.signature(func).parameters)
+            self._arities[id(func)] = entry
+        return entry[1]
+
+    def compute(self, context_like: ContextLike, template: Template) -> Context:
+        """Get the context given by *context_like* for *template*."""
+        if isinstance(context_like, dict):
+            return context_like
+
+        if callable(context_like):
+            if self._arity(context_like) > 0:
+                return _check_sync(context_like(template))  # type: ignore[call-arg]
+            key = id(context_like)
+            with self._lock:
+                lock = self._locks.setdefault(key, threading.Lock())
+            # Only one thread computes each context, the others wait for it.
+            with lock:
+                entry = self._results.get(key)
+                if entry is None or entry[0] is not context_like:
+                    context = _check_sync(context_like())  # type: ignore[call-arg]
+                    entry = context_like, context
+                    self._results[key] = entry
+            return entry[1]
+
+        raise TypeError(f"Unexpected type for context: {type(context_like)}")
+
+    async def acompute(self, context_like: ContextLike, template: Template) -> Context:
+        """Like :meth:`compute`, but also awaits async context callables."""
+        if not callable(context_like):
+            return self.compute(context_like, template)
+        if self._arity(context_like) > 0:
+            context = context_like(template)  # type: ignore[call-arg]
+            return t.cast("Context", await maybe_await(context))
+        key = id(context_like)
+        entry = self._results.get(key)
+        if entry is not None and entry[0] is context_like:
+            return entry[1]
+        # Coroutines awaiting the same context share one task computing it.
+        task = self._tasks.get(key)
+        if task is None or task[0] is not context_like:
+            coro = maybe_await(context_like())  # type: ignore[call-arg]
+            task = self._tasks[key] = context_like, asyncio.ensure_future(coro)
+        try:
+            context = await task[1]
+        except BaseException:
+            # Like with compute(), failures aren't cached, so the next call
+            # tries again. Only the coroutines already waiting share them.
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+            raise
+        self._results[key] = context_like, context
+        return t.cast("Context", context)
+
+
+def _check_sync(context: t.Any) -> Context:
+    if inspect.isawaitable(context):
+        if inspect.iscoroutine(context):
+            context.close()
+        raise TypeError("Async contexts can only be used with Site.arender()")
+    return t.cast("Context", context)
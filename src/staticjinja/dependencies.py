@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import logging
+import threading
+import typing as t
+
+from jinja2 import Environment, TemplateError, meta, nodes
+
+logger = logging.getLogger(__name__)
+
+
+class DependencyGraph:
+    """
+    Records which templates each template references through ``extends``,
+    ``include``, ``import`` and ``from ... import`` tags, so that when a file
+    changes, only the templates that depend on it need to be re-rendered.
+
+    References are found by walking each template's AST with
+    :func:`jinja2.meta.find_referenced_templates`. A template whose references
+    can't all be resolved (such as ``{% include some_variable %}``), or that
+    can't be parsed at all, is considered *dynamic* and is assumed to depend on
+    every other file.
+
+    :param environment:
+        The :class:`jinja2.Environment` used to load and parse templates.
+
+    :param names:
+        The names of all the templates (including partials) to track. They are
+        only parsed when needed: :meth:`dependencies` just parses the
+        templates it reaches, other queries parse everything.
+    """
+
+    def __init__(self, environment: Environment, names: t.Iterable[str]) -> None:
+        self.env = environment
+        # Templates that haven't been parsed yet.
+        self._unparsed = set(names)
+        # template name -> names it references directly
+        self._references: dict[str, set[str]] = {}
+        # template name -> names that reference it directly
+        self._referrers: dict[str, set[str]] = {}
+        self._dynamic: set[str] = set()
+        # template name -> variables it reads from its context
+        self._variables: dict[str, set[str]] = {}
+        # template name -> globals of the environment it reads
+        self._globals: dict[str, set[str]] = {}
+        # Queries may parse templates, and so change the graph, so they must
+        # hold this too when rendering in threads.
+        self._lock = threading.RLock()
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._unparsed or name in self._references
+
+    @property
+    def names(self) -> frozenset[str]:
+        """The names of all the tracked templates."""
+        with self._lock:
+            return frozenset(self._unparsed.union(self._references))
+
+    def _parse(self, name: str) -> None:
+        if name in self._unparsed:
+            self.update(name)
+
+    def _parse_all(self) -> None:
+        for name in list(self._unparsed):
+            self.update(name)
+
+    def _parse_template(
+        self, name: str
+    ) -> tuple[set[str] | None, set[str] | None, set[str] | None]:
+        """Get the names *name* references, the variables it reads from its
+        context and the globals it reads, any of which is ``None`` if it can't
+        be known."""
+        assert self.env.loader is not None
+        try:
+            source, filename, _ = self.env.loader.get_source(self.env, name)
+            ast = self.env.parse(source, name, filename)
+        except (TemplateError, UnicodeDecodeError) as e:
+            logger.debug("Can't find the references of %s: %s", name, e)
+            return None, None, None
+        variables = meta.find_undeclared_variables(ast)
+        # Names that a local variable shadows are included too.
+        used_globals = {
+            node.name
+            for node in ast.find_all(nodes.Name)
+            if node.ctx == "load" and node.name in self.env.globals
+        }
+        references = set()
+        for ref in meta.find_referenced_templates(ast):
+            if ref is None:
+                return None, variables, used_globals
+            references.add(self.env.join_path(ref, name))
+        return references, variables, used_globals
+
+    def update(self, name: str) -> None:
+        """(Re-)read the references of the template *name*, and start
+        tracking it if it is new."""
+        references, variables, used_globals = self._parse_template(name)
+        with self._lock:
+            self.remove(name)
+            if references is None:
+                self._dynamic.add(name)
+                references = set()
+            self._references[name] = references
+            for ref in references:
+                self._referrers.setdefault(ref, set()).add(name)
+            if variables is not None:
+                self._variables[name] = variables
+            if used_globals is not None:
+                self._globals[name] = used_globals
+
+    def remove(self, name: str) -> None:
+        """Forget the references of the template *name*.
+
+        Templates that reference *name* keep doing so, since they will be
+        affected if it is created again.
+        """
+        with self._lock:
+            self._unparsed.discard(name)
+            for ref in self._references.pop(name, ()):
+                referrers = self._referrers[ref]
+                referrers.discard(name)
+                if not referrers:
+                    del self._referrers[ref]
+            self._dynamic.discard(name)
+            self._variables.pop(name, None)
+            self._globals.pop(name, None)
+
+    @property
+    def missing(self) -> frozenset[str]:
+        """The names that tracked templates reference, but that aren't tracked
+        themselves, such as files that were deleted."""
+        with self._lock:
+            self._parse_all()
+            return frozenset(self._referrers).difference(self._references)
+
+    @property
+    def dynamic(self) -> frozenset[str]:
+        """The templates whose references couldn't be resolved."""
+        with self._lock:
+            self._parse_all()
+            return frozenset(self._dynamic)
+
+    def _closure(self, start: t.Iterable[str], edges: dict[str, set[str]]) -> set[str]:
+        seen: set[str] = set()
+        stack = list(start)
+        while stack:
+            name = stack.pop()
+            self._parse(name)
+            for neighbor in edges.get(name, ()):
+                if neighbor not in seen:
+                    seen.add(neighbor)
+                    stack.append(neighbor)
+        return seen
+
+    def dependencies(self, name: str) -> set[str] | None:
+        """Get the names of all the templates that *name* transitively
+        references, or ``None`` if any of them are dynamic, in which case they
+        could depend on anything.
+        """
+        with self._lock:
+            deps = self._closure([name], self._references)
+            # _closure() has parsed name and everything it references.
+            if name in self._dynamic or not deps.isdisjoint(self._dynamic):
+                return None
+            return deps
+
+    def variables(self, name: str) -> set[str] | None:
+        """Get the names of the context variables that *name*, or any of the
+        templates it transitively references, may read, as found by
+        :func:`jinja2.meta.find_undeclared_variables`.
+
+        Returns ``None`` if they can't all be known, such as when *name* has
+        dynamic references or one of the templates can't be parsed.
+        """
+        return self._read(name, self._variables)
+
+    def globals(self, name: str) -> set[str] | None:
+        """Get the names of the globals of the environment, such as
+        ``asset_url``, that *name*, or any of the templates it transitively
+        references, may read.
+
+        Returns ``None`` if they can't all be known, as for :meth:`variables`.
+        """
+        return self._read(name, self._globals)
+
+    def _read(self, name: str, table: dict[str, set[str]]) -> set[str] | None:
+        with self._lock:
+            deps = self.dependencies(name)
+            if deps is None:
+                return None
+            found: set[str] = set()
+            for dep in [name, *deps]:
+                if dep not in table:
+                    return None
+                found.update(table[dep])
+            return found
+
+    def dependents(self, name: str) -> set[str]:
+        """Get the names of all the templates that transitively reference
+        *name*, and so may change if *name* changes.
+
+        Dynamic templates, and anything that depends on them, are always
+        included since they may reference *name*.
+        """
+        with self._lock:
+            self._parse_all()
+            dependents = self._closure([name, *self._dynamic], self._referrers)
+            dependents.update(self._dynamic)
+            dependents.discard(name)
+            return dependents
@@ -0,0 +1,183 @@
+"""
+Push the output files each rebuild changed to browsers, so they can reload.
+
+A :class:`LiveReload` is given to a :class:`Reloader <staticjinja.Reloader>`
+as one of its callbacks, and publishes the names of the files each batch of
+changes rebuilt as server-sent events, which the script it serves listens to.
+"""
+
+from __future__ import annotations
+
+import http.server
+import json
+import logging
+import queue
+import threading
+import typing as t
+
+logger = logging.getLogger(__name__)
+
+#: The path of the server-sent events endpoint.
+EVENTS_PATH = "/_staticjinja/events"
+
+#: The path of the script that reloads pages when they change.
+SCRIPT_PATH = "/_staticjinja/livereload.js"
+
+#: The port the live reload server listens on by default.
+DEFAULT_PORT = 35729
+
+# How many seconds to wait between comments that keep idle streams open.
+_HEARTBEAT = 15.0
+
+# Reloads the page if it, or any file that isn't a page, such as a stylesheet
+# it uses, changed. It connects to the server it was loaded from.
+_SCRIPT = """\
+(function () {
+  var events = new EventSource(new URL("%s", document.currentScript.src));
+  events.addEventListener("change", function (event) {
+    var changed = JSON.parse(event.data);
+    var page = decodeURI(location.pathname).replace(/^\\//, "");
+    if (page === "" || page.endsWith("/")) page += "index.html";
+    if (changed.some(function (name) {
+      return name === page || !/\\.html?$/.test(name);
+    })) {
+      location.reload();
+    }
+  });
+})();
+"""
+SCRIPT = _SCRIPT % EVENTS_PATH
+
+# Tells streams to end.
+_CLOSE = object()
+
+
+class LiveReload:
+    """
+    Publishes the names of changed output files to browsers, as server-sent
+    events. See :ref:`live-reload`.
+
+    Pass its :meth:`publish` to a :class:`Reloader <staticjinja.Reloader>`
+    as a callback. Browsers connect to :data:`EVENTS_PATH`, and get a
+    ``change`` event whose data is a JSON list of the names for each batch of
+    changes. The script at :data:`SCRIPT_PATH` does that, and reloads the page
+    it is on when needed.
+
+    Either serve it on its own with :meth:`http_server`, or have another
+    server's request handler call :meth:`handle` for those paths, as
+    :class:`Server <staticjinja.Server>` does.
+    """
+
+    def __init__(self) -> None:
+        self._clients: set[queue.Queue[object]] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def clients(self) -> int:
+        """The number of browsers connected."""
+        with self._lock:
+            return len(self._clients)
+
+    def publish(self, names: t.Collection[str]) -> None:
+        """Tell the connected browsers that the output files *names*
+        changed."""
+        data = json.dumps(sorted(names))
+        with self._lock:
+            for client in self._clients:
+                client.put(data)
+
+    def close(self) -> None:
+        """End the streams of the connected browsers."""
+        with self._lock:
+            for client in self._clients:
+                client.put(_CLOSE)
+
+    def handle(self, handler: http.server.BaseHTTPRequestHandler) -> bool:
+        """Answer a request for :data:`EVENTS_PATH` or :data:`SCRIPT_PATH`.
+
+        :param handler: the handler of the request.
+        :return: whether the request was for one of those paths.
+        """
+        path = handler.path.split("?", 1)[0]
+        if path == SCRIPT_PATH:
+            data = SCRIPT.encode("utf8")
+            handler.send_response(200)
+            handler.send_header("Content-Type", "text/javascript; charset=utf8")
+            handler.send_header("Content-Length", str(len(data)))
+            handler.send_header("Cache-Control", "no-cache")
+            handler.end_headers()
+            if handler.command != "HEAD":
+                handler.wfile.write(data)
+            return True
+        if path == EVENTS_PATH:
+            self._stream(handler)
+            return True
+        return False
+
+    def _stream(self, handler: http.server.BaseHTTPRequestHandler) -> None:
+        client: queue.Queue[object] = queue.Queue()
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        # Pages may be opened from the outpath, or served elsewhere.
+        handler.send_header("Access-Control-Allow-Origin", "*")
+        handler.end_headers()
+        with self._lock:
+            self._clients.add(client)
+        try:
+            handler.wfile.write(b"retry: 1000\n\n")
+            handler.wfile.flush()
+            while True:
+                try:
+                    data = client.get(timeout=_HEARTBEAT)
+                except queue.Empty:
+                    message = ": ping\n\n"
+                else:
+                    if data is _CLOSE:
+                        return
+                    message = f"event: change\ndata: {data}\n\n"
+                handler.wfile.write(message.encode("utf8"))
+                handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The browser went away.
+        finally:
+            with self._lock:
+                self._clients.discard(client)
+
+    def http_server(
+        self, host: str = "localhost", port: int = DEFAULT_PORT
+    ) -> http.server.ThreadingHTTPServer:
+        """Make an HTTP server that only serves :data:`EVENTS_PATH` and
+        :data:`SCRIPT_PATH`, such as to use with ``staticjinja watch``."""
+        livereload = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if not livereload.handle(self):
+                    self.send_error(404)
+
+            do_HEAD = do_GET
+
+            def log_message(self, format: str, *args: t.Any) -> None:
+                logger.debug("%s %s", self.address_string(), format % args)
+
+        httpd = http.server.ThreadingHTTPServer((host, port), Handler)
+        httpd.daemon_threads = True
+        return httpd
+
+    def serve_in_thread(
+        self, host: str = "localhost", port: int = DEFAULT_PORT
+    ) -> http.server.ThreadingHTTPServer:
+        """Start serving :meth:`http_server` in a daemon thread.
+
+        :return: the server, to ``shutdown()`` when done.
+        """
+        httpd = self.http_server(host, port)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        logger.info(
+            "Live reload on http://%s:%d%s",
+            host,
+            httpd.server_address[1],
+            SCRIPT_PATH,
+        )
+        return httpd
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import stat
+import threading
+import typing as t
+from pathlib import Path
+
+if t.TYPE_CHECKING:
+    from .types import Context, FilePath
+
+logger = logging.getLogger(__name__)
+
+#: The name of the manifest file, inside the outpath or the cache directory.
+MANIFEST_NAME = ".staticjinja-manifest.json"
+
+Entry = t.Dict[str, str]
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: FilePath) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def fingerprint_context(context: Context) -> str:
+    """Hash a context, so that we can tell if it changed between builds.
+
+    Values that can't be serialized to JSON are hashed by their ``repr()``.
+    If that isn't stable between runs (for example, objects that show their
+    ``id()``), the template is just re-rendered every time.
+    """
+    dumped = json.dumps(context, sort_keys=True, default=repr)
+    return hash_bytes(dumped.encode("utf8"))
+
+
+def write_atomic(path: FilePath, data: bytes) -> None:
+    """Write *data* to *path* so that readers only ever see the old or new
+    content, never a partial write.
+
+    The file keeps its mode if it already exists. Otherwise it gets the
+    same mode as any new file, following the umask.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        mode: int | None = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = None
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+    # The kernel applies the umask to the mode of new files.
+    fd = os.open(tmp, flags, 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        if mode is not None:
+            os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def write_if_changed(path: FilePath, data: bytes) -> bool:
+    """Atomically write *data* to *path*, unless *path* already contains it.
+
+    The existing file's size is compared first, and only if that matches are
+    the hashes of the contents compared.
+
+    :return: whether the file was written.
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = None
+    if size == len(data) and hash_file(path) == hash_bytes(data):
+        return False
+    write_atomic(path, data)
+    return True
+
+
+class BuildManifest:
+    """
+    A record of the inputs each template was last rendered from, used to skip
+    templates whose inputs haven't changed. See :ref:`incremental-builds`.
+
+    For each template this stores the hash of its source, and a *key* that is
+    the hash of its source, the sources of all the templates it transitively
+    references, and its context.
+
+    :param path:
+        The path of the JSON file the manifest is stored in.
+
+    :param previous:
+        The entries recorded by the previous build, as loaded by :meth:`load`.
+    """
+
+    version = 1
+
+    def __init__(
+        self, path: FilePath, previous: dict[str, Entry] | None = None
+    ) -> None:
+        self.path = Path(path)
+        self.previous = previous or {}
+        #: The entries recorded during this build.
+        self.entries: dict[str, Entry] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: FilePath) -> BuildManifest:
+        """Load the manifest stored at *path*.
+
+        If there is no manifest there, or it can't be read, an empty one is
+        returned, so every template is rendered.
+        """
+        try:
+            data = json.loads(Path(path).read_text(encoding="utf8"))
+        except FileNotFoundError:
+            return cls(path)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable build manifest %s: %s", path, e)
+            return cls(path)
+        if not isinstance(data, dict) or data.get("version") != cls.version:
+            logger.warning("Ignoring build manifest %s from another version", path)
+            return cls(path)
+        return cls(path, data.get("templates", {}))
+
+    def is_fresh(self, name: str, key: str) -> bool:
+        """Was *name* rendered by the previous build with the same *key*?"""
+        return self.previous.get(name, {}).get("key") == key
+
+    def record(self, name: str, source: str, key: str) -> None:
+        """Record that *name* was rendered (or skipped) with *key*."""
+        with self._lock:
+            self.entries[name] = {"source": source, "key": key}
+
+    def update(self, entries: dict[str, Entry]) -> None:
+        """Add entries recorded elsewhere, such as in a worker process."""
+        with self._lock:
+            self.entries.update(entries)
+
+    def save(self) -> None:
+        """Write the entries recorded during this build to :attr:`path`.
+
+        Templates that weren't rendered or skipped during this build, such as
+        ones that failed to render or were deleted, are dropped.
+        """
+        with self._lock:
+            data = {"version": self.version, "templates": self.entries}
+            dumped = json.dumps(data, indent=1, sort_keys=True)
+        write_atomic(self.path, dumped.encode("utf8"))
@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import abc
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import typing as t
+import zipfile
+from pathlib import Path
+
+from .manifest import write_if_changed
+from .static import copy_file
+
+if t.TYPE_CHECKING:
+    from types import TracebackType
+
+    from typing_extensions import Self
+
+    from .types import FilePath
+
+# Rendered files bigger than this are spooled to a temporary file before
+# being added to an archive.
+_SPOOL_SIZE = 1 << 20
+
+# The tarfile modes for the extensions of compressed tar archives.
+_TAR_MODES = {
+    ".tar": "w",
+    ".tar.gz": "w:gz",
+    ".tgz": "w:gz",
+    ".tar.bz2": "w:bz2",
+    ".tar.xz": "w:xz",
+}
+
+
+class Output(abc.ABC):
+    """
+    Where a :class:`Site <staticjinja.Site>` writes the files it builds. See
+    :ref:`outputs`.
+
+    Files are named by their paths relative to the root of the output, with
+    ``/`` separators. Methods may be called from several threads at once.
+    Subclasses must implement :meth:`write`, :meth:`exists` and
+    :meth:`remove`, and may override the other methods to do better than the
+    defaults.
+
+    Outputs are context managers, which :meth:`close` the output on exit.
+    """
+
+    @abc.abstractmethod
+    def write(self, name: str, chunks: t.Iterable[bytes]) -> None:
+        """Write the file *name*, with the content *chunks*."""
+
+    def write_if_changed(self, name: str, data: bytes) -> bool:
+        """Write the file *name* with the content *data*, unless it already
+        has that content.
+
+        :return: whether the file was written. By default it always is.
+        """
+        self.write(name, [data])
+        return True
+
+    def copy(
+        self,
+        name: str,
+        src: FilePath,
+        strategy: str = "copy",
+        check: str | None = None,
+    ) -> bool:
+        """Copy the file at *src* to the file *name*. *strategy* and *check*
+        are the Site's ``static_strategy`` and ``static_check``, which only
+        apply to outputs on the filesystem.
+
+        :return: whether the file was copied. By default it always is.
+        """
+        with open(src, "rb") as f:
+            self.write(name, iter(lambda: f.read(1 << 16), b""))
+        return True
+
+    @abc.abstractmethod
+    def exists(self, name: str) -> bool:
+        """Check whether the file *name* exists."""
+
+    @abc.abstractmethod
+    def remove(self, name: str) -> None:
+        """Remove the file *name*, if it exists."""
+
+    def close(self) -> None:
+        """Finish writing the output. By default it does nothing."""
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+
+class FileSystemOutput(Output):
+    """Writes files to the directory *path*, which is the default output of a
+    Site, at its ``outpath``."""
+
+    def __init__(self, path: FilePath) -> None:
+        self.path = Path(path)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({str(self.path)!r})"
+
+    def write(self, name: str, chunks: t.Iterable[bytes]) -> None:
+        path = self.path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            f.writelines(chunks)
+
+    def write_if_changed(self, name: str, data: bytes) -> bool:
+        return write_if_changed(self.path / name, data)
+
+    def copy(
+        self,
+        name: str,
+        src: FilePath,
+        strategy: str = "copy",
+        check: str | None = None,
+    ) -> bool:
+        path = self.path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return copy_file(src, path, strategy, check)
+
+    def exists(self, name: str) -> bool:
+        return (self.path / name).exists()
+
+    def remove(self, name: str) -> None:
+        try:
+            (self.path / name).unlink()
+        except FileNotFoundError:
+            pass
+
+
+class MemoryOutput(Output):
+    """Keeps files in memory, in :attr:`files`. Useful for tests and preview
+    servers."""
+
+    def __init__(self) -> None:
+        #: Maps the name of each file to its content.
+        self.files: dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def write(self, name: str, chunks: t.Iterable[bytes]) -> None:
+        data = b"".join(chunks)
+        with self._lock:
+            self.files[name] = data
+
+    def write_if_changed(self, name: str, data: bytes) -> bool:
+        with self._lock:
+            if self.files.get(name) == data:
+                return False
+            self.files[name] = data
+            return True
+
+    def exists(self, name: str) -> bool:
+        with self._lock:
+            return name in self.files
+
+    def remove(self, name: str) -> None:
+        with self._lock:
+            self.files.pop(name, None)
+
+
+class ArchiveOutput(Output):
+    """Writes files into a zip or tar archive at *path*, whose type is given
+    by its extension: ``.zip``, ``.tar``, ``.tar.gz`` (or ``.tgz``),
+    ``.tar.bz2`` or ``.tar.xz``. The archive is complete once it is closed.
+
+    Rendered files are spooled to a temporary file if they are big, so
+    memory use doesn't grow with the size of the files or of the site.
+    Files can't be removed from an archive.
+    """
+
+    def __init__(self, path: FilePath) -> None:
+        self.path = Path(path)
+        name = self.path.name.lower()
+        self._tar: tarfile.TarFile | None = None
+        self._zip: zipfile.ZipFile | None = None
+        if name.endswith(".zip"):
+            self._zip = zipfile.ZipFile(self.path, "w", zipfile.ZIP_DEFLATED)
+        else:
+            for suffix, mode in _TAR_MODES.items():
+                if name.endswith(suffix):
+                    # The mode isn't a literal, so no overload of open() fits.
+                    open_tar: t.Callable[..., tarfile.TarFile] = tarfile.open
+                    self._tar = open_tar(self.path, mode)
+                    break
+            else:
+                raise ValueError(
+                    f"Unknown archive type {self.path.name}, expected a name "
+                    f"ending with .zip or {', '.join(_TAR_MODES)}"
+                )
+        self._names: set[str] = set()
+        self._lock = threading.Lock()
+
+    def write(self, name: str, chunks: t.Iterable[bytes]) -> None:
+        with tempfile.SpooledTemporaryFile(max_size=_SPOOL_SIZE) as f:
+            for chunk in chunks:
+                f.write(chunk)
+            size = f.tell()
+            f.seek(0)
+            self._add(name, f, size)
+
+    def copy(
+        self,
+        name: str,
+        src: FilePath,
+        strategy: str = "copy",
+        check: str | None = None,
+    ) -> bool:
+        with open(src, "rb") as f:
+            self._add(name, f, os.fstat(f.fileno()).st_size)
+        return True
+
+    def _add(self, name: str, f: t.IO[bytes], size: int) -> None:
+        with self._lock:
+            if self._zip is not None:
+                info = zipfile.ZipInfo(name, time.localtime()[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = 0o644 << 16
+                with self._zip.open(info, "w", force_zip64=True) as member:
+                    shutil.copyfileobj(f, member)
+            else:
+                assert self._tar is not None
+                tarinfo = tarfile.TarInfo(name)
+                tarinfo.size = size
+                tarinfo.mtime = int(time.time())
+                tarinfo.mode = 0o644
+                self._tar.addfile(tarinfo, f)
+            self._names.add(name)
+
+    def exists(self, name: str) -> bool:
+        with self._lock:
+            return name in self._names
+
+    def remove(self, name: str) -> None:
+        # Files can't be removed from an archive.
+        pass
+
+    def close(self) -> None:
+        with self._lock:
+            if self._zip is not None:
+                self._zip.close()
+            if self._tar is not None:
+                self._tar.close()
+
+
+class RecordingOutput(Output):
+    """Passes everything on to another *output*, and records the names of the
+    files that were written, copied or removed. Files that were already up to
+    date aren't recorded."""
+
+    def __init__(self, output: Output) -> None:
+        self.output = output
+        self._changed: set[str] = set()
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.output!r})"
+
+    def take(self) -> set[str]:
+        """Get the names of the files changed since this was last called."""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+        return changed
+
+    def _record(self, name: str) -> None:
+        with self._lock:
+            self._changed.add(name)
+
+    def write(self, name: str, chunks: t.Iterable[bytes]) -> None:
+        self.output.write(name, chunks)
+        self._record(name)
+
+    def write_if_changed(self, name: str, data: bytes) -> bool:
+        written = self.output.write_if_changed(name, data)
+        if written:
+            self._record(name)
+        return written
+
+    def copy(
+        self,
+        name: str,
+        src: FilePath,
+        strategy: str = "copy",
+        check: str | None = None,
+    ) -> bool:
+        copied = self.output.copy(name, src, strategy, check)
+        if copied:
+            self._record(name)
+        return copied
+
+    def exists(self, name: str) -> bool:
+        return self.output.exists(name)
+
+    def remove(self, name: str) -> None:
+        if self.output.exists(name):
+            self.output.remove(name)
+            self._record(name)
+
+    def close(self) -> None:
+        self.output.close()
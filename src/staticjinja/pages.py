@@ -0,0 +1,156 @@
+"""
+Generate many pages from one template, such as a page for each row of a CSV
+file, or the pages of a paginated archive. See :ref:`generated-pages`.
+"""
+
+from __future__ import annotations
+
+import csv
+import itertools
+import typing as t
+
+if t.TYPE_CHECKING:
+    from jinja2 import Template
+
+    from .staticjinja import Site
+    from .types import Context, FilePath
+
+
+class Page:
+    """One of the pages a :class:`Pages` rule generates, which its template
+    gets as ``page``.
+
+    .. attribute:: number
+
+        The number of the page, from ``1``.
+
+    .. attribute:: items
+
+        The list of the items on the page.
+
+    .. attribute:: name
+
+        The name of the file the page is written to, relative to the output,
+        such as ``"products/42.html"``.
+
+    .. attribute:: previous
+
+        The name of the previous page, or ``None`` on the first page.
+
+    .. attribute:: next
+
+        The name of the next page, or ``None`` on the last page.
+    """
+
+    def __init__(self, number: int, items: list[t.Any], name: str = "") -> None:
+        self.number = number
+        self.items = items
+        self.name = name
+        self.previous: str | None = None
+        self.next: str | None = None
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.number}, {self.name!r})"
+
+
+class CSVRows:
+    """The rows of a CSV file, as dictionaries keyed by the names in its first
+    row. The file is read a row at a time each time this is iterated, so it
+    never has to fit in memory.
+
+    :param path: the path of the CSV file.
+    :param encoding: the encoding of the file. Defaults to ``"utf8"``.
+    :param fmtparams: the dialect and formatting parameters of
+        :class:`csv.DictReader`, such as ``delimiter=";"``.
+    """
+
+    def __init__(self, path: FilePath, encoding: str = "utf8", **fmtparams: t.Any):
+        self.path = path
+        self.encoding = encoding
+        self.fmtparams = fmtparams
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.path!r})"
+
+    def __iter__(self) -> t.Iterator[dict[str, str]]:
+        with open(self.path, newline="", encoding=self.encoding) as f:
+            yield from csv.DictReader(f, **self.fmtparams)
+
+
+class Pages:
+    """
+    A rule that renders its template once for each item of *items*, or for
+    each *per_page* of them, to the names given by *name*. See
+    :ref:`generated-pages`.
+
+    Each page is rendered with the template's context, plus ``page``, the
+    :class:`Page` being rendered, and ``item``, the first (or only) item on
+    it. Pages are rendered as they are read from *items*, by the same
+    processes or threads as the other templates, and incremental builds skip
+    each page whose items haven't changed.
+
+    :param items:
+        An iterable of the items, which is iterated again on each build, such
+        as a list or :class:`CSVRows`. Or a callable that takes no arguments
+        and returns one, such as a generator function. To render with worker
+        processes, it must be picklable, but the items are read in the
+        parent process.
+
+    :param name:
+        The name of the file each page is written to, formatted with
+        :meth:`str.format` with ``page`` and ``item``, such as
+        ``"products/{item[id]}.html"`` or ``"blog/{page.number}.html"``. Or a
+        callable that takes the :class:`Page` and returns its name.
+
+    :param per_page:
+        The number of items on each page. Defaults to ``1``.
+    """
+
+    def __init__(
+        self,
+        items: t.Iterable[t.Any] | t.Callable[[], t.Iterable[t.Any]],
+        name: str | t.Callable[[Page], str],
+        per_page: int = 1,
+    ) -> None:
+        if per_page < 1:
+            raise ValueError(f"per_page must be at least 1, not {per_page}")
+        self.items = items
+        self.name = name
+        self.per_page = per_page
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.items!r}, {self.name!r})"
+
+    def __call__(self, site: Site, template: Template, **context: t.Any) -> None:
+        site.render_pages(template, self, context)
+
+    def page_name(self, page: Page) -> str:
+        """Get the name of the file *page* is written to."""
+        if callable(self.name):
+            return self.name(page)
+        return self.name.format(page=page, item=page.items[0])
+
+    def pages(self) -> t.Iterator[Page]:
+        """Read the items, yielding each page as soon as the first item of the
+        next one is read."""
+        items = iter(self.items() if callable(self.items) else self.items)
+        chunks = iter(lambda: list(itertools.islice(items, self.per_page)), [])
+        previous = None
+        current = self._page(1, next(chunks, None))
+        while current is not None:
+            following = self._page(current.number + 1, next(chunks, None))
+            current.previous = None if previous is None else previous.name
+            current.next = None if following is None else following.name
+            yield current
+            previous, current = current, following
+
+    def _page(self, number: int, items: list[t.Any] | None) -> Page | None:
+        if items is None:
+            return None
+        page = Page(number, items)
+        page.name = self.page_name(page)
+        return page
+
+    def context(self, page: Page) -> Context:
+        """Get what is added to the context of the template to render *page*."""
+        return {"page": page, "item": page.items[0]}
@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import gzip
+import importlib
+import json
+import logging
+import os
+import threading
+import typing as t
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path, PurePosixPath
+
+from .manifest import hash_bytes, write_atomic
+
+if t.TYPE_CHECKING:
+    from .outputs import Output
+    from .types import FilePath
+
+logger = logging.getLogger(__name__)
+
+#: The name of the record of precompressed files, inside the outpath or the
+#: cache directory.
+PRECOMPRESSED_NAME = ".staticjinja-precompressed.json"
+
+#: The extensions of the text files that are precompressed.
+TEXT_SUFFIXES = frozenset(
+    {
+        ".atom",
+        ".css",
+        ".csv",
+        ".htm",
+        ".html",
+        ".ics",
+        ".js",
+        ".json",
+        ".map",
+        ".md",
+        ".mjs",
+        ".rss",
+        ".svg",
+        ".txt",
+        ".webmanifest",
+        ".xml",
+    }
+)
+
+#: Files smaller than this many bytes aren't precompressed by default, since
+#: compressing them saves little.
+MIN_SIZE = 1024
+
+# How many files may wait to be compressed per thread, before submitting more
+# blocks. Each one is held in memory until it is compressed.
+_PENDING_PER_THREAD = 4
+
+
+def gzip_compress(data: bytes) -> bytes:
+    # Without a timestamp, the same content always compresses the same.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def codecs() -> dict[str, t.Callable[[bytes], bytes]]:
+    """Get the available compressors, by the suffix of the files they write:
+    ``.gz``, and ``.br`` if the ``brotli`` (or ``brotlicffi``) package is
+    installed."""
+    found: dict[str, t.Callable[[bytes], bytes]] = {".gz": gzip_compress}
+    for module in ("brotli", "brotlicffi"):
+        try:
+            found[".br"] = importlib.import_module(module).compress
+        except ImportError:
+            continue
+        break
+    return found
+
+
+class Precompressor:
+    """
+    Writes compressed copies of text files next to them, such as
+    ``index.html.gz`` next to ``index.html``, for web servers that can serve
+    those instead of compressing files on every request. Used by a Site
+    created with ``precompress=True``. See :ref:`precompression`.
+
+    Files are compressed in a pool of threads while the build goes on. The
+    hash of the content of each file is recorded, and files are only
+    compressed again once their content changes.
+
+    :param path:
+        The path of the JSON file the hashes are stored in.
+
+    :param entries:
+        The hashes loaded by :meth:`load`.
+
+    :param min_size:
+        Files smaller than this many bytes aren't compressed.
+
+    :param threads:
+        The number of threads to compress with. Defaults to the number of
+        CPUs.
+    """
+
+    version = 1
+
+    def __init__(
+        self,
+        path: FilePath,
+        entries: dict[str, str] | None = None,
+        min_size: int = MIN_SIZE,
+        threads: int | None = None,
+    ) -> None:
+        self.path = Path(path)
+        #: Maps the name of each compressed file to the hash of its content.
+        self.entries = entries or {}
+        self.min_size = min_size
+        self.threads = threads or os.cpu_count() or 1
+        #: The compressors to write copies with, by suffix. See :func:`codecs`.
+        self.codecs = codecs()
+        self._updates: dict[str, str] = {}
+        self._removals: set[str] = set()
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._pool: ThreadPoolExecutor | None = None
+        self._futures: set[Future[None]] = set()
+        self._errors: dict[str, BaseException] = {}
+        self._slots = threading.BoundedSemaphore(self.threads * _PENDING_PER_THREAD)
+
+    @classmethod
+    def load(cls, path: FilePath, **kwargs: t.Any) -> Precompressor:
+        """Load the hashes stored at *path*, or none if there are none there
+        or they can't be read. *kwargs* are passed on to the constructor."""
+        try:
+            data = json.loads(Path(path).read_text(encoding="utf8"))
+        except FileNotFoundError:
+            return cls(path, **kwargs)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable precompression record %s: %s", path, e)
+            return cls(path, **kwargs)
+        if not isinstance(data, dict) or data.get("version") != cls.version:
+            logger.warning("Ignoring precompression record %s of another version", path)
+            return cls(path, **kwargs)
+        return cls(path, data.get("files", {}), **kwargs)
+
+    def wants(self, name: str, size: int | None = None) -> bool:
+        """Check whether the file *name*, of *size* bytes if known, should be
+        compressed: whether it is a text file of at least :attr:`min_size`."""
+        if PurePosixPath(name).suffix.lower() not in TEXT_SUFFIXES:
+            return False
+        return size is None or size >= self.min_size
+
+    def submit(self, output: Output, name: str, data: bytes) -> None:
+        """Compress *data*, the content of the file *name* in *output*, into
+        copies next to it, if it :meth:`wants` to.
+
+        This returns once the compression is queued. If too many files are
+        already queued, it waits for some of them to be done first.
+        """
+        if self.wants(name, len(data)):
+            self._submit(name, self._compress, output, name, data)
+        else:
+            self.remove(output, name)
+
+    def submit_file(self, output: Output, name: str, path: FilePath) -> None:
+        """Like :meth:`submit`, for the file *name* whose content is the file
+        at *path*, such as a static file. It is read once it is compressed."""
+        if self.wants(name, os.path.getsize(path)):
+            self._submit(name, self._compress_file, output, name, path)
+        else:
+            self.remove(output, name)
+
+    def _submit(self, name: str, fn: t.Callable[..., None], *args: t.Any) -> None:
+        self._slots.acquire()
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.threads, thread_name_prefix="precompress"
+                )
+            future = self._pool.submit(fn, *args)
+            self._futures.add(future)
+
+        def done(future: Future[None]) -> None:
+            self._slots.release()
+            e = future.exception()
+            with self._lock:
+                self._futures.discard(future)
+                if e is not None:
+                    self._errors[name] = e
+
+        future.add_done_callback(done)
+
+    def _compress_file(self, output: Output, name: str, path: FilePath) -> None:
+        with open(path, "rb") as f:
+            self._compress(output, name, f.read())
+
+    def _compress(self, output: Output, name: str, data: bytes) -> None:
+        digest = hash_bytes(data)
+        with self._lock:
+            previous = self.entries.get(name)
+        if previous == digest and all(output.exists(name + s) for s in self.codecs):
+            logger.debug("Not compressing %s, it is unchanged.", name)
+            return
+        for suffix, compress in self.codecs.items():
+            output.write_if_changed(name + suffix, compress(data))
+        logger.debug("Compressed %s.", name)
+        with self._lock:
+            self.entries[name] = digest
+            self._updates[name] = digest
+            self._removals.discard(name)
+            self._dirty = True
+
+    def remove(self, output: Output, name: str) -> None:
+        """Remove the compressed copies of the file *name* from *output*, and
+        forget it, such as after it was deleted."""
+        with self._lock:
+            if self.entries.pop(name, None) is None:
+                return
+            self._updates.pop(name, None)
+            self._removals.add(name)
+            self._dirty = True
+        for suffix in self.codecs:
+            output.remove(name + suffix)
+
+    def wait(self, save: bool = True) -> dict[str, BaseException]:
+        """Wait until all the files submitted so far are compressed, and
+        :meth:`save` the hashes unless *save* is false.
+
+        :return: a mapping from the name of each file that failed to compress
+            to the exception raised while compressing it.
+        """
+        with self._lock:
+            futures = list(self._futures)
+            pool, self._pool = self._pool, None
+        wait(futures)
+        if pool is not None:
+            pool.shutdown()
+        with self._lock:
+            errors, self._errors = self._errors, {}
+        for name, e in errors.items():
+            logger.error("Error compressing %s: %s", name, e)
+        if save:
+            self.save()
+        return errors
+
+    def pop_updates(self) -> dict[str, str]:
+        """Get the hashes recorded since this was last called, such as to send
+        them from a worker process to the parent, which :meth:`update` s with
+        them."""
+        with self._lock:
+            updates, self._updates = self._updates, {}
+        return updates
+
+    def pop_removals(self) -> list[str]:
+        """Like :meth:`pop_updates`, for the names of the files whose
+        compressed copies were removed since this was last called. The parent
+        :meth:`remove` s them too."""
+        with self._lock:
+            removals, self._removals = self._removals, set()
+        return sorted(removals)
+
+    def update(self, entries: dict[str, str]) -> None:
+        """Add hashes recorded elsewhere, such as in a worker process."""
+        with self._lock:
+            self.entries.update(entries)
+            self._dirty = self._dirty or bool(entries)
+
+    def save(self) -> None:
+        """Write the hashes to :attr:`path`, if they changed since they were
+        loaded or last saved."""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"version": self.version, "files": self.entries}
+            dumped = json.dumps(data, indent=1, sort_keys=True)
+            self._dirty = False
+        write_atomic(self.path, dumped.encode("utf8"))
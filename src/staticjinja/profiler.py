@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import collections
+import contextlib
+import csv
+import io
+import json
+import threading
+import time
+import typing as t
+from pathlib import Path
+
+if t.TYPE_CHECKING:
+    from .types import FilePath
+
+#: The phases of building a template that are timed, in the order they happen.
+PHASES = ("load", "context", "rule", "render", "write")
+
+
+class BuildProfile:
+    """
+    Records where the time of a build goes. See :ref:`profiling`.
+
+    For each template, this records the seconds spent in each of the
+    :data:`PHASES`:
+
+    - ``load``: loading and compiling it.
+    - ``context``: getting its context.
+    - ``rule``: finding the rule that matches it.
+    - ``render``: rendering it, or running its rule.
+    - ``write``: writing its output.
+
+    It also records how many bytes were written for each template, and how
+    many times methods such as :meth:`Site.get_context
+    <staticjinja.Site.get_context>` were called.
+    """
+
+    def __init__(self) -> None:
+        #: Maps each template name to the seconds spent in each phase.
+        self.timings: dict[str, dict[str, float]] = {}
+        #: Maps each template name to the number of bytes written for it.
+        self.bytes_written: dict[str, int] = {}
+        #: Maps each method name to how many times it was called.
+        self.calls: collections.Counter[str] = collections.Counter()
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict[str, t.Any]:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict[str, t.Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: FilePath) -> BuildProfile:
+        """Load the records that :meth:`write` wrote to *path*, such as to
+        balance the shards of the next build by them. See :ref:`sharding`.
+
+        :raises ValueError: if the file isn't a profile.
+        """
+        path = Path(path)
+        text = path.read_text(encoding="utf8")
+        profile = cls()
+        try:
+            if path.suffix.lower() == ".csv":
+                rows: list[dict[str, t.Any]] = list(csv.DictReader(io.StringIO(text)))
+            else:
+                data = json.loads(text)
+                rows = data["templates"]
+                profile.calls.update(data.get("calls", {}))
+            for row in rows:
+                name = row["name"]
+                for phase in PHASES:
+                    profile.add(name, phase, float(row.get(phase) or 0.0))
+                profile.wrote(name, int(row.get("bytes") or 0))
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"{path} is not a build profile: {e!r}") from e
+        return profile
+
+    def add(self, name: str, phase: str, seconds: float) -> None:
+        """Add *seconds* to the time spent on *name* in *phase*."""
+        with self._lock:
+            timings = self.timings.setdefault(name, {})
+            timings[phase] = timings.get(phase, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def time(self, name: str, phase: str) -> t.Iterator[None]:
+        """Time the body of a ``with`` statement as *phase* of *name*."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, phase, time.perf_counter() - start)
+
+    def wrote(self, name: str, size: int) -> None:
+        """Record that *size* bytes were written for *name*."""
+        with self._lock:
+            self.bytes_written[name] = self.bytes_written.get(name, 0) + size
+
+    def count(self, method: str) -> None:
+        """Record a call of *method*."""
+        with self._lock:
+            self.calls[method] += 1
+
+    def merge(self, other: BuildProfile) -> None:
+        """Add the records of *other*, such as from a worker process."""
+        for name, timings in other.timings.items():
+            for phase, seconds in timings.items():
+                self.add(name, phase, seconds)
+        for name, size in other.bytes_written.items():
+            self.wrote(name, size)
+        with self._lock:
+            self.calls.update(other.calls)
+
+    def total(self, name: str) -> float:
+        """Get the seconds spent on *name* in all phases."""
+        return sum(self.timings.get(name, {}).values())
+
+    def slowest(self, n: int | None = None) -> list[str]:
+        """Get the names of the *n* slowest templates, slowest first. If *n*
+        is ``None``, get all of them."""
+        return sorted(self.timings, key=self.total, reverse=True)[:n]
+
+    def rows(self) -> list[dict[str, t.Any]]:
+        """Get a row per template, slowest first, with its name, the seconds
+        spent in each phase and in total, and the bytes written."""
+        rows = []
+        for name in self.slowest():
+            timings = self.timings[name]
+            row: dict[str, t.Any] = {"name": name}
+            row.update((phase, timings.get(phase, 0.0)) for phase in PHASES)
+            row["total"] = self.total(name)
+            row["bytes"] = self.bytes_written.get(name, 0)
+            rows.append(row)
+        return rows
+
+    def format(self, n: int = 10) -> str:
+        """Format a table of the *n* slowest templates, followed by the call
+        counts."""
+        header = ["template", *PHASES, "total", "bytes"]
+        lines = [header]
+        for row in self.rows()[:n]:
+            seconds = [f"{row[key]:.4f}" for key in [*PHASES, "total"]]
+            lines.append([row["name"], *seconds, str(row["bytes"])])
+        widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+        table = [
+            "  ".join(
+                cell.ljust(width) if i == 0 else cell.rjust(width)
+                for i, (cell, width) in enumerate(zip(line, widths))
+            )
+            for line in lines
+        ]
+        calls = ", ".join(f"{m}: {c}" for m, c in sorted(self.calls.items()))
+        total = sum(map(self.total, self.timings))
+        table.append(f"{len(self.timings)} templates, {total:.4f}s in total.")
+        if calls:
+            table.append(f"Calls: {calls}.")
+        return "\n".join(table)
+
+    def to_dict(self) -> dict[str, t.Any]:
+        """Get the records as a JSON serializable dictionary."""
+        return {"templates": self.rows(), "calls": dict(self.calls)}
+
+    def to_csv(self) -> str:
+        """Get a CSV table of the records, with a row per template."""
+        f = io.StringIO()
+        fields = ["name", *PHASES, "total", "bytes"]
+        writer = csv.DictWriter(f, fieldnames=fields, lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(self.rows())
+        return f.getvalue()
+
+    def write(self, path: FilePath) -> None:
+        """Write the records to *path*, as CSV if its name ends with ``.csv``,
+        otherwise as JSON."""
+        path = Path(path)
+        if path.suffix.lower() == ".csv":
+            data = self.to_csv()
+        else:
+            data = json.dumps(self.to_dict(), indent=1)
+        path.write_text(data, encoding="utf8")
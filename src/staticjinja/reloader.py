@@ -1,11 +1,16 @@
 from __future__ import annotations
 
+import collections
 import logging
+import threading
+import time
 import typing
 from pathlib import Path
 
 from jinja2 import TemplateError
 
+from .outputs import RecordingOutput
+
 if typing.TYPE_CHECKING:
     # recursive imports
     from .staticjinja import Site
@@ -20,13 +25,41 @@ class Reloader:
     Watches ``site.searchpath`` for changes and re-renders any changed
     Templates.
 
+    Changes are handled in batches: once no new change has been seen for
+    *debounce* seconds, the dependents of all the changed files are rebuilt
+    once. If more changes come in while a batch is being rebuilt, it is
+    interrupted and what is left of it is rebuilt with the next batch.
+
     :param site:
         A :class:`Site <Site>` object.
 
+    :param debounce:
+        How many seconds to wait for more changes before rebuilding. Defaults
+        to ``0.1``.
+
+    :param callbacks:
+        Functions to call with the sorted names of the output files that each
+        batch wrote, copied or removed, such as :meth:`LiveReload.publish
+        <staticjinja.LiveReload.publish>`. Only files written through the
+        Site's :ref:`output <outputs>` are seen. Defaults to none.
     """
 
-    def __init__(self, site: Site) -> None:
+    def __init__(
+        self,
+        site: Site,
+        debounce: float = 0.1,
+        callbacks: typing.Iterable[typing.Callable[[list[str]], object]] = (),
+    ) -> None:
         self.site = site
+        self.debounce = debounce
+        #: The functions called with the output files each batch changed.
+        self.callbacks = list(callbacks)
+        # The changes waiting to be handled, as {src_path: event_type}.
+        self._events: dict[str, str] = {}
+        self._last_event = 0.0
+        self._changed = threading.Condition()
+        # What an interrupted batch didn't get to rebuild.
+        self._leftover: collections.deque[FilePath] = collections.deque()
 
     @property
     def searchpath(self) -> FilePath:
@@ -36,34 +69,177 @@ class Reloader:
         """Check if an event should be handled.
 
         An event should be handled if a file was created or modified, and
-        still exists.
+        still exists, or if a file was deleted, and no longer exists.
 
         :param event_type: a string, representing the type of event
 
         :param filename: the path to the file that triggered the event.
         """
+        if event_type == "deleted":
+            return not Path(filename).exists()
         return event_type in ("modified", "created") and Path(filename).is_file()
 
-    def event_handler(self, event_type: str, src_path: FilePath) -> None:
+    def _split_moves(
+        self, event_type: str, src_path: FilePath, dest_path: FilePath | None
+    ) -> list[tuple[str, FilePath]]:
+        # A move is handled as deleting the file and creating it again: its
+        # new name may match other contexts and rules, so it is rebuilt.
+        if event_type == "moved" and dest_path is not None:
+            return [("deleted", src_path), ("created", dest_path)]
+        return [(event_type, src_path)]
+
+    def queue_event(
+        self, event_type: str, src_path: FilePath, dest_path: FilePath | None = None
+    ) -> None:
+        """Record a change, to be handled with the next batch. Safe to call
+        from any thread.
+
+        :param event_type: a string, representing the type of event
+
+        :param src_path: the absolute path to the file that triggered the event.
+
+        :param dest_path: for ``"moved"`` events, the absolute path the file
+            was moved to.
+        """
+        with self._changed:
+            for event in self._split_moves(event_type, src_path, dest_path):
+                self._events[str(event[1])] = event[0]
+            self._last_event = time.monotonic()
+            self._changed.notify()
+
+    def next_batch(self) -> list[tuple[str, str]]:
+        """Wait for changes, then until none have come in for
+        :attr:`debounce` seconds, and return them as *(event_type,
+        src_path)* pairs. Each file is only included once, with its latest
+        event."""
+        with self._changed:
+            while not self._events:
+                self._changed.wait()
+            while True:
+                remaining = self._last_event + self.debounce - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            batch = [(event_type, path) for path, event_type in self._events.items()]
+            self._events.clear()
+        return batch
+
+    def _interrupted(self) -> bool:
+        with self._changed:
+            return bool(self._events)
+
+    def event_handler(
+        self, event_type: str, src_path: FilePath, dest_path: FilePath | None = None
+    ) -> None:
         """Re-render templates if they are modified.
 
         :param event_type: a string, representing the type of event
 
         :param src_path: the absolute path to the file that triggered the event.
+
+        :param dest_path: for ``"moved"`` events, the absolute path the file
+            was moved to.
+        """
+        self.handle_batch(self._split_moves(event_type, src_path, dest_path))
+
+    def handle_batch(self, events: typing.Iterable[tuple[str, FilePath]]) -> None:
+        """Re-render the templates affected by a batch of changes.
+
+        Every changed file's dependents are rebuilt once, even if several of
+        the files (or one file several times) affect them. If more changes are
+        queued with :meth:`queue_event` meanwhile, this returns early, leaving
+        the rest to the next batch.
+
+        The outputs of deleted files are removed, and the templates that
+        depended on them are rebuilt.
+
+        :param events: *(event_type, src_path)* pairs, as given to
+            :meth:`event_handler`. Moves must be given as a ``"deleted"`` and
+            a ``"created"`` event.
         """
-        if not self.should_handle(event_type, src_path):
+        if not self.callbacks:
+            self._handle_batch(events)
             return
-        filename = Path(src_path).relative_to(self.searchpath)
-        logger.info("%s %s", event_type, filename)
-        for f in self.site.get_dependents(filename):
+        # Record what the batch changes, however it ends.
+        site = self.site
+        output, default_output = site._output, site._default_output
+        recorder = RecordingOutput(site.output)
+        site.output = recorder
+        try:
+            self._handle_batch(events)
+        finally:
+            site._output, site._default_output = output, default_output
+            changed = sorted(recorder.take())
+            if changed:
+                self._publish(changed)
+
+    def _publish(self, changed: list[str]) -> None:
+        for callback in self.callbacks:
+            try:
+                callback(changed)
+            except Exception as e:
+                logger.error("Error in reload callback %r: %s", callback, e)
+
+    def _handle_batch(self, events: typing.Iterable[tuple[str, FilePath]]) -> None:
+        changed: dict[Path, str] = {}
+        for event_type, src_path in events:
+            if not self.should_handle(event_type, src_path):
+                continue
+            try:
+                filename = Path(src_path).relative_to(self.searchpath)
+            except ValueError:
+                # Moved out of the searchpath.
+                continue
+            logger.info("%s %s", event_type, filename)
+            changed[filename] = event_type
+        if changed:
+            # Contexts may read the files that changed.
+            self.site.clear_context_cache()
+        for filename, event_type in changed.items():
+            if self.site.is_ignored(filename) or self.site.is_static(filename):
+                pass
+            elif event_type == "deleted":
+                self.site.dependencies.remove(filename.as_posix())
+            else:
+                self.site.dependencies.update(filename.as_posix())
+            if event_type == "deleted":
+                self.site.remove_output(filename)
+
+        todo = {Path(f).as_posix(): f for f in self._leftover}
+        for filename in changed:
+            for f in self.site.get_dependents(filename):
+                todo.setdefault(Path(f).as_posix(), f)
+        # Deleted files are only rebuilt through the files that depend on them.
+        for filename, event_type in changed.items():
+            if event_type == "deleted":
+                todo.pop(filename.as_posix(), None)
+        self._leftover = collections.deque(todo.values())
+        while self._leftover:
+            if self._interrupted():
+                logger.info("More changes, restarting the rebuild...")
+                return
+            self._rebuild(self._leftover.popleft())
+        if self.site.precompressor is not None:
+            # Errors are logged, and the next change may fix them.
+            self.site.precompressor.wait()
+
+    def _rebuild(self, f: FilePath) -> None:
+        # Errors are logged and the rest of the batch carries on, so a broken
+        # context or rule doesn't stop the watcher.
+        try:
             if self.site.is_static(f):
                 self.site.copy_static([f])
             elif self.site.is_template(f):
-                try:
-                    t = self.site.get_template(f)
-                    self.site.render_template(t)
-                except TemplateError as e:
-                    logger.error("Template error in %s: %s", f, e)
+                t = self.site.get_template(f)
+                self.site.render_template(t)
+        except TemplateError as e:
+            logger.error("Template error in %s: %s", f, e)
+        except Exception:
+            logger.exception("Error rebuilding %s", f)
+
+    def _handle_batches(self) -> None:
+        while True:
+            self.handle_batch(self.next_batch())
 
     def watch(self) -> None:
         """Watch and reload modified templates."""
@@ -71,4 +247,4 @@ class Reloader:
 
         logger.info("Watching '%s' for changes...", self.searchpath)
         logger.info("Press Ctrl+C to stop.")
-        _easywatch.watch(self.searchpath, self.event_handler)
+        _easywatch.watch(self.searchpath, self.queue_event, self._handle_batches)
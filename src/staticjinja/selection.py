@@ -0,0 +1,122 @@
+"""
+Pick the files of a Site to build, such as the ones that changed since the
+last deploy, rather than building everything. See :ref:`partial-builds`.
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import os
+import subprocess
+import typing as t
+from pathlib import Path
+
+from ._dispatch import RegexTable
+
+if t.TYPE_CHECKING:
+    from .types import FilePath
+
+
+def git_changes(path: FilePath, rev: str) -> set[str]:
+    """Get the names of the files in the directory *path* of a git checkout
+    that differ from the git revision *rev*, including changes that aren't
+    committed and files that aren't tracked. They are relative to *path*.
+
+    :raises ValueError: if git fails, such as when *rev* doesn't exist.
+    """
+    if rev.startswith("-"):
+        raise ValueError(f"Invalid git revision {rev!r}")
+
+    def git(*args: str) -> set[str]:
+        try:
+            result = subprocess.run(
+                ["git", "-C", os.fspath(path), *args],
+                capture_output=True,
+                check=False,
+            )
+        except OSError as e:
+            raise ValueError(f"Can't run git: {e}") from e
+        if result.returncode != 0:
+            error = os.fsdecode(result.stderr).strip()
+            raise ValueError(f"Can't find the files changed since {rev!r}: {error}")
+        return {os.fsdecode(name) for name in result.stdout.split(b"\0") if name}
+
+    changed = git("diff", "--name-only", "--relative", "-z", rev, "--")
+    changed.update(git("ls-files", "--others", "--exclude-standard", "-z"))
+    return changed
+
+
+def changed_since(searchpath: FilePath, since: str) -> t.Callable[[str], bool]:
+    """Get a function that checks whether the file it is given the name of,
+    relative to *searchpath*, changed since *since*.
+
+    :param since: the path of a file, such as the build manifest of an earlier
+        incremental build, in which case the files modified after it, or that
+        no longer exist, changed. Otherwise, a git revision, in which case the
+        files that differ from it, including deleted ones, changed, as found by
+        :func:`git_changes`.
+    :raises ValueError: if *since* is a git revision, and git fails.
+    """
+    if os.path.isfile(since):
+        mtime = os.stat(since).st_mtime_ns
+
+        def modified(name: str) -> bool:
+            try:
+                return os.stat(Path(searchpath, name)).st_mtime_ns > mtime
+            except FileNotFoundError:
+                # It can only have been deleted since.
+                return True
+
+        return modified
+    return git_changes(searchpath, since).__contains__
+
+
+class Selection:
+    """
+    The files of a Site to build, out of all of them. Pass it to
+    :meth:`Site.render <staticjinja.Site.render>`, which builds the templates
+    and static files it selects, and all the templates that depend on them.
+    See :ref:`partial-builds`.
+
+    A file is selected if it matches any of the *patterns* (or there are
+    none), and it *changed* (or that isn't given).
+
+    :param patterns:
+        Glob patterns, like ``"blog/*.html"``, that the names of the files,
+        relative to the searchpath, are matched against. As with
+        :mod:`fnmatch`, ``*`` also matches ``/``.
+
+    :param regex:
+        If ``True``, the *patterns* are regexes instead, which are matched
+        like the regexes of contexts and rules, at the start of the names.
+
+    :param changed:
+        A function that checks whether a file changed, given its name, such
+        as one made by :func:`changed_since`.
+    """
+
+    def __init__(
+        self,
+        patterns: t.Sequence[str] = (),
+        regex: bool = False,
+        changed: t.Callable[[str], bool] | None = None,
+    ) -> None:
+        self.patterns = list(patterns)
+        self.regex = regex
+        self.changed = changed
+        if not regex:
+            patterns = [fnmatch.translate(pattern) for pattern in patterns]
+        self._table = RegexTable(patterns)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.patterns!r}, regex={self.regex})"
+
+    def matches(self, name: str) -> bool:
+        """Check whether the file *name* is selected."""
+        if self.patterns and self._table.first(name) is None:
+            return False
+        return self.changed is None or self.changed(name)
+
+    def select(self, names: t.Iterable[str]) -> list[str]:
+        """Get the *names* that are selected, in order."""
+        return [name for name in names if self.matches(name)]
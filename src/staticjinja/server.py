@@ -0,0 +1,330 @@
+"""
+A development server that renders pages when they are requested.
+
+Instead of rebuilding the whole site whenever a file changes, the
+:class:`Server` renders each page the first time it is requested, and keeps
+it until a change to one of the files it depends on invalidates it.
+"""
+
+from __future__ import annotations
+
+import http.server
+import logging
+import mimetypes
+import posixpath
+import threading
+import typing as t
+import urllib.parse
+from pathlib import Path, PurePosixPath
+
+from jinja2 import TemplateError
+
+from ._easywatch import watch
+from .livereload import SCRIPT_PATH, LiveReload
+from .outputs import MemoryOutput, RecordingOutput
+from .reloader import Reloader
+
+if t.TYPE_CHECKING:
+    from .staticjinja import Site
+    from .types import FilePath
+
+logger = logging.getLogger(__name__)
+
+
+class _Invalidator(Reloader):
+    """Invalidates the pages of a :class:`Server` that depend on the files
+    that changed, instead of rebuilding them."""
+
+    def __init__(self, server: Server) -> None:
+        callbacks = []
+        if server.livereload is not None:
+            callbacks.append(server.livereload.publish)
+        super().__init__(server.site, callbacks=callbacks)
+        self.server = server
+
+    def handle_batch(self, events: t.Iterable[tuple[str, FilePath]]) -> None:
+        events = list(events)
+        with self.server._lock:
+            for event_type, src_path in events:
+                if event_type != "modified":
+                    # Rules may now write other files.
+                    self.server._scanned_rules = False
+                if event_type == "deleted":
+                    try:
+                        name = Path(src_path).relative_to(self.searchpath)
+                    except ValueError:
+                        continue
+                    self.server.invalidate(name, forget=True)
+            super().handle_batch(events)
+
+    def _rebuild(self, f: FilePath) -> None:
+        self.server.invalidate(f)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    server: _HTTPServer
+
+    def do_GET(self) -> None:
+        self._serve(body=True)
+
+    def do_HEAD(self) -> None:
+        self._serve(body=False)
+
+    def _serve(self, body: bool) -> None:
+        livereload = self.server.app.livereload
+        if livereload is not None and livereload.handle(self):
+            return
+        path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        try:
+            found = self.server.app.get(path)
+        except Exception as e:
+            # Show what went wrong, rather than the last good page.
+            logger.error("Error serving %s: %s", path, e)
+            self._respond(500, "text/plain", f"{type(e).__name__}: {e}\n", body)
+            return
+        if found is None:
+            self._respond(404, "text/plain", f"Not found: {path}\n", body)
+            return
+        name, data = found
+        if (
+            PurePosixPath(name).name == "index.html"
+            and PurePosixPath(path).name != "index.html"
+            and not path.endswith("/")
+        ):
+            # So that relative links resolve from the directory.
+            self.send_response(301)
+            self.send_header("Location", path + "/")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if livereload is not None and content_type == "text/html":
+            data = _inject_script(data)
+        self._respond(200, content_type, data, body)
+
+    def _respond(
+        self, code: int, content_type: str, data: str | bytes, body: bool
+    ) -> None:
+        encoding = self.server.app.site.encoding
+        if isinstance(data, str):
+            data = data.encode(encoding)
+        if content_type.startswith("text/"):
+            content_type += f"; charset={encoding}"
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+    def log_message(self, format: str, *args: t.Any) -> None:
+        logger.info("%s %s", self.address_string(), format % args)
+
+
+def _inject_script(html: bytes) -> bytes:
+    """Add the live reload script to a page, at the end of its body."""
+    script = f'<script src="{SCRIPT_PATH}"></script>'.encode()
+    head, body_end, tail = html.rpartition(b"</body>")
+    if not body_end:
+        return html + script
+    return head + script + body_end + tail
+
+
+class _HTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, app: Server) -> None:
+        self.app = app
+        super().__init__((app.host, app.port), _Handler)
+
+
+class Server:
+    """
+    Serves a :class:`Site <Site>` over HTTP, rendering each page when it is
+    first requested. See :ref:`dev-server`.
+
+    A request for ``/about.html`` renders the template ``about.html``, and
+    a request for ``/blog/`` renders ``blog/index.html``. Static files are
+    served from the searchpath. Files written by rules are found by rendering
+    the templates with rules whose names have the same stem as the request,
+    and failing that, all the templates with rules, once.
+
+    Rendered files are kept in memory until a change to a file they depend on
+    invalidates them, so after a change only the requested page is rendered
+    again. The site is written to a :class:`MemoryOutput
+    <staticjinja.MemoryOutput>`, which replaces :attr:`Site.output
+    <Site.output>`; nothing is written to the outpath.
+
+    :param site:
+        The :class:`Site <Site>` to serve.
+
+    :param host:
+        The host name or address to listen on. Defaults to ``"localhost"``.
+
+    :param port:
+        The port to listen on. Defaults to ``8000``; ``0`` picks a free one.
+
+    :param livereload:
+        If ``True``, pages are reloaded in the browser when they change: a
+        script is added to the HTML pages served, which listens to a
+        :class:`LiveReload <staticjinja.LiveReload>` served alongside them.
+        Defaults to ``True``. See :ref:`live-reload`.
+    """
+
+    def __init__(
+        self,
+        site: Site,
+        host: str = "localhost",
+        port: int = 8000,
+        livereload: bool = True,
+    ) -> None:
+        self.site = site
+        self.host = host
+        self.port = port
+        #: The :class:`LiveReload <staticjinja.LiveReload>` that tells
+        #: browsers which pages changed, if live reloading.
+        self.livereload = LiveReload() if livereload else None
+        #: Where the files that were built are kept.
+        self.output = MemoryOutput()
+        self._recorder = RecordingOutput(self.output)
+        site.output = self._recorder
+        # Maps the name of each rendered file to the file it was built from.
+        self._sources: dict[str, str] = {}
+        self._scanned_rules = False
+        # Renders one page at a time, and not while files are invalidated.
+        self._lock = threading.RLock()
+        self.reloader = _Invalidator(self)
+
+    def get(self, path: str) -> tuple[str, bytes] | None:
+        """Get the file served at the URL *path*, rendering it if it isn't
+        in memory already.
+
+        :param path: the path of the URL, such as ``"/blog/"``.
+        :return: the name of the file and its content, or ``None`` if there
+            is no such file.
+        """
+        path = path.lstrip("/")
+        names = []
+        if path and not path.endswith("/"):
+            names.append(posixpath.normpath(path))
+        names.append(posixpath.normpath(posixpath.join(path, "index.html")))
+        names = [n for n in names if not n.startswith(("..", "/"))]
+        with self._lock:
+            # Running rules to find a file is the last resort.
+            for scan in (False, True):
+                for name in names:
+                    data = self._find(name, scan)
+                    if data is not None:
+                        return name, data
+        return None
+
+    def _find(self, name: str, scan: bool) -> bytes | None:
+        if name in self.output.files:
+            return self.output.files[name]
+        if not scan:
+            if self._build(self._source_of(name)):
+                return self.output.files.get(name)
+        elif not self._scanned_rules:
+            for source in self._rule_templates(PurePosixPath(name).stem):
+                if self._build(source) and name in self.output.files:
+                    return self.output.files[name]
+            for source in self._rule_templates():
+                self._build(source)
+            self._scanned_rules = True
+            return self.output.files.get(name)
+        return None
+
+    def _source_of(self, name: str) -> str | None:
+        """Get the file *name* is built from, if known or obvious."""
+        if name in self._sources:
+            return self._sources[name]
+        if self.site.assets is not None:
+            for static in self.site.assets.entries:
+                if self.site.assets.get(static) == name:
+                    return static
+        path = Path(self.site.searchpath) / name
+        if self.site.is_static(name) and path.is_file():
+            return name
+        if self.site.is_template(name) and path.is_file():
+            try:
+                self.site.get_rule(name)
+            except ValueError:
+                return name
+        return None
+
+    def _rule_templates(self, stem: str | None = None) -> list[str]:
+        names = []
+        for name in self.site.template_names:
+            if stem is not None and PurePosixPath(name).stem != stem:
+                continue
+            try:
+                self.site.get_rule(name)
+            except ValueError:
+                continue
+            names.append(name)
+        return names
+
+    def _build(self, source: str | None) -> bool:
+        """Render or copy *source*, recording the files it writes."""
+        if source is None:
+            return False
+        self._recorder.take()
+        if self.site.is_static(source):
+            self.site.copy_static([source])
+        else:
+            try:
+                template = self.site.get_template(source)
+            except TemplateError:
+                return False
+            self.site.render_template(template)
+        for name in self._recorder.take():
+            self._sources[name] = source
+        return True
+
+    def invalidate(self, filename: FilePath, forget: bool = False) -> None:
+        """Drop the files built from *filename* from memory, so they are
+        built again when next requested.
+
+        :param filename: the name of the file, relative to the searchpath.
+        :param forget: if true, also forget what *filename* was built into,
+            such as after it was deleted.
+        """
+        source = Path(filename).as_posix()
+        with self._lock:
+            for name, built_from in list(self._sources.items()):
+                if built_from == source:
+                    # Through the Site's output, so the Reloader sees it.
+                    self.site.output.remove(name)
+                    if forget:
+                        del self._sources[name]
+
+    def http_server(self) -> http.server.ThreadingHTTPServer:
+        """Make the HTTP server, bound to :attr:`host` and :attr:`port`, which
+        is updated with the port actually bound to."""
+        httpd = _HTTPServer(self)
+        self.port = httpd.server_address[1]
+        return httpd
+
+    def serve(self) -> None:
+        """Serve the site, and invalidate pages as files change, until
+        interrupted."""
+        httpd = self.http_server()
+
+        def main() -> None:
+            threading.Thread(target=self.reloader._handle_batches, daemon=True).start()
+            logger.info(
+                "Serving %s on http://%s:%d/",
+                self.site.searchpath,
+                self.host,
+                self.port,
+            )
+            logger.info("Press Ctrl+C to stop.")
+            httpd.serve_forever()
+
+        try:
+            watch(self.site.searchpath, self.reloader.queue_event, main)
+        finally:
+            if self.livereload is not None:
+                self.livereload.close()
+            httpd.server_close()
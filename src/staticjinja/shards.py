@@ -0,0 +1,215 @@
+"""
+Split a build into shards, which can be built on separate machines, and
+merge their outputs back into one site. See :ref:`sharding`.
+"""
+
+from __future__ import annotations
+
+import filecmp
+import hashlib
+import heapq
+import json
+import logging
+import os
+import typing as t
+from pathlib import Path
+
+from .assets import ASSETS_NAME
+from .manifest import MANIFEST_NAME, write_atomic
+from .precompress import PRECOMPRESSED_NAME
+from .staticjinja import BuildError
+
+if t.TYPE_CHECKING:
+    from .outputs import Output
+    from .types import FilePath
+
+logger = logging.getLogger(__name__)
+
+#: The records a build keeps next to its outputs, by the key of the entries
+#: in them. The entries of each shard are combined when merging.
+RECORDS = {
+    MANIFEST_NAME: "templates",
+    ASSETS_NAME: "assets",
+    PRECOMPRESSED_NAME: "files",
+}
+
+
+def stable_hash(name: str) -> int:
+    """Hash *name* the same way in every process, unlike :func:`hash`."""
+    digest = hashlib.sha256(name.encode("utf8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def partition(
+    names: t.Iterable[str],
+    count: int,
+    costs: t.Mapping[str, float] | None = None,
+) -> list[list[str]]:
+    """Split *names* into *count* lists, keeping their order within each.
+
+    Without *costs*, each name goes to the list picked by its
+    :func:`stable_hash`, so adding or removing a name doesn't move the others.
+    With them, the costliest names are handed out first, each to the list
+    with the least cost so far. Names without a cost get the average cost of
+    the others.
+
+    Either way, the same names and costs are always split the same way.
+    """
+    shards: list[list[str]] = [[] for _ in range(count)]
+    names = list(names)
+    if costs is None:
+        for name in names:
+            shards[stable_hash(name) % count].append(name)
+        return shards
+    known = [costs[name] for name in names if name in costs]
+    default = sum(known) / len(known) if known else 1.0
+    loads = [(0.0, i) for i in range(count)]
+    owner = {}
+    for name in sorted(names, key=lambda n: (-costs.get(n, default), n)):
+        load, i = heapq.heappop(loads)
+        owner[name] = i
+        heapq.heappush(loads, (load + costs.get(name, default), i))
+    for name in names:
+        shards[owner[name]].append(name)
+    return shards
+
+
+class Shard:
+    """
+    One of the *count* parts a build is split into, to build the parts at the
+    same time on separate machines. See :ref:`sharding`.
+
+    Pass it to :meth:`Site.render <staticjinja.Site.render>` to only render
+    the templates and copy the static files of this part, and combine the
+    outpaths of all the parts with :func:`merge_shards`.
+
+    :param index:
+        Which part this is, from ``1`` to *count*.
+
+    :param count:
+        The number of parts.
+
+    :param costs:
+        The seconds each template took to build, such as from the
+        :class:`BuildProfile <staticjinja.BuildProfile>` of a previous build,
+        to balance the templates by. Every shard must be given the same costs.
+        If not given, templates are split by a hash of their names.
+    """
+
+    def __init__(
+        self,
+        index: int,
+        count: int,
+        costs: t.Mapping[str, float] | None = None,
+    ) -> None:
+        if not 1 <= index <= count:
+            raise ValueError(f"Shard {index} of {count} doesn't exist")
+        self.index = index
+        self.count = count
+        self.costs = costs
+
+    @classmethod
+    def parse(cls, spec: str, costs: t.Mapping[str, float] | None = None) -> Shard:
+        """Parse a shard written as ``"<index>/<count>"``, like ``"2/4"``."""
+        index, sep, count = spec.partition("/")
+        if not (sep and index.isdigit() and count.isdigit()):
+            raise ValueError(f"Invalid shard {spec!r}, expected <index>/<count>")
+        return cls(int(index), int(count), costs)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.index}, {self.count})"
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+    def select(self, names: t.Iterable[str], balance: bool = True) -> list[str]:
+        """Get the names that belong to this shard, out of all the *names*
+        every shard is given.
+
+        :param balance: if false, ignore the costs and split by hash, such
+            as for static files, which have no recorded costs.
+        """
+        costs = self.costs if balance else None
+        return partition(names, self.count, costs)[self.index - 1]
+
+    def owns(self, name: str) -> bool:
+        """Check whether *name* belongs to this shard, by its hash alone, like
+        the names :meth:`select` is given without costs. This is how the pages
+        of :class:`Pages <staticjinja.Pages>` rules are split, since they
+        aren't all known up front."""
+        return stable_hash(name) % self.count == self.index - 1
+
+
+def _load_record(path: Path, key: str) -> tuple[object, dict[str, t.Any]] | None:
+    try:
+        data = json.loads(path.read_text(encoding="utf8"))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable record %s: %s", path, e)
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get(key), dict):
+        logger.warning("Ignoring unknown record %s", path)
+        return None
+    return data.get("version"), data[key]
+
+
+def merge_shards(
+    sources: t.Iterable[FilePath],
+    output: Output,
+    records_dir: FilePath | None = None,
+    strategy: str = "copy",
+) -> int:
+    """Combine the outpaths of the shards of a build into *output*.
+
+    Every file is copied from the outpath it is in. A file that more than one
+    shard wrote, such as one written by a rule, must have the same content in
+    each. The records of incremental builds, fingerprinted and precompressed
+    files in the outpaths are combined too, into *records_dir*.
+
+    :param sources: the outpaths of the shards.
+    :param output: the :class:`Output <staticjinja.Output>` to copy to.
+    :param records_dir: the directory to write the combined records to, such
+        as the outpath or cache directory of the merged site. If not given,
+        they aren't kept.
+    :param strategy: how to copy the files, as for the ``static_strategy`` of
+        a Site.
+    :return: the number of files merged.
+    :raises BuildError: if some files differ between the shards. The other
+        files are merged anyway.
+    """
+    sources = [Path(source) for source in sources]
+    seen: dict[str, Path] = {}
+    errors: dict[str, BaseException] = {}
+    records: dict[str, tuple[object, dict[str, t.Any]]] = {}
+    for source in sources:
+        for dirpath, dirnames, filenames in os.walk(source):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = Path(dirpath, filename)
+                name = path.relative_to(source).as_posix()
+                if name in RECORDS:
+                    loaded = _load_record(path, RECORDS[name])
+                    if loaded is None:
+                        continue
+                    version, entries = loaded
+                    merged = records.setdefault(name, (version, {}))
+                    if merged[0] != version:
+                        raise ValueError(f"{path} is from another version")
+                    merged[1].update(entries)
+                elif name not in seen:
+                    seen[name] = path
+                    output.copy(name, path, strategy)
+                elif not filecmp.cmp(seen[name], path, shallow=False):
+                    msg = f"{name} differs between {seen[name]} and {path}"
+                    logger.error("Error merging %s", msg)
+                    errors[name] = ValueError(msg)
+    if records_dir is not None:
+        for name, (version, entries) in records.items():
+            data = {"version": version, RECORDS[name]: entries}
+            dumped = json.dumps(data, indent=1, sort_keys=True)
+            write_atomic(Path(records_dir, name), dumped.encode("utf8"))
+    logger.info("Merged %d files from %d shards.", len(seen), len(sources))
+    if errors:
+        raise BuildError(errors)
+    return len(seen)
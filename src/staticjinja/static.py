@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import os
+import shutil
+import stat
+import threading
+import typing as t
+
+from .manifest import hash_file
+
+if t.TYPE_CHECKING:
+    from .types import FilePath
+
+#: How static files can be put in the outpath. See :ref:`static-copying`.
+STRATEGIES = ("copy", "hardlink", "symlink", "reflink")
+
+#: How static files already in the outpath can be checked to be up to date.
+CHECKS = ("mtime", "hash")
+
+# The FICLONE ioctl of Linux, which makes a copy-on-write clone of a file.
+_FICLONE = 0x40049409
+
+
+def is_unchanged(src: FilePath, dst: FilePath, strategy: str, check: str) -> bool:
+    """Check whether *dst* is already an up to date copy of *src*, as put
+    there with *strategy*.
+
+    Links are up to date if they point to *src*. Copies, including those made
+    when a hard link couldn't be because *src* is on another filesystem, are
+    up to date if their size and modification time match those of *src* when
+    *check* is ``"mtime"``, or if their size and content match when *check*
+    is ``"hash"``.
+    """
+    try:
+        dst_stat = os.lstat(dst)
+    except FileNotFoundError:
+        return False
+    src_stat = os.stat(src)
+    if stat.S_ISLNK(dst_stat.st_mode):
+        return strategy == "symlink" and os.readlink(dst) == os.path.abspath(src)
+    if os.path.samestat(src_stat, dst_stat):
+        return strategy == "hardlink"
+    if strategy == "symlink" or (
+        strategy == "hardlink" and src_stat.st_dev == dst_stat.st_dev
+    ):
+        # Not linked, but it could be.
+        return False
+    if dst_stat.st_size != src_stat.st_size:
+        return False
+    if check == "hash":
+        return hash_file(src) == hash_file(dst)
+    return dst_stat.st_mtime_ns == src_stat.st_mtime_ns
+
+
+def _reflink(src: FilePath, dst: FilePath) -> None:
+    import fcntl  # Not on Windows.
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+
+def _make(src: FilePath, tmp: str, strategy: str) -> None:
+    """Put *src* at *tmp* with *strategy*, falling back to copying it."""
+    try:
+        if strategy == "hardlink":
+            os.link(src, tmp)
+            return
+        if strategy == "symlink":
+            os.symlink(os.path.abspath(src), tmp)
+            return
+        if strategy == "reflink":
+            _reflink(src, tmp)
+            return
+    except (ImportError, OSError):
+        # Not supported by the OS or filesystem, or across filesystems.
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+    shutil.copy2(src, tmp)
+
+
+def copy_file(
+    src: FilePath,
+    dst: FilePath,
+    strategy: str = "copy",
+    check: str | None = None,
+) -> bool:
+    """Put the file *src* at *dst*, replacing whatever is there.
+
+    :param strategy: one of :data:`STRATEGIES`. ``"copy"`` copies the file
+        and its metadata, ``"hardlink"`` and ``"symlink"`` link to it, and
+        ``"reflink"`` makes a copy-on-write clone. If the file can't be linked
+        or cloned, it is copied instead.
+    :param check: one of :data:`CHECKS`, to leave *dst* alone if it is
+        already up to date, see :func:`is_unchanged`. If ``None``, *dst* is
+        always replaced.
+    :return: whether *dst* was replaced.
+    """
+    if check is not None and is_unchanged(src, dst, strategy, check):
+        return False
+    # Make the file next to dst and move it into place, so that dst is never
+    # half copied, and can be replaced even if it is a link to src.
+    head, tail = os.path.split(dst)
+    tmp = os.path.join(head, f".{tail}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        _make(src, tmp, strategy)
+        os.replace(tmp, dst)
+    finally:
+        # Also left behind if tmp and dst are hard links to the same file,
+        # since renaming one onto the other then does nothing.
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+    return True
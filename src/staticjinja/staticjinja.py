@@ -6,20 +6,46 @@ Uses Jinja2 to compile templates.
 
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import functools
+import hashlib
+import heapq
 import inspect
+import itertools
 import logging
 import os
-import re
-import shutil
+import threading
 import typing as t
 import warnings
+import weakref
 from pathlib import Path
 
-from jinja2 import Environment, FileSystemLoader, Template
-
+import jinja2
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    Template,
+    TemplateNotFound,
+)
+
+from ._dispatch import CachedTable
+from ._workers import render_in_processes, render_pages_in_processes, run_in_threads
+from .assets import ASSETS_NAME, AssetManifest
+from .contexts import ContextCache, Lazy, LazyContext, maybe_await, resolve_lazy
+from .dependencies import DependencyGraph
+from .manifest import MANIFEST_NAME, BuildManifest, fingerprint_context, hash_bytes
+from .outputs import FileSystemOutput, Output
+from .pages import Page, Pages
+from .precompress import MIN_SIZE, PRECOMPRESSED_NAME, Precompressor
+from .profiler import BuildProfile
 from .reloader import Reloader
+from .static import CHECKS, STRATEGIES
 
 if t.TYPE_CHECKING:
+    from .selection import Selection
+    from .shards import Shard
     from .types import (
         Context,
         ContextLike,
@@ -32,20 +58,94 @@ if t.TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 
-def _compute_context(context_like: ContextLike, template: Template) -> Context:
-    if isinstance(context_like, dict):
-        return context_like
+class BuildError(Exception):
+    """Raised when files fail to build during a parallel build.
+
+    .. attribute:: errors
+
+        A dictionary mapping the name of each file that failed to build to the
+        exception that was raised while building it.
+    """
+
+    def __init__(self, errors: dict[str, BaseException]) -> None:
+        self.errors = errors
+        names = ", ".join(sorted(errors))
+        super().__init__(f"{len(errors)} file(s) failed to build: {names}")
+
+
+class BuildSummary:
+    """Counts of what happened to the templates during a build, as returned by
+    :meth:`Site.render`.
+
+    .. attribute:: rendered
+
+        The number of templates that were rendered.
+
+    .. attribute:: skipped
+
+        The number of templates that were skipped by an incremental build
+        because their inputs hadn't changed.
+
+    .. attribute:: unchanged
+
+        The number of rendered templates that weren't written because their
+        output file already had the same content. Only counted when the Site
+        was created with ``write_if_changed=True``.
+
+    .. attribute:: copied
+
+        The number of static files that were copied (or linked).
+
+    .. attribute:: up_to_date
+
+        The number of static files that weren't copied because their copy in
+        the outpath was up to date. Only counted when the Site was created
+        with a ``static_check``.
+    """
+
+    _counts = ("rendered", "skipped", "unchanged", "copied", "up_to_date")
+
+    def __init__(self) -> None:
+        self.rendered = 0
+        self.skipped = 0
+        self.unchanged = 0
+        self.copied = 0
+        self.up_to_date = 0
+        self._lock = threading.Lock()
+
+    def add(self, **counts: int) -> None:
+        """Add to the counts, eg ``summary.add(rendered=1)``."""
+        with self._lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+    def merge(self, other: BuildSummary) -> None:
+        """Add the counts from *other*, such as from a worker process."""
+        self.add(**{name: getattr(other, name) for name in self._counts})
+
+    def __getstate__(self) -> dict[str, t.Any]:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
 
-    if callable(context_like):
-        params = len(inspect.signature(context_like).parameters)
-        return context_like(*[template][:params])
+    def __setstate__(self, state: dict[str, t.Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
 
-    raise TypeError(f"Unexpected type for context: {type(context_like)}")
+    def __str__(self) -> str:
+        s = f"{self.rendered} rendered, {self.skipped} skipped"
+        if self.unchanged:
+            s += f", {self.unchanged} unchanged and not written"
+        if self.copied or self.up_to_date:
+            s += f", {self.copied} static files copied"
+        if self.up_to_date:
+            s += f", {self.up_to_date} up to date"
+        return s
 
 
-def _ensure_dir(path: FilePath) -> None:
-    """Ensure the directory for a file exists."""
-    Path(path).parent.mkdir(exist_ok=True, parents=True)
+def _raise_for_errors(errors: dict[str, BaseException]) -> None:
+    if errors:
+        raise BuildError(errors)
 
 
 def resolve_path(path: FilePath) -> str:
@@ -61,6 +161,64 @@ def resolve_path(path: FilePath) -> str:
     return str(path)
 
 
+def _describe_setting(value: t.Any, nested: bool = False) -> str:
+    """Describe an Environment setting in a way that is stable between runs.
+
+    Callables such as the one returned by :func:`jinja2.select_autoescape` are
+    described by their name and the values they close over, rather than by
+    their ``repr()``, which includes their ``id()``. Callables they close
+    over, such as the functions wrapped by a decorator, are described by
+    their name alone.
+    """
+    if callable(value):
+        name = getattr(value, "__module__", ""), getattr(value, "__qualname__", "")
+        if nested:
+            return repr(name)
+        cells = getattr(value, "__closure__", None) or ()
+        return repr((name, [_describe_setting(c.cell_contents, True) for c in cells]))
+    return repr(value)
+
+
+def make_bytecode_cache(
+    environment: Environment, directory: FilePath
+) -> FileSystemBytecodeCache:
+    """Make a :class:`jinja2.FileSystemBytecodeCache` for *environment* that
+    stores compiled templates in *directory*.
+
+    Jinja only recompiles a cached template when its source changes, but the
+    compiled code also depends on how the Environment is configured (eg its
+    extensions, syntax and autoescaping). So the name of each cache file
+    includes a hash of that configuration, which keeps the bytecode of
+    differently configured Environments apart.
+    """
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    env = environment
+    config = [
+        jinja2.__version__,
+        sorted(env.extensions),
+        env.block_start_string,
+        env.block_end_string,
+        env.variable_start_string,
+        env.variable_end_string,
+        env.comment_start_string,
+        env.comment_end_string,
+        env.line_statement_prefix,
+        env.line_comment_prefix,
+        env.trim_blocks,
+        env.lstrip_blocks,
+        env.newline_sequence,
+        env.keep_trailing_newline,
+        env.optimized,
+        env.is_async,
+        _describe_setting(env.autoescape),
+        _describe_setting(env.finalize),
+        _describe_setting(env.undefined),
+    ]
+    config_hash = hash_bytes(repr(config).encode("utf8"))[:16]
+    pattern = f"__staticjinja_{config_hash}_%s.cache"
+    return FileSystemBytecodeCache(str(directory), pattern=pattern)
+
+
 # TODO replace with te.Self
 # https://github.com/python/mypy/pull/11666
 TSite = t.TypeVar("TSite", bound="Site")
@@ -80,7 +238,13 @@ class Site:
         A list of `regex, context` pairs. Each context is either a dictionary
         or a function that takes either no argument or or the current template
         as its sole argument and returns a dictionary. The regex, if matched
-        against a filename, will cause the context to be used.
+        against a filename, will cause the context to be used. Values that
+        are expensive to compute can be wrapped in :class:`Lazy
+        <staticjinja.Lazy>`, see :ref:`lazy-contexts`.
+
+        The list is used as given, so changes made to it later, as well as
+        to the ``contexts`` attribute, apply to the templates rendered after
+        them. The same goes for *rules*.
 
     :param rules:
         A list of *(regex, function)* pairs. The Site will delegate
@@ -103,8 +267,50 @@ class Site:
         contexts list will be merged (in order) to get the final context.
         Otherwise, only the first matching regex is used. Defaults to
         ``False``.
+
+    :param cache_dir:
+        The directory to store the manifest used by incremental builds in.
+        Defaults to ``None``, which stores it in *outpath*.
+
+    :param write_if_changed:
+        If ``True``, rendered templates are only written if their output file
+        doesn't already have the same content, and then atomically. Defaults
+        to ``False``.
+
+    :param static_strategy:
+        How static files are put in the outpath, one of ``"copy"``,
+        ``"hardlink"``, ``"symlink"`` or ``"reflink"``. Defaults to
+        ``"copy"``. See :ref:`static-copying`.
+
+    :param static_check:
+        How to check that a static file in the outpath is up to date, and
+        doesn't need copying again: ``"mtime"`` to compare sizes and
+        modification times, or ``"hash"`` to compare sizes and contents.
+        Defaults to ``None``, which copies every static file every time.
+
+    :param fingerprint_static:
+        If ``True``, static files are copied to names with a hash of their
+        content in them, which templates get with ``asset_url()``. Defaults to
+        ``False``. See :ref:`fingerprinting`.
+
+    :param output:
+        The :class:`Output <staticjinja.Output>` to write files to. Defaults
+        to ``None``, which writes them to *outpath*. See :ref:`outputs`.
+
+    :param precompress:
+        If ``True``, gzip (and brotli, if installed) compressed copies of the
+        text files written are written next to them. Defaults to ``False``.
+        See :ref:`precompression`.
+
+    :param precompress_min_size:
+        Files smaller than this many bytes aren't precompressed. Defaults to
+        ``1024``.
     """
 
+    # The arguments given to make_site(), used to rebuild this Site inside
+    # worker processes. None if the Site was constructed directly.
+    _make_site_kwargs: dict[str, t.Any] | None = None
+
     def __init__(
         self,
         environment: Environment,
@@ -115,17 +321,74 @@ class Site:
         rules: RuleMapping | None = None,
         staticpaths: list[str] | None = None,
         mergecontexts: bool = False,
+        cache_dir: FilePath | None = None,
+        write_if_changed: bool = False,
+        static_strategy: str = "copy",
+        static_check: str | None = None,
+        fingerprint_static: bool = False,
+        output: Output | None = None,
+        precompress: bool = False,
+        precompress_min_size: int = MIN_SIZE,
     ) -> None:
+        if static_strategy not in STRATEGIES:
+            raise ValueError(
+                f"Unknown static_strategy {static_strategy!r}, "
+                f"expected one of {', '.join(STRATEGIES)}"
+            )
+        if static_check is not None and static_check not in CHECKS:
+            raise ValueError(
+                f"Unknown static_check {static_check!r}, "
+                f"expected one of {', '.join(CHECKS)}"
+            )
         self.env = environment
+        if environment.context_class is jinja2.runtime.Context:
+            # Compute Lazy context values when templates read them.
+            environment.context_class = LazyContext
         self.searchpath = searchpath
         self.outpath = outpath
         self.encoding = encoding
         self.contexts = contexts or []
         self.rules = rules or []
+        # The compiled regexes of the contexts and rules, for as long as they
+        # don't change.
+        self._contexts_table = CachedTable()
+        self._rules_table = CachedTable()
         if staticpaths:
             warnings.warn("staticpaths are deprecated. Use Make instead.")
         self.staticpaths = staticpaths or []
         self.mergecontexts = mergecontexts
+        self.cache_dir = cache_dir
+        self.write_if_changed = write_if_changed
+        self.static_strategy = static_strategy
+        self.static_check = static_check
+        self.fingerprint_static = fingerprint_static
+        self._output = output
+        self._default_output = False
+        self.precompress = precompress
+        self.precompress_min_size = precompress_min_size
+        self._precompressor: Precompressor | None = None
+        # Guards loading the precompressor and assets from several threads.
+        self._load_lock = threading.Lock()
+        self._assets: AssetManifest | None = None
+        environment.globals.setdefault("asset_url", self.asset_url)
+        self._dependencies: DependencyGraph | None = None
+        #: The manifest of an incremental build while it is running.
+        self.manifest: BuildManifest | None = None
+        #: What happened during the current (or last) build.
+        self.summary = BuildSummary()
+        #: Where the time of the current (or last) build went, if profiling.
+        #: See :ref:`profiling`.
+        self.profile: BuildProfile | None = None
+        self._source_hashes: dict[str, str] = {}
+        self._env_key: str | None = None
+        # The input keys of the templates of Pages rules, during a build.
+        self._page_keys: dict[str, tuple[str, str]] = {}
+        self._context_cache = ContextCache()
+        #: How many templates :meth:`arender_template` renders at once.
+        self.async_concurrency = 16
+        self._semaphores: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, asyncio.Semaphore
+        ] = weakref.WeakKeyDictionary()
 
     @classmethod
     def make_site(
@@ -142,6 +405,15 @@ class Site:
         env_globals: dict[str, t.Any] = {},
         env_kwargs: dict[str, t.Any] | None = None,
         mergecontexts: bool = False,
+        cache_dir: FilePath | None = None,
+        write_if_changed: bool = False,
+        bytecode_cache_dir: FilePath | None = None,
+        static_strategy: str = "copy",
+        static_check: str | None = None,
+        fingerprint_static: bool = False,
+        output: Output | None = None,
+        precompress: bool = False,
+        precompress_min_size: int = MIN_SIZE,
     ) -> TSite:
         """Create a :class:`Site <Site>` object.
 
@@ -206,8 +478,92 @@ class Site:
             the contexts list will be merged (in order) to get the final
             context.  Otherwise, only the first matching regex is used.
             Defaults to ``False``.
+
+        :param cache_dir:
+            A string or Path representing the directory to store the manifest
+            used by incremental builds in. Defaults to ``None``, which stores
+            it in *outpath*. See :ref:`incremental-builds`.
+
+        :param write_if_changed:
+            A boolean value. If set to ``True``, each template is rendered into
+            memory and only written if the content of its output file differs,
+            so unchanged files keep their modification time. Files are written
+            atomically, via a temporary file. Defaults to ``False``.
+
+        :param bytecode_cache_dir:
+            A string or Path representing a directory in which to cache
+            compiled templates between builds, using a
+            :class:`jinja2.FileSystemBytecodeCache`. The cache may be shared
+            between processes, such as worker processes. Defaults to ``None``,
+            which doesn't cache compiled templates. See :ref:`bytecode-cache`.
+
+        :param static_strategy:
+            A string, how to put static files in the outpath: ``"copy"`` to
+            copy them, ``"hardlink"`` or ``"symlink"`` to link to them, or
+            ``"reflink"`` to make copy-on-write clones of them, on filesystems
+            that support it. Files that can't be linked or cloned are copied.
+            Defaults to ``"copy"``. See :ref:`static-copying`.
+
+        :param static_check:
+            A string, how to check that a static file already in the outpath is
+            up to date, so it isn't copied again: ``"mtime"`` to compare sizes
+            and modification times, or ``"hash"`` to compare sizes and
+            contents. Defaults to ``None``, which copies every static file on
+            every build.
+
+        :param fingerprint_static:
+            A boolean value. If set to ``True``, static files are copied to
+            names with a hash of their content in them, such as
+            ``app.3f9a1c2e.css``, which templates get with
+            ``asset_url("app.css")``. Defaults to ``False``. See
+            :ref:`fingerprinting`.
+
+        :param output:
+            An :class:`Output <staticjinja.Output>` to write the rendered
+            templates and static files to instead of *outpath*, such as a
+            :class:`MemoryOutput <staticjinja.MemoryOutput>` or an
+            :class:`ArchiveOutput <staticjinja.ArchiveOutput>`. Defaults to
+            ``None``, which writes them to *outpath*. See :ref:`outputs`.
+
+        :param precompress:
+            A boolean value. If set to ``True``, rendered templates and static
+            files that are text, such as HTML, CSS and JavaScript, get gzip
+            compressed copies written next to them, such as
+            ``index.html.gz``, and brotli ones (``index.html.br``) if the
+            ``brotli`` package is installed. Files are compressed from memory
+            in a pool of threads, and only again once their content changes.
+            Defaults to ``False``. See :ref:`precompression`.
+
+        :param precompress_min_size:
+            An integer, the size in bytes under which files aren't
+            precompressed. Defaults to ``1024``.
         """
         searchpath = resolve_path(searchpath)
+        if bytecode_cache_dir is not None:
+            bytecode_cache_dir = resolve_path(bytecode_cache_dir)
+        make_site_kwargs = dict(
+            searchpath=searchpath,
+            outpath=outpath,
+            contexts=contexts,
+            rules=rules,
+            encoding=encoding,
+            followlinks=followlinks,
+            extensions=extensions,
+            staticpaths=staticpaths,
+            filters=filters,
+            env_globals=env_globals,
+            env_kwargs=dict(env_kwargs) if env_kwargs is not None else None,
+            mergecontexts=mergecontexts,
+            cache_dir=cache_dir,
+            write_if_changed=write_if_changed,
+            bytecode_cache_dir=bytecode_cache_dir,
+            static_strategy=static_strategy,
+            static_check=static_check,
+            fingerprint_static=fingerprint_static,
+            output=output,
+            precompress=precompress,
+            precompress_min_size=precompress_min_size,
+        )
 
         if env_kwargs is None:
             env_kwargs = {}
@@ -218,8 +574,12 @@ class Site:
         environment = Environment(**env_kwargs)
         environment.filters.update(filters)
         environment.globals.update(env_globals)
+        if bytecode_cache_dir is not None:
+            environment.bytecode_cache = make_bytecode_cache(
+                environment, bytecode_cache_dir
+            )
 
-        return cls(
+        site = cls(
             environment,
             searchpath=searchpath,
             outpath=outpath,
@@ -228,21 +588,116 @@ class Site:
             contexts=contexts,
             staticpaths=staticpaths,
             mergecontexts=mergecontexts,
+            cache_dir=cache_dir,
+            write_if_changed=write_if_changed,
+            static_strategy=static_strategy,
+            static_check=static_check,
+            fingerprint_static=fingerprint_static,
+            output=output,
+            precompress=precompress,
+            precompress_min_size=precompress_min_size,
         )
+        site._make_site_kwargs = make_site_kwargs
+        return site
+
+    def discover(self, partials: bool = True) -> t.Iterator[tuple[str, str]]:
+        """Find the files in the searchpath, yielding them as they are found,
+        in sorted order.
+
+        Each file is yielded as a *(name, kind)* pair, where *kind* is
+        ``"template"`` if :meth:`is_template` is true for it, ``"static"`` if
+        :meth:`is_static` is, and otherwise ``"partial"`` for files that
+        aren't ignored. Ignored files aren't yielded.
+
+        When the environment uses a :class:`jinja2.FileSystemLoader`, the
+        searchpath is walked with :func:`os.scandir`, and directories for
+        which :meth:`is_ignored` is true (or :meth:`is_partial`, if
+        *partials* is false) aren't descended into, unless they may contain
+        static files. Other loaders are asked to
+        :meth:`jinja2.BaseLoader.list_templates`.
+
+        :param partials: whether to find partials too.
+        """
+        loader = self.env.loader
+        if isinstance(loader, FileSystemLoader):
+            names = self._walk(loader, partials)
+        else:
+            names = iter(self.env.list_templates())
+        for name in names:
+            if self.is_template(name):
+                yield name, "template"
+            elif self.is_static(name):
+                yield name, "static"
+            elif partials and not self.is_ignored(name):
+                yield name, "partial"
+
+    def _walk(self, loader: FileSystemLoader, partials: bool) -> t.Iterator[str]:
+        # The searchpaths are each walked in sorted order, so merging them
+        # keeps it, and puts the names a later searchpath shadows next to the
+        # ones shadowing them.
+        walks = [self._walk_one(p, loader, partials) for p in loader.searchpath]
+        previous = None
+        for name in heapq.merge(*walks):
+            if name != previous:
+                yield name
+            previous = name
+
+    def _walk_one(
+        self, searchpath: FilePath, loader: FileSystemLoader, partials: bool
+    ) -> t.Iterator[str]:
+        # Sorting a directory by its entries' names, with a "/" after those of
+        # subdirectories, and walking each subdirectory where it comes, sorts
+        # the whole walk like list_templates() does.
+        stack = [self._scandir(searchpath, "")]
+        while stack:
+            for entry, name in stack[-1]:
+                if not entry.is_dir():
+                    yield name
+                # Like os.walk(), links to directories are only followed if
+                # asked to, but are never files.
+                elif loader.followlinks or not entry.is_symlink():
+                    if not self._prune(name, partials):
+                        stack.append(self._scandir(entry.path, name + "/"))
+                        break
+            else:
+                stack.pop()
+
+    def _scandir(
+        self, path: FilePath, prefix: str
+    ) -> t.Iterator[tuple[os.DirEntry[str], str]]:
+        try:
+            with os.scandir(path) as it:
+                entries = [(e, prefix + e.name) for e in it]
+        except OSError as e:
+            logger.warning("Can't read %s: %s", path, e)
+            return iter(())
+        entries.sort(key=lambda e: e[1] + "/" if e[0].is_dir() else e[1])
+        return iter(entries)
+
+    def _prune(self, dirname: str, partials: bool) -> bool:
+        """Check if nothing in the directory *dirname* needs to be found."""
+        for staticpath in self.staticpaths:
+            staticpath = Path(staticpath).as_posix()
+            if staticpath.startswith(dirname + "/") or dirname.startswith(staticpath):
+                return False
+        return self.is_ignored(dirname) or (not partials and self.is_partial(dirname))
 
     @property
     def template_names(self) -> list[str]:
-        return self.env.list_templates(filter_func=self.is_template)
+        """The names of all the templates, sorted."""
+        return [name for name, kind in self.discover(False) if kind == "template"]
 
     @property
     def templates(self) -> t.Iterator[Template]:
         """Generator for templates."""
-        for template_name in self.template_names:
-            yield self.get_template(template_name)
+        for name, kind in self.discover(partials=False):
+            if kind == "template":
+                yield self.get_template(name)
 
     @property
     def static_names(self) -> list[str]:
-        return self.env.list_templates(filter_func=self.is_static)
+        """The names of all the static files, sorted."""
+        return [name for name, kind in self.discover(False) if kind == "static"]
 
     def get_template(self, template_name: FilePath) -> Template:
         """Get a :class:`jinja2.Template` from the environment.
@@ -251,7 +706,8 @@ class Site:
         """
         template_name = Path(template_name).as_posix()
         try:
-            return self.env.get_template(template_name)
+            with self._timed(template_name, "load"):
+                return self.env.get_template(template_name)
         except UnicodeDecodeError as e:
             raise UnicodeError("Unable to decode %s: %s" % (template_name, e))
 
@@ -267,19 +723,53 @@ class Site:
         be merged before being returned if mergecontexts is True. Otherwise,
         only the first matching value is returned.
 
+        Functions that take no arguments are only called once per build, see
+        :ref:`cached-contexts`.
+
+        :param template: the template to get the context for
+        """
+        if self.profile is not None:
+            self.profile.count("get_context")
+        context: Context = {}
+        for context_like in self._matching_contexts(template):
+            context.update(self._context_cache.compute(context_like, template))
+        return context
+
+    async def aget_context(self, template: Template) -> Context:
+        """Like :meth:`get_context`, but also awaits async context functions.
+
         :param template: the template to get the context for
         """
-        context = {}
-        for regex, context_like in self.contexts:
-            # TODO unlink name from the template
-            assert template.name is not None
-            if re.match(regex, template.name):
-                new_context = _compute_context(context_like, template)
-                context.update(new_context)
-                if not self.mergecontexts:
-                    break
+        if self.profile is not None:
+            self.profile.count("get_context")
+        context: Context = {}
+        for context_like in self._matching_contexts(template):
+            context.update(await self._context_cache.acompute(context_like, template))
         return context
 
+    def _matching_contexts(self, template: Template) -> list[ContextLike]:
+        if not self.contexts:
+            return []
+        # TODO unlink name from the template
+        assert template.name is not None
+        table = self._contexts_table.get(self.contexts)
+        if self.mergecontexts:
+            matches = table.all(template.name)
+        else:
+            first = table.first(template.name)
+            matches = [] if first is None else [first]
+        return [self.contexts[i][1] for i in matches]
+
+    def clear_context_cache(self) -> None:
+        """Forget the contexts computed so far, so that they are computed
+        again from scratch.
+
+        This is done at the start of each build, and by the :class:`Reloader
+        <staticjinja.Reloader>` whenever a file changes. See
+        :ref:`cached-contexts`.
+        """
+        self._context_cache.clear(context_like for _, context_like in self.contexts)
+
     def get_rule(self, template_name: str) -> Rule:
         """Find a matching compilation rule for a function.
 
@@ -287,10 +777,16 @@ class Site:
 
         :param template_name: the name of the template
         """
-        for regex, render_func in self.rules:
-            if re.match(regex, template_name):
-                return render_func
-        raise ValueError("no matching rule")
+        if self.profile is not None:
+            self.profile.count("get_rule")
+        rule = self._find_rule(template_name)
+        if rule is None:
+            raise ValueError("no matching rule")
+        return rule
+
+    def _find_rule(self, template_name: str) -> Rule | None:
+        i = self._rules_table.get(self.rules).first(template_name)
+        return None if i is None else self.rules[i][1]
 
     def is_static(self, filename: FilePath) -> bool:
         """Check if a file is static. Static files are copied, rather than
@@ -314,6 +810,8 @@ class Site:
         A file is considered a partial if it or any of its parent
         directories are prefixed with an ``'_'``.
 
+        This is also called with directory names: see :meth:`discover`.
+
         :param filename: A PathLike name of the file to check
         """
         return any(part.startswith("_") for part in Path(filename).parts)
@@ -325,6 +823,8 @@ class Site:
         A file is considered ignored if it or any of its parent directories
         are prefixed with an ``'.'``.
 
+        This is also called with directory names: see :meth:`discover`.
+
         :param filename: A PathLike name of the file to check
         """
         return any(part.startswith(".") for part in Path(filename).parts)
@@ -365,51 +865,616 @@ class Site:
             used to provide a context.
 
         :param filepath:
-            Optional. A PathLike representing the output location.
-            Defaults to to ``os.path.join(self.outpath, template.name)``.
+            Optional. A PathLike representing the output location, on the
+            filesystem. Defaults to writing the template to :attr:`output` as
+            ``template.name``, which is ``os.path.join(self.outpath,
+            template.name)`` unless the Site has another :ref:`output
+            <outputs>`.
         """
-        logger.info("Rendering %s...", template.name)
-
+        name = str(template.name)
         if context is None:
-            context = self.get_context(template)
+            with self._timed(name, "context"):
+                context = self.get_context(template)
+        with self._timed(name, "rule"):
+            rule, output, outname = self._rule_and_output(template, filepath)
+        if isinstance(rule, Pages):
+            # Each page is checked against the manifest, and counted, itself.
+            self.render_pages(template, rule, context)
+            return
+        skip, inputs = self._check_manifest(template, context, rule, output, outname)
+        if skip:
+            return
+
+        logger.info("Rendering %s...", name)
+        if rule is None:
+            self._render_to(name, template, context, output, outname)
+        else:
+            with self._timed(name, "render"):
+                rule(self, template, **context)
+        self._rendered(template, inputs)
 
+    def _render_to(
+        self,
+        name: str,
+        template: Template,
+        context: Context,
+        output: Output,
+        outname: str,
+    ) -> None:
+        """Render *template* with *context* to *outname* in *output*, timing it
+        as *name*."""
+        # Render the whole template first to time rendering and writing
+        # separately, or to compress it from memory.
+        if (
+            self.write_if_changed
+            or self.profile is not None
+            or self._precompresses(output, outname)
+        ):
+            with self._timed(name, "render"):
+                content = template.render(**context).encode(self.encoding)
+            self._write_output(name, output, outname, content)
+        else:
+            chunks = template.generate(**context)
+            output.write(outname, (c.encode(self.encoding) for c in chunks))
+
+    def _timed(self, name: str, phase: str) -> t.ContextManager[None]:
+        """Time *phase* of building *name*, if profiling."""
+        if self.profile is None:
+            return contextlib.nullcontext()
+        return self.profile.time(name, phase)
+
+    def _rule_and_output(
+        self, template: Template, filepath: str | None
+    ) -> tuple[Rule | None, Output, str]:
+        """Get the rule matching *template*, if any, and the output and name to
+        write it to otherwise."""
         assert template.name is not None
         try:
-            rule = self.get_rule(template.name)
+            rule: Rule | None = self.get_rule(template.name)
         except ValueError:
-            if filepath is None:
-                filepath = os.path.join(self.outpath, template.name)
-            _ensure_dir(filepath)
-            template.stream(**context).dump(filepath, self.encoding)
+            rule = None
+        if filepath is None:
+            return rule, self.output, template.name
+        head, tail = os.path.split(filepath)
+        return rule, FileSystemOutput(head), tail
+
+    def _check_manifest(
+        self,
+        template: Template,
+        context: Context,
+        rule: Rule | None,
+        output: Output,
+        outname: str,
+    ) -> tuple[bool, tuple[str, str] | None]:
+        """During an incremental build, get the inputs of *template* to record
+        in the manifest, and whether they are unchanged so it can be skipped.
+        """
+        if self.manifest is None:
+            return False, None
+        assert template.name is not None
+        inputs = self._input_key(template, context)
+        # Only the rule knows where it wrote the template.
+        output_exists = rule is not None or output.exists(outname)
+        if output_exists and self.manifest.is_fresh(template.name, inputs[1]):
+            logger.debug("Skipping %s, it is unchanged.", template.name)
+            self.manifest.record(template.name, *inputs)
+            self.summary.add(skipped=1)
+            return True, inputs
+        return False, inputs
+
+    def _write_output(
+        self, name: str, output: Output, outname: str, content: bytes
+    ) -> None:
+        with self._timed(name, "write"):
+            written = True
+            if not self.write_if_changed:
+                output.write(outname, [content])
+            else:
+                written = output.write_if_changed(outname, content)
+        if self.precompressor is not None and output is self.output:
+            self.precompressor.submit(output, outname, content)
+        if not written:
+            logger.debug("Not writing %s, it is unchanged.", outname)
+            self.summary.add(unchanged=1)
+            return
+        if self.profile is not None:
+            self.profile.wrote(name, len(content))
+
+    def _rendered(self, template: Template, inputs: tuple[str, str] | None) -> None:
+        assert template.name is not None
+        self.summary.add(rendered=1)
+        if self.manifest is not None and inputs is not None:
+            self.manifest.record(template.name, *inputs)
+
+    @property
+    def output(self) -> Output:
+        """The :class:`Output <staticjinja.Output>` that rendered templates and
+        static files are written to. Unless the Site was given another one,
+        this is a :class:`FileSystemOutput <staticjinja.FileSystemOutput>` of
+        :attr:`outpath`. See :ref:`outputs`."""
+        if self._output is None or (
+            self._default_output
+            and isinstance(self._output, FileSystemOutput)
+            and self._output.path != Path(self.outpath)
+        ):
+            # The outpath may have been changed since.
+            self._output = FileSystemOutput(self.outpath)
+            self._default_output = True
+        return self._output
+
+    @output.setter
+    def output(self, output: Output) -> None:
+        self._output = output
+        self._default_output = False
+
+    def write(
+        self,
+        filename: FilePath,
+        content: str | bytes | t.Iterable[str] | t.Iterable[bytes],
+    ) -> None:
+        """Write a file to :attr:`output`. Rules should use this, so that they
+        work with any output.
+
+        :param filename: the name of the file, relative to the root of the
+            output, such as ``"posts/post1.html"``.
+        :param content: the content of the file, or an iterable of chunks of
+            it, such as from :meth:`jinja2.Template.generate`, which are
+            written as they are generated. Strings are encoded with
+            :attr:`encoding`.
+        """
+        name = Path(filename).as_posix()
+        chunks: t.Iterable[bytes]
+        if isinstance(content, str):
+            chunks = [content.encode(self.encoding)]
+        elif isinstance(content, bytes):
+            chunks = [content]
         else:
-            rule(self, template, **context)
+            chunks = (
+                c.encode(self.encoding) if isinstance(c, str) else c for c in content
+            )
+        if self.precompressor is None or not self.precompressor.wants(name):
+            self.output.write(name, chunks)
+            return
+        # Compress it from memory, rather than reading it back.
+        data = b"".join(chunks)
+        self.output.write(name, [data])
+        self.precompressor.submit(self.output, name, data)
 
-    def render_templates(self, templates: t.Iterable[Template]) -> None:
+    @property
+    def manifest_path(self) -> Path:
+        """Where the manifest used by incremental builds is stored."""
+        return Path(self.cache_dir or self.outpath) / MANIFEST_NAME
+
+    def _source_hash(self, template_name: str) -> str:
+        """Hash the source of a template, caching the result for the build."""
+        if template_name not in self._source_hashes:
+            assert self.env.loader is not None
+            try:
+                source, _, _ = self.env.loader.get_source(self.env, template_name)
+            except TemplateNotFound:
+                source = ""
+            self._source_hashes[template_name] = hash_bytes(source.encode("utf8"))
+        return self._source_hashes[template_name]
+
+    def _input_key(self, template: Template, context: Context) -> tuple[str, str]:
+        """Get the hash of a template's source, and a key that changes whenever
+        the template, anything it references, or its context changes."""
+        assert template.name is not None
+        deps: t.AbstractSet[str] | None
+        deps = self.dependencies.dependencies(template.name)
+        if deps is None or self._loads_templates(template.name):
+            # It has dynamic references, or a rule that may load templates
+            # itself, so it could depend on anything.
+            deps = self.dependencies.names
+        key = hashlib.sha256()
+        for name in [template.name, *sorted(deps - {template.name})]:
+            key.update(f"{name}\0{self._source_hash(name)}\0".encode())
+        key.update(fingerprint_context(self._used_context(template, context)).encode())
+        key.update(self._environment_key().encode())
+        if self.assets is not None:
+            # Any of the static files it uses may have a new name.
+            key.update(self.assets.key().encode())
+        return self._source_hash(template.name), key.hexdigest()
+
+    def _environment_key(self) -> str:
+        """Hash the globals and filters of the environment, which any template
+        may use, caching the result for the build.
+
+        Like the settings hashed by :func:`make_bytecode_cache`, callables are
+        described by their name and the values they close over.
+        """
+        if self._env_key is None:
+            env = {
+                "globals": {
+                    k: _describe_setting(v) for k, v in self.env.globals.items()
+                },
+                "filters": {
+                    k: _describe_setting(v) for k, v in self.env.filters.items()
+                },
+            }
+            self._env_key = fingerprint_context(env)
+        return self._env_key
+
+    def _used_context(self, template: Template, context: Context) -> Context:
+        """Get *context* with the :class:`Lazy <staticjinja.Lazy>` values that
+        *template* may read computed, and the ones it can't read left out.
+
+        If the variables it reads can't be known, such as when a rule renders
+        it with other templates, all the values are computed.
+        """
+        assert template.name is not None
+        variables = None
+        if not self._loads_templates(template.name):
+            variables = self.dependencies.variables(template.name)
+        return {
+            k: resolve_lazy(v)
+            for k, v in context.items()
+            if variables is None or k in variables or not isinstance(v, Lazy)
+        }
+
+    def render_templates(
+        self, templates: t.Iterable[Template], workers: int = 1, threads: int = 1
+    ) -> None:
         """Render a collection of :class:`jinja2.Template` objects.
 
+        When rendering in parallel, a template that fails to render doesn't
+        stop the others. Once they are all done, a :exc:`BuildError` is raised
+        that records the error for each failed template.
+
         :param templates:
             A collection of :class:`jinja2.Template` objects to render.
+
+        :param workers:
+            The number of processes to render with. If greater than ``1``,
+            templates are rendered in a process pool, which requires the Site
+            to have been created with :meth:`make_site` and everything given
+            to it to be picklable. See :ref:`parallel-rendering`. Defaults to
+            ``1``.
+
+        :param threads:
+            The number of threads to render with, if *workers* is ``1``.
+            Useful when contexts and rules spend their time waiting on I/O.
+            Defaults to ``1``.
+        """
+        if workers > 1:
+            names = []
+            for template in templates:
+                if template.name is None:
+                    raise ValueError("Can't render a template without a name")
+                names.append(template.name)
+            _raise_for_errors(self._render_names(names, workers=workers))
+        elif threads > 1:
+            items = ((str(tmpl.name), tmpl) for tmpl in templates)
+            _raise_for_errors(run_in_threads(self.render_template, items, threads))
+        else:
+            for template in templates:
+                self.render_template(template)
+
+    def _render_names(
+        self, template_names: t.Sequence[str], workers: int = 1, threads: int = 1
+    ) -> dict[str, BaseException]:
+        """Render templates by name in a pool of processes or threads, loading
+        each template in the pool too.
+
+        :return: a mapping from template name to the exception raised while
+            rendering it.
         """
-        for template in templates:
-            self.render_template(template)
-
-    def copy_static(self, files: t.Iterable[FilePath]) -> None:
-        for f in files:
-            f = Path(f)
-            input_location = Path(self.searchpath) / f
-            output_location = Path(self.outpath) / f
-            logger.info("Copying %s to %s.", f, output_location)
-            _ensure_dir(output_location)
-            shutil.copy2(input_location, output_location)
+        if workers > 1:
+            logger.info(
+                "Rendering %d templates with %d workers...",
+                len(template_names),
+                workers,
+            )
+            return render_in_processes(self, template_names, workers)
+
+        def render_name(name: str) -> None:
+            self.render_template(self.get_template(name))
+
+        return run_in_threads(render_name, ((n, n) for n in template_names), threads)
+
+    def render_pages(
+        self, template: Template, pages: Pages, context: Context | None = None
+    ) -> None:
+        """Render the pages a :class:`Pages <staticjinja.Pages>` rule generates
+        from *template*, one after another. See :ref:`generated-pages`.
+
+        :param template: the :class:`jinja2.Template` to render each page with.
+        :param pages: the rule that generates the pages.
+        :param context: Optional. The context of *template*, which each page
+            adds to. Defaults to :meth:`get_context`.
+        """
+        if context is None:
+            context = self.get_context(template)
+        logger.info("Rendering the pages of %s...", template.name)
+        for page in pages.pages():
+            self._render_page(template, context, pages, page)
+
+    def _render_page(
+        self, template: Template, context: Context, pages: Pages, page: Page
+    ) -> None:
+        assert template.name is not None
+        entry = f"{template.name}#{page.name}"
+        inputs = None
+        if self.manifest is not None:
+            source, key = self._page_base_key(template, context)
+            key = hash_bytes(f"{key}\0{fingerprint_context(vars(page))}".encode())
+            inputs = source, key
+            if self.output.exists(page.name) and self.manifest.is_fresh(entry, key):
+                logger.debug("Skipping %s, it is unchanged.", page.name)
+                self.manifest.record(entry, *inputs)
+                self.summary.add(skipped=1)
+                return
+        logger.debug("Rendering %s...", page.name)
+        context = {**context, **pages.context(page)}
+        self._render_to(page.name, template, context, self.output, page.name)
+        self.summary.add(rendered=1)
+        if self.manifest is not None and inputs is not None:
+            self.manifest.record(entry, *inputs)
+
+    def _page_base_key(self, template: Template, context: Context) -> tuple[str, str]:
+        """Get the input key of *template*, which the key of each of its pages
+        adds to, computing it only once per build."""
+        assert template.name is not None
+        inputs = self._page_keys.get(template.name)
+        if inputs is None:
+            inputs = self._page_keys[template.name] = self._input_key(template, context)
+        return inputs
+
+    def _pages_rule(self, template_name: str) -> Pages | None:
+        """Get the :class:`Pages <staticjinja.Pages>` rule of a template, if
+        that is its rule."""
+        rule = self._find_rule(template_name)
+        return rule if isinstance(rule, Pages) else None
+
+    def _render_generated(
+        self,
+        template_names: t.Sequence[str],
+        workers: int = 1,
+        threads: int = 1,
+        shard: Shard | None = None,
+    ) -> dict[str, BaseException]:
+        """Render the pages of templates whose rules are :class:`Pages
+        <staticjinja.Pages>`, in a pool of processes or threads. The pages are
+        only generated as the pool is ready for them.
+
+        :param shard: if given, only render the pages of this shard.
+        :return: a mapping from page name to the exception raised while
+            rendering it.
+        """
+        errors: dict[str, BaseException] = {}
+
+        def pages(name: str) -> t.Iterator[Page]:
+            rule = self._pages_rule(name)
+            assert rule is not None
+            logger.info("Rendering the pages of %s...", name)
+            for page in rule.pages():
+                if shard is None or shard.owns(page.name):
+                    yield page
+
+        if workers > 1:
+            pairs = ((name, page) for name in template_names for page in pages(name))
+            return render_pages_in_processes(self, pairs, workers)
+
+        def tasks() -> t.Iterator[tuple[str, tuple[Template, Context, Page]]]:
+            for name in template_names:
+                try:
+                    template = self.get_template(name)
+                    context = self.get_context(template)
+                except Exception as e:
+                    logger.error("Error building %s: %s", name, e)
+                    errors[name] = e
+                    continue
+                for page in pages(name):
+                    yield page.name, (template, context, page)
+
+        def render_page(task: tuple[Template, Context, Page]) -> None:
+            template, context, page = task
+            rule = self._pages_rule(str(template.name))
+            assert rule is not None
+            self._render_page(template, context, rule, page)
+
+        if threads > 1:
+            errors.update(run_in_threads(render_page, tasks(), threads))
+        else:
+            for _, task in tasks():
+                render_page(task)
+        return errors
+
+    def _copy_static_file(self, f: FilePath) -> None:
+        f = Path(f)
+        input_location = Path(self.searchpath) / f
+        outname = f.as_posix()
+        if self.assets is not None:
+            outname = self.assets.fingerprint(outname, input_location)
+        if self.output.copy(
+            outname, input_location, self.static_strategy, self.static_check
+        ):
+            logger.info("Copying %s to %s.", f, outname)
+            self.summary.add(copied=1)
+        else:
+            logger.debug("Not copying %s, it is up to date.", f)
+            self.summary.add(up_to_date=1)
+        if self.precompressor is not None:
+            self.precompressor.submit_file(self.output, outname, input_location)
+
+    def copy_static(self, files: t.Iterable[FilePath], threads: int = 1) -> None:
+        """Copy static files from the searchpath to the outpath.
+
+        :param files:
+            The names of the static files to copy, relative to the searchpath.
+
+        :param threads:
+            The number of threads to copy with. If greater than ``1``, a file
+            that fails to copy doesn't stop the others, and a
+            :exc:`BuildError` is raised once they are all done. Defaults to
+            ``1``.
+        """
+        _raise_for_errors(self._copy_static_files(files, threads))
+
+    def _copy_static_files(
+        self, files: t.Iterable[FilePath], threads: int
+    ) -> dict[str, BaseException]:
+        try:
+            if threads > 1:
+                items = ((str(f), f) for f in files)
+                return run_in_threads(self._copy_static_file, items, threads)
+            for f in files:
+                self._copy_static_file(f)
+            return {}
+        finally:
+            if self._assets is not None:
+                self._assets.save()
+
+    @property
+    def precompressed_path(self) -> Path:
+        """Where the hashes of precompressed files are stored."""
+        return Path(self.cache_dir or self.outpath) / PRECOMPRESSED_NAME
+
+    @property
+    def precompressor(self) -> Precompressor | None:
+        """The :class:`Precompressor <staticjinja.Precompressor>` of the files
+        written, if the Site precompresses them. It is loaded from
+        :attr:`precompressed_path` the first time it is used."""
+        if not self.precompress:
+            return None
+        if self._precompressor is None:
+            with self._load_lock:
+                if self._precompressor is None:
+                    self._precompressor = Precompressor.load(
+                        self.precompressed_path, min_size=self.precompress_min_size
+                    )
+        return self._precompressor
+
+    def _precompresses(self, output: Output, outname: str) -> bool:
+        return (
+            self.precompressor is not None
+            and output is self.output
+            and self.precompressor.wants(outname)
+        )
+
+    @property
+    def asset_manifest_path(self) -> Path:
+        """Where the hashes of fingerprinted static files are stored."""
+        return Path(self.cache_dir or self.outpath) / ASSETS_NAME
+
+    @property
+    def assets(self) -> AssetManifest | None:
+        """The :class:`AssetManifest <staticjinja.AssetManifest>` of the static
+        files, if the Site fingerprints them. It is loaded from
+        :attr:`asset_manifest_path` the first time it is used."""
+        if not self.fingerprint_static:
+            return None
+        if self._assets is None:
+            with self._load_lock:
+                if self._assets is None:
+                    self._assets = AssetManifest.load(self.asset_manifest_path)
+        return self._assets
+
+    def asset_url(self, filename: FilePath, base: str = "/") -> str:
+        """Get the URL of the static file *filename*, which templates get as
+        ``asset_url(filename)``. See :ref:`fingerprinting`.
+
+        :param filename: the name of the static file, relative to the
+            searchpath.
+        :param base: the URL the outpath is served from. Defaults to ``"/"``.
+        :return: the URL of the fingerprinted copy of the file, if the Site
+            fingerprints static files, or else of the file itself.
+        """
+        name = Path(filename).as_posix()
+        if not self.is_static(name):
+            raise ValueError(f"{name} is not a static file")
+        if self.assets is not None:
+            name = self.assets.fingerprint(name, Path(self.searchpath) / name)
+        return f"{base.rstrip('/')}/{name}"
+
+    def _asset_users(self, templates: t.Iterable[str]) -> list[str]:
+        """Get the *templates* that may get the URL of a static file with
+        ``asset_url()``, themselves, through the templates they reference, or
+        through the ones their rule loads."""
+        users = []
+        for name in templates:
+            used = self.dependencies.globals(name)
+            if used is None or "asset_url" in used or self._loads_templates(name):
+                users.append(name)
+        return users
+
+    def remove_output(self, filename: FilePath) -> None:
+        """Remove the output of a template or static file that was deleted
+        from the searchpath.
+
+        Nothing is removed for templates that are rendered by a rule, since
+        only the rule knows where they were written, or for other files.
+
+        :param filename: the name of the deleted file, relative to the
+            searchpath.
+        """
+        name = Path(filename).as_posix()
+        if self.is_template(name):
+            try:
+                self.get_rule(name)
+            except ValueError:
+                pass
+            else:
+                logger.debug("Not removing the output of %s, it has a rule.", name)
+                return
+        elif not self.is_static(name):
+            return
+        elif self.assets is not None:
+            fingerprinted = self.assets.get(name)
+            self.assets.remove(name)
+            self.assets.save()
+            if fingerprinted is None:
+                return
+            name = fingerprinted
+        if self.precompressor is not None:
+            self.precompressor.remove(self.output, name)
+            self.precompressor.save()
+        if self.output.exists(name):
+            self.output.remove(name)
+            logger.info("Removed %s.", name)
+
+    @property
+    def dependencies(self) -> DependencyGraph:
+        """The :class:`DependencyGraph <staticjinja.DependencyGraph>` of all the
+        templates and partials in the Site.
+
+        It is built the first time it is used, after which it must be kept up
+        to date with :meth:`DependencyGraph.update
+        <staticjinja.DependencyGraph.update>` as files change, as the
+        :class:`Reloader <staticjinja.Reloader>` does.
+        """
+        if self._dependencies is None:
+            names = (name for name, kind in self.discover() if kind != "static")
+            self._dependencies = DependencyGraph(self.env, names)
+        return self._dependencies
+
+    def _loads_templates(self, template_name: str) -> bool:
+        """Check if the template *template_name* is rendered by a rule, which
+        may load other templates than the ones its source references, such as
+        a layout, and so may depend on any of them."""
+        if not self.is_template(template_name):
+            return False
+        rule = self._find_rule(template_name)
+        # Pages rules render the template itself.
+        return rule is not None and not isinstance(rule, Pages)
 
     def get_dependents(self, filename: FilePath) -> t.Sequence[FilePath]:
         """Get a list of files that depends on *filename*. Useful to decide
         what to re-render when *filename* changes.
 
         - Ignored files have no dependents.
-        - Static and template files just have themselves as dependents.
-        - Partial files have all the templates as dependents, since any template
-          may rely upon a partial.
+        - Static files have themselves as dependents. If the Site
+          fingerprints static files, they are followed by the templates that
+          may get their URL with ``asset_url()``, directly or through the
+          partials they reference (see :ref:`fingerprinting`).
+        - Template files have themselves as dependents, followed by any other
+          templates that depend on them.
+        - Partial files have as dependents all the templates that
+          ``extends``, ``include`` or ``import`` them, directly or through
+          other partials. Templates whose references can't be resolved, such
+          as ``{% include some_variable %}``, are always included, and so are
+          the templates rendered by rules, which may load any template
+          themselves. See :attr:`dependencies`.
 
         .. versionchanged:: 2.0.0
            Now always returns list of filenames. Before the return type
@@ -419,24 +1484,317 @@ class Site:
         :return: list of filenames of dependents.
         """
         if self.is_partial(filename):
-            return self.template_names
+            dependents = self.dependencies.dependents(Path(filename).as_posix())
+            # Rules may load it without their templates referencing it.
+            dependents.update(filter(self._loads_templates, self.dependencies.names))
+            return sorted(name for name in dependents if self.is_template(name))
         elif self.is_template(filename):
-            return [filename]
+            name = Path(filename).as_posix()
+            dependents = self.dependencies.dependents(name)
+            others = sorted(n for n in dependents if self.is_template(n) and n != name)
+            return [filename, *others]
         elif self.is_static(filename):
-            return [filename]
+            if self.assets is None:
+                return [filename]
+            # The templates that may get its new URL too.
+            names = (n for n in self.dependencies.names if self.is_template(n))
+            return [filename, *sorted(self._asset_users(names))]
         else:
             return []
 
-    def render(self, use_reloader: bool = False) -> None:
+    def _prepare_build(
+        self, incremental: bool, profile: bool, graph: bool
+    ) -> dict[str, list[str]]:
+        """Reset the state of the Site for a new build, and find everything
+        to build in one walk of the searchpath.
+
+        :param incremental: see :meth:`render`.
+        :param profile: see :meth:`render`.
+        :param graph: if given, also find the partials, and build the
+            dependency graph of the templates.
+        :return: the names of the templates, static files and partials found,
+            by kind.
+        """
+        self.summary = BuildSummary()
+        self.profile = BuildProfile() if profile else None
+        # Files may have changed since any previous build.
+        self._dependencies = None
+        self._source_hashes = {}
+        self._env_key = None
+        self._page_keys = {}
+        self.clear_context_cache()
+        if incremental:
+            self.manifest = BuildManifest.load(self.manifest_path)
+
+        found: dict[str, list[str]] = {"template": [], "static": [], "partial": []}
+        for name, kind in self.discover(partials=graph):
+            found[kind].append(name)
+        if graph:
+            names = found["template"] + found["partial"]
+            self._dependencies = DependencyGraph(self.env, names)
+        return found
+
+    def _finish_build(self) -> dict[str, BaseException]:
+        """Wait for the precompressor and save the manifest of a build, even
+        if it failed.
+
+        :return: the errors of the precompressor, by file name.
+        """
+        errors: dict[str, BaseException] = {}
+        if self.precompressor is not None:
+            errors.update(self.precompressor.wait())
+        if self.manifest is not None:
+            self.manifest.save()
+            self.manifest = None
+        return errors
+
+    def render(
+        self,
+        use_reloader: bool = False,
+        workers: int = 1,
+        threads: int = 1,
+        incremental: bool = False,
+        profile: bool = False,
+        shard: Shard | None = None,
+        only: Selection | None = None,
+    ) -> BuildSummary:
         """Generate the site.
 
         :param use_reloader: if given, reload templates on modification
+        :param workers: the number of processes to render templates with.
+            See :meth:`render_templates`.
+        :param threads: the number of threads to render templates with (if
+            *workers* is ``1``) and to copy static files with.
+        :param incremental: if given, skip templates whose source, referenced
+            templates and context haven't changed since the last incremental
+            build. See :ref:`incremental-builds`.
+        :param profile: if given, record where the time of the build goes in
+            :attr:`profile`. See :ref:`profiling`.
+        :param shard: if given, only render the templates and copy the static
+            files of this :class:`Shard <staticjinja.Shard>` of the site. See
+            :ref:`sharding`.
+        :param only: if given, only build the files this :class:`Selection
+            <staticjinja.Selection>` selects, and the templates that depend on
+            them. See :ref:`partial-builds`.
+        :return: a :class:`BuildSummary` of what was rendered and skipped.
         """
-        self.render_templates(self.templates)
-        self.copy_static(self.static_names)
+        # Partials are only needed for the dependency graph of incremental and
+        # partial builds.
+        graph = incremental or only is not None
+        found = self._prepare_build(incremental, profile, graph=graph)
+        static = found["static"]
+        if only is not None:
+            self._select(found, only)
+        # Every shard renders its share of the pages of Pages rules instead.
+        generated = [n for n in found["template"] if self._pages_rule(n)]
+        if generated:
+            rest = set(found["template"]).difference(generated)
+            found["template"] = [n for n in found["template"] if n in rest]
+        if shard is not None:
+            found["template"] = shard.select(found["template"])
+            found["static"] = shard.select(found["static"], balance=False)
+            logger.info(
+                "Building shard %s: %d templates and %d static files.",
+                shard,
+                len(found["template"]),
+                len(found["static"]),
+            )
+
+        errors: dict[str, BaseException] = {}
+        try:
+            if self.assets is not None:
+                # Templates need the fingerprinted names of the static files.
+                self.assets.retain(static)
+                if shard is not None:
+                    # Including the ones other shards copy, which also keeps
+                    # the key of incremental builds the same in every shard.
+                    other = set(static).difference(found["static"])
+                    for name in sorted(other):
+                        self.assets.digest(name, Path(self.searchpath) / name)
+                errors.update(self._copy_static_files(found["static"], threads))
+            if workers > 1 or threads > 1:
+                # Templates are loaded by the pool, so don't compile them all here.
+                errors.update(self._render_names(found["template"], workers, threads))
+            else:
+                templates = (self.get_template(n) for n in found["template"])
+                self.render_templates(templates)
+            errors.update(self._render_generated(generated, workers, threads, shard))
+            if self.assets is None:
+                errors.update(self._copy_static_files(found["static"], threads))
+        finally:
+            errors.update(self._finish_build())
+        logger.info("Built %s: %s.", self.searchpath, self.summary)
+        _raise_for_errors(errors)
 
         if use_reloader:
             Reloader(self).watch()
+        return self.summary
+
+    def _select(self, found: dict[str, list[str]], only: Selection) -> None:
+        """Narrow down the templates and static files *found* by
+        :meth:`discover` to the ones *only* selects, and their dependents."""
+        # Deleted files are selected too, so their dependents are built.
+        gone = sorted(self.dependencies.missing)
+        selected = only.select(itertools.chain(*found.values(), gone))
+        wanted = set(found["static"]).intersection(selected)
+        for name in selected:
+            if name not in wanted:
+                wanted.update(Path(n).as_posix() for n in self.get_dependents(name))
+        if self.assets is not None and any(map(self.is_static, selected)):
+            # Templates that may get the new URL of a static file.
+            wanted.update(self._asset_users(found["template"]))
+        templates = found["template"]
+        found["template"] = [n for n in templates if n in wanted]
+        found["static"] = [n for n in found["static"] if n in wanted]
+        logger.info(
+            "Selected %d templates and %d static files.",
+            len(found["template"]),
+            len(found["static"]),
+        )
+        if self.manifest is not None:
+            # Keep what is known about the templates that aren't built.
+            previous = self.manifest.previous
+            kept = {n for n in templates if n not in wanted}
+            # Including the pages of their Pages rules.
+            entries = {n: e for n, e in previous.items() if n.partition("#")[0] in kept}
+            self.manifest.update(entries)
+
+    def _async_limit(self) -> asyncio.Semaphore:
+        """Get the semaphore that bounds the async renders of this Site."""
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.async_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def arender_template(
+        self,
+        template: Template,
+        context: Context | None = None,
+        filepath: str | None = None,
+    ) -> None:
+        """Like :meth:`render_template`, but for use in an asyncio event loop.
+        See :ref:`async-rendering`.
+
+        Async context functions and rules are awaited. If the environment was
+        created with ``enable_async=True``, the template is rendered with
+        :meth:`jinja2.Template.render_async`. Sync rules and rendering, and
+        checking and writing the output, are run in a thread, so as not to
+        block the event loop.
+
+        At most :attr:`async_concurrency` templates of the Site are rendered
+        at once, however many calls are made.
+        """
+        name = str(template.name)
+        loop = asyncio.get_running_loop()
+        async with self._async_limit():
+            if context is None:
+                with self._timed(name, "context"):
+                    context = await self.aget_context(template)
+            with self._timed(name, "rule"):
+                rule, output, outname = self._rule_and_output(template, filepath)
+            if isinstance(rule, Pages):
+                render = functools.partial(self.render_pages, template, rule, context)
+                await loop.run_in_executor(None, render)
+                return
+            check = functools.partial(
+                self._check_manifest, template, context, rule, output, outname
+            )
+            skip, inputs = await loop.run_in_executor(None, check)
+            if skip:
+                return
+
+            logger.info("Rendering %s...", name)
+            if rule is None:
+                with self._timed(name, "render"):
+                    if self.env.is_async:
+                        rendered = await template.render_async(**context)
+                    else:
+                        call = functools.partial(template.render, **context)
+                        rendered = await loop.run_in_executor(None, call)
+                content = rendered.encode(self.encoding)
+                write = functools.partial(
+                    self._write_output, name, output, outname, content
+                )
+                await loop.run_in_executor(None, write)
+            else:
+                with self._timed(name, "render"):
+                    if inspect.iscoroutinefunction(rule):
+                        await rule(self, template, **context)
+                    else:
+                        # A sync rule may still return an awaitable.
+                        call = functools.partial(rule, self, template, **context)
+                        await maybe_await(await loop.run_in_executor(None, call))
+            self._rendered(template, inputs)
+
+    async def arender_templates(self, templates: t.Iterable[Template]) -> None:
+        """Like :meth:`render_templates`, but for use in an asyncio event loop.
+
+        A template that fails to render doesn't stop the others. Once they are
+        all done, a :exc:`BuildError` is raised that records the error for
+        each failed template.
+
+        :param templates:
+            A collection of :class:`jinja2.Template` objects to render. It is
+            only consumed as templates finish rendering.
+        """
+        await self._arender_all(templates)
+
+    async def _arender_all(self, templates: t.Iterable[Template | str]) -> None:
+        """Render *templates*, loading those given by name in a thread."""
+        loop = asyncio.get_running_loop()
+        errors: dict[str, BaseException] = {}
+        it = iter(templates)
+
+        async def worker() -> None:
+            for template in it:
+                name = template if isinstance(template, str) else str(template.name)
+                try:
+                    if isinstance(template, str):
+                        load = functools.partial(self.get_template, template)
+                        template = await loop.run_in_executor(None, load)
+                    await self.arender_template(template)
+                except Exception as e:
+                    logger.error("Error building %s: %s", name, e)
+                    errors[name] = e
+
+        await asyncio.gather(*(worker() for _ in range(self.async_concurrency)))
+        _raise_for_errors(errors)
+
+    async def arender(
+        self, incremental: bool = False, profile: bool = False
+    ) -> BuildSummary:
+        """Like :meth:`render`, but for use in an asyncio event loop. See
+        :ref:`async-rendering`.
+
+        Calls of :meth:`arender_template` and :meth:`arender_templates` may
+        run at the same time, but not calls of this, since each build resets
+        the state of the Site.
+
+        :param incremental: see :meth:`render`.
+        :param profile: see :meth:`render`.
+        :return: a :class:`BuildSummary` of what was rendered and skipped.
+        """
+        loop = asyncio.get_running_loop()
+        prepare = functools.partial(
+            self._prepare_build, incremental, profile, graph=incremental
+        )
+        found = await loop.run_in_executor(None, prepare)
+        errors: dict[str, BaseException] = {}
+        copy_static = functools.partial(self.copy_static, found["static"])
+        try:
+            if self.assets is not None:
+                self.assets.retain(found["static"])
+                await loop.run_in_executor(None, copy_static)
+            await self._arender_all(found["template"])
+            if self.assets is None:
+                await loop.run_in_executor(None, copy_static)
+        finally:
+            errors.update(await loop.run_in_executor(None, self._finish_build))
+        logger.info("Built %s: %s.", self.searchpath, self.summary)
+        _raise_for_errors(errors)
+        return self.summary
 
     def __repr__(self) -> str:
         return "%s('%s', '%s')" % (type(self).__name__, self.searchpath, self.outpath)
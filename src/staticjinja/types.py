@@ -24,7 +24,18 @@ class ContextTemplateCallable(te.Protocol):
     def __call__(self, __template: Template) -> Context: ...
 
 
-ContextLike: te.TypeAlias = "Context | ContextCallable | ContextTemplateCallable"
+class AsyncContextCallable(te.Protocol):
+    def __call__(self) -> t.Awaitable[Context]: ...
+
+
+class AsyncContextTemplateCallable(te.Protocol):
+    def __call__(self, __template: Template) -> t.Awaitable[Context]: ...
+
+
+ContextLike: te.TypeAlias = (
+    "Context | ContextCallable | ContextTemplateCallable"
+    " | AsyncContextCallable | AsyncContextTemplateCallable"
+)
 
 
 class Rule(te.Protocol):
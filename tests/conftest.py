@@ -34,6 +34,22 @@ def build_path(root_path: Path) -> Path:
     return p
 
 
+@pytest.fixture
+def files() -> t.Callable[..., dict[str, bytes]]:
+    """Get a function that reads the files under a directory into a dict of
+    their contents, keyed by their names relative to it. Files whose names
+    start with a ``.`` are left out if *hidden* is false."""
+
+    def read(path: Path, hidden: bool = True) -> dict[str, bytes]:
+        return {
+            p.relative_to(path).as_posix(): p.read_bytes()
+            for p in sorted(path.rglob("*"))
+            if p.is_file() and (hidden or not p.name.startswith("."))
+        }
+
+    return read
+
+
 @pytest.fixture
 def site(template_path: Path, build_path: Path) -> staticjinja.Site:
     template_path.joinpath(".ignored1.html").write_text("Ignored 1")
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+
+from pytest import LogCaptureFixture, MonkeyPatch
+
+from staticjinja import AssetManifest, assets
+from staticjinja.assets import fingerprinted_name
+
+
+def test_fingerprinted_name() -> None:
+    digest = "3f9a1c2e" + "0" * 56
+    assert fingerprinted_name("css/app.css", digest) == "css/app.3f9a1c2e.css"
+    assert fingerprinted_name("app.min.js", digest) == "app.min.3f9a1c2e.js"
+    assert fingerprinted_name("LICENSE", digest) == "LICENSE.3f9a1c2e"
+
+
+def test_digest(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    hashed = []
+    hash_file = assets.hash_file
+
+    def counting_hash_file(path):
+        hashed.append(Path(path).name)
+        return hash_file(path)
+
+    monkeypatch.setattr(assets, "hash_file", counting_hash_file)
+    app = tmp_path / "app.css"
+    app.write_text("a {}")
+    path = tmp_path / "assets.json"
+    manifest = AssetManifest.load(path)
+    name = manifest.fingerprint("app.css", app)
+    assert name.startswith("app.") and name.endswith(".css")
+    assert manifest.get("app.css") == name
+    key = manifest.key()
+    manifest.save()
+
+    # Unchanged files aren't hashed again, even by a new build.
+    loaded = AssetManifest.load(path)
+    assert loaded.fingerprint("app.css", app) == name
+    assert loaded.key() == key
+    assert hashed == ["app.css"]
+
+    app.write_text("b {}")
+    os.utime(app, ns=(0, 0))
+    assert loaded.fingerprint("app.css", app) != name
+    assert loaded.key() != key
+    assert hashed == ["app.css", "app.css"]
+
+    loaded.remove("app.css")
+    assert loaded.get("app.css") is None
+    loaded.save()
+    assert json.loads(path.read_text())["assets"] == {}
+
+
+def test_unreadable(tmp_path: Path, caplog: LogCaptureFixture) -> None:
+    path = tmp_path / "assets.json"
+    path.write_text("not json")
+    assert AssetManifest.load(path).entries == {}
+    path.write_text(json.dumps({"version": -1, "assets": {"a": {}}}))
+    assert AssetManifest.load(path).entries == {}
+    assert "another version" in caplog.text
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import importlib.util
+import json
+import logging
+from pathlib import Path
+
+import pytest
+
+BENCH_PATH = Path(__file__).parent.parent / "benchmarks" / "bench.py"
+
+
+@pytest.fixture
+def bench():
+    spec = importlib.util.spec_from_file_location("bench", BENCH_PATH)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_bench(
+    bench,
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    # Like when run as a script, without logging every file.
+    caplog.set_level(logging.WARNING, logger="staticjinja")
+    tiny = ["--pages=3", "--depth=2", "--fanout=2", "--static-files=2"]
+    tiny += ["--static-size=10", "--repeat=1", "--threads=2"]
+    results = tmp_path / "results.json"
+    assert bench.main([*tiny, f"--output={results}"]) == 0
+    report = json.loads(results.read_text())
+    assert set(report["results"]) == set(bench.BENCHMARKS)
+    assert report["params"]["pages"] == 3
+
+    # Much slower than the baseline.
+    report["results"] = {name: 0.0001 for name in report["results"]}
+    results.write_text(json.dumps(report))
+    assert bench.main([*tiny, f"--baseline={results}"]) == 1
+    assert "REGRESSION" in capsys.readouterr().out
+
+    # Made with another site.
+    assert bench.main([*tiny, "--pages=4", f"--baseline={results}"]) == 2
+
+
+def test_generate_site(bench, tmp_path: Path) -> None:
+    bench.generate_site(tmp_path, pages=60, depth=2, fanout=1, static_files=1)
+    site = bench.make_site(tmp_path, tmp_path / "build", contexts=1, rules=1)
+    assert len(site.template_names) == 60
+    assert site.static_names == ["static/asset0.bin"]
+    assert site.get_dependents("_partials/0_1.html")[0] == "pages/0/page0.html"
@@ -4,7 +4,9 @@ import logging
 import os
 import subprocess
 import sys
+import tarfile
 import unittest.mock as mock
+from pathlib import Path
 
 import pytest
 
@@ -43,6 +45,14 @@ def test_srcpath(
         searchpath=os.path.normpath(expected),
         outpath=os.path.normpath("/cwd"),
         staticpaths=None,
+        cache_dir=None,
+        write_if_changed=False,
+        bytecode_cache_dir=None,
+        static_strategy="copy",
+        static_check=None,
+        fingerprint_static=False,
+        output=None,
+        precompress=False,
     )
 
 
@@ -78,6 +88,14 @@ def test_outpath(
         searchpath=os.path.normpath("/cwd/templates"),
         outpath=os.path.normpath(expected),
         staticpaths=None,
+        cache_dir=None,
+        write_if_changed=False,
+        bytecode_cache_dir=None,
+        static_strategy="copy",
+        static_check=None,
+        fingerprint_static=False,
+        output=None,
+        precompress=False,
     )
 
 
@@ -129,7 +147,252 @@ def test_watch(
     mock_site = mock.Mock()
     mock_make_site.return_value = mock_site
     cli.main([command])
-    mock_site.render.assert_called_once_with(use_reloader=expected)
+    mock_site.render.assert_called_once_with(
+        use_reloader=expected,
+        workers=1,
+        threads=1,
+        incremental=False,
+        profile=False,
+        shard=None,
+        only=None,
+    )
+
+
+@mock.patch("os.path.isdir")
+@mock.patch("os.getcwd")
+@mock.patch("staticjinja.cli.staticjinja.Site.make_site")
+def test_jobs(
+    mock_make_site: mock.Mock, mock_getcwd: mock.Mock, mock_isdir: mock.Mock
+) -> None:
+    """Test that `--jobs` and `--threads` are passed on to Site.render()."""
+    mock_isdir.return_value = True
+    mock_getcwd.return_value = "/cwd"
+    mock_site = mock.Mock()
+    mock_make_site.return_value = mock_site
+    cli.main(["build", "--jobs=4", "--threads=8"])
+    mock_site.render.assert_called_once_with(
+        use_reloader=False,
+        workers=4,
+        threads=8,
+        incremental=False,
+        profile=False,
+        shard=None,
+        only=None,
+    )
+
+
+@mock.patch("os.path.isdir")
+@mock.patch("os.getcwd")
+@mock.patch("staticjinja.cli.staticjinja.Site.make_site")
+def test_incremental(
+    mock_make_site: mock.Mock, mock_getcwd: mock.Mock, mock_isdir: mock.Mock
+) -> None:
+    """Test that the caching and writing options are passed on to the Site."""
+    mock_isdir.return_value = True
+    mock_getcwd.return_value = "/cwd"
+    mock_site = mock.Mock()
+    mock_make_site.return_value = mock_site
+    argv = ["build", "--incremental", "--cache-dir=.cache", "--write-if-changed"]
+    cli.main([*argv, "--bytecode-cache=/tmp/bc"])
+    mock_make_site.assert_called_once_with(
+        searchpath=os.path.normpath("/cwd/templates"),
+        outpath=os.path.normpath("/cwd"),
+        staticpaths=None,
+        cache_dir=os.path.normpath("/cwd/.cache"),
+        write_if_changed=True,
+        bytecode_cache_dir=os.path.normpath("/tmp/bc"),
+        static_strategy="copy",
+        static_check=None,
+        fingerprint_static=False,
+        output=None,
+        precompress=False,
+    )
+    mock_site.render.assert_called_once_with(
+        use_reloader=False,
+        workers=1,
+        threads=1,
+        incremental=True,
+        profile=False,
+        shard=None,
+        only=None,
+    )
+
+
+@mock.patch("os.path.isdir")
+@mock.patch("staticjinja.cli.staticjinja.changed_since")
+@mock.patch("staticjinja.cli.staticjinja.Site.make_site")
+def test_only(
+    mock_make_site: mock.Mock, mock_changed_since: mock.Mock, mock_isdir: mock.Mock
+) -> None:
+    """Test that patterns and `--changed-since` select the files to build."""
+    mock_isdir.return_value = True
+    mock_site = mock.Mock()
+    mock_make_site.return_value = mock_site
+    cli.main(["build", "--srcpath=/src", "--regex", "--changed-since=main", "a.*", "b"])
+    mock_changed_since.assert_called_once_with(os.path.normpath("/src"), "main")
+    only = mock_site.render.call_args.kwargs["only"]
+    assert isinstance(only, staticjinja.Selection)
+    assert (only.patterns, only.regex) == (["a.*", "b"], True)
+    assert only.changed is mock_changed_since.return_value
+
+    mock_changed_since.side_effect = ValueError("bad revision")
+    for argv in [
+        ["build", "--changed-since=nope"],
+        ["build", "--regex", "("],
+        ["watch", "--changed-since=main"],
+    ]:
+        with pytest.raises(SystemExit):
+            cli.main(argv)
+
+
+@mock.patch("os.path.isdir")
+@mock.patch("os.getcwd")
+@mock.patch("staticjinja.cli.staticjinja.Site.make_site")
+def test_static_copy(
+    mock_make_site: mock.Mock, mock_getcwd: mock.Mock, mock_isdir: mock.Mock
+) -> None:
+    """Test that the static copying options are passed on to the Site."""
+    mock_isdir.return_value = True
+    mock_getcwd.return_value = "/cwd"
+    argv = ["build", "--static-copy=hardlink", "--static-check=mtime"]
+    cli.main([*argv, "--fingerprint-static"])
+    kwargs = mock_make_site.call_args.kwargs
+    assert kwargs["static_strategy"] == "hardlink"
+    assert kwargs["static_check"] == "mtime"
+    assert kwargs["fingerprint_static"]
+
+    for option in ["--static-copy=move", "--static-check=size"]:
+        with pytest.raises(SystemExit):
+            cli.main(["build", option])
+
+
+@mock.patch("os.path.isdir")
+@mock.patch("os.getcwd")
+@mock.patch("staticjinja.cli.staticjinja.Server")
+@mock.patch("staticjinja.cli.staticjinja.Site.make_site")
+def test_serve(
+    mock_make_site: mock.Mock,
+    mock_server: mock.Mock,
+    mock_getcwd: mock.Mock,
+    mock_isdir: mock.Mock,
+) -> None:
+    """Test that `serve` serves the Site instead of rendering it."""
+    mock_isdir.return_value = True
+    mock_getcwd.return_value = "/cwd"
+    mock_site = mock.Mock()
+    mock_make_site.return_value = mock_site
+    cli.main(["serve", "--host=0.0.0.0", "--port=8080"])
+    mock_server.assert_called_once_with(mock_site, "0.0.0.0", 8080)
+    mock_server.return_value.serve.assert_called_once_with()
+    mock_site.render.assert_not_called()
+
+    for option in ["--port=http", "--port=70000", "--archive=site.zip"]:
+        with pytest.raises(SystemExit):
+            cli.main(["serve", option])
+
+
+@mock.patch("os.path.isdir")
+@mock.patch("staticjinja.cli.staticjinja.LiveReload")
+@mock.patch("staticjinja.cli.staticjinja.Reloader")
+@mock.patch("staticjinja.cli.staticjinja.Site.make_site")
+def test_livereload(
+    mock_make_site: mock.Mock,
+    mock_reloader: mock.Mock,
+    mock_livereload: mock.Mock,
+    mock_isdir: mock.Mock,
+) -> None:
+    """Test that `--livereload` publishes what each rebuild changed."""
+    mock_isdir.return_value = True
+    mock_site = mock.Mock()
+    mock_make_site.return_value = mock_site
+    cli.main(["watch", "--livereload=35729"])
+    mock_site.render.assert_called_once_with(
+        use_reloader=False,
+        workers=1,
+        threads=1,
+        incremental=False,
+        profile=False,
+        shard=None,
+        only=None,
+    )
+    livereload = mock_livereload.return_value
+    livereload.serve_in_thread.assert_called_once_with("localhost", 35729)
+    mock_reloader.assert_called_once_with(mock_site, callbacks=[livereload.publish])
+    mock_reloader.return_value.watch.assert_called_once_with()
+
+    for args in [["watch", "--livereload=port"], ["build", "--livereload=35729"]]:
+        with pytest.raises(SystemExit):
+            cli.main(args)
+
+
+@mock.patch("os.path.isdir")
+@mock.patch("os.getcwd")
+@mock.patch("staticjinja.cli.staticjinja.Reloader")
+@mock.patch("staticjinja.cli.staticjinja.Site.make_site")
+def test_profile(
+    mock_make_site: mock.Mock,
+    mock_reloader: mock.Mock,
+    mock_getcwd: mock.Mock,
+    mock_isdir: mock.Mock,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    """Test that `--profile` prints a report of the first build, before watching."""
+    mock_isdir.return_value = True
+    mock_getcwd.return_value = "/cwd"
+    mock_site = mock.Mock()
+    mock_site.profile.format.return_value = "the report"
+    mock_make_site.return_value = mock_site
+    cli.main(["watch", "--profile=5", "--profile-out=report.csv"])
+    mock_site.render.assert_called_once_with(
+        use_reloader=False,
+        workers=1,
+        threads=1,
+        incremental=False,
+        profile=True,
+        shard=None,
+        only=None,
+    )
+    mock_site.profile.format.assert_called_once_with(5)
+    assert capsys.readouterr().out == "the report\n"
+    mock_site.profile.write.assert_called_once_with(os.path.normpath("/cwd/report.csv"))
+    mock_reloader.return_value.watch.assert_called_once_with()
+
+
+@pytest.mark.filterwarnings("ignore:staticpaths are deprecated")
+def test_archive(tmp_path: Path) -> None:
+    """Test that `--archive` builds the site into an archive."""
+    src = tmp_path / "templates"
+    src.mkdir()
+    src.joinpath("index.html").write_text("{{ 1 + 1 }}")
+    src.joinpath("static").mkdir()
+    src.joinpath("static", "app.css").write_text("body {}")
+    archive = tmp_path / "site.tar.gz"
+    cli.main(["build", f"--srcpath={src}", "--static=static", f"--archive={archive}"])
+    with tarfile.open(archive) as tar:
+        assert sorted(tar.getnames()) == ["index.html", "static/app.css"]
+        f = tar.extractfile("index.html")
+        assert f is not None and f.read() == b"2"
+
+    for argv in (
+        ["build", "--archive=site.rar"],
+        ["build", "--archive=site.zip", "--jobs=2"],
+        ["build", "--archive=site.zip", "--incremental"],
+        ["watch", "--archive=site.zip"],
+    ):
+        with pytest.raises(SystemExit) as pytest_wrapped_e:
+            cli.main([*argv, f"--srcpath={src}"])
+        assert pytest_wrapped_e.value.code == 1
+
+
+@pytest.mark.parametrize("option", ["--jobs", "--threads"])
+@pytest.mark.parametrize("count", ["0", "-2", "many"])
+@mock.patch("staticjinja.cli.staticjinja.Site.make_site")
+def test_bad_jobs(mock_make_site: mock.Mock, option: str, count: str) -> None:
+    """Test that an invalid `--jobs` or `--threads` exits early."""
+    with pytest.raises(SystemExit) as pytest_wrapped_e:
+        cli.main(["build", "--srcpath=.", f"{option}={count}"])
+    assert pytest_wrapped_e.value.code == 1
+    mock_make_site.assert_not_called()
 
 
 @mock.patch("staticjinja.cli.staticjinja.Site.make_site")
@@ -161,8 +424,10 @@ def test_entrypoints_no_args(command: list[str]) -> None:
         command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=5
     )
     expected_help_message = b"""Usage:
-  staticjinja build [options]
+  staticjinja build [options] [<pattern>...]
   staticjinja watch [options]
+  staticjinja serve [options]
+  staticjinja merge [options] <shard>...
   staticjinja -h | --help
   staticjinja --version
 """.replace(b"\n", os.linesep.encode("utf8"))
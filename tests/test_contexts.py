@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import asyncio
+import pickle
+from pathlib import Path
+
+import pytest
+from jinja2 import Template
+
+from staticjinja import Lazy, Site, cached_context
+from staticjinja.contexts import CachedContext, ContextCache
+from staticjinja.types import Context
+
+
+def section(template: Template) -> str:
+    assert template.name is not None
+    return template.name.split("/")[0]
+
+
+@cached_context(key=section)
+def section_context(template: Template) -> dict[str, str]:
+    return {"section": section(template)}
+
+
+def test_zero_arg_context_once_per_build(template_path: Path, build_path: Path) -> None:
+    for name in ["a.html", "b.html", "c.txt"]:
+        template_path.joinpath(name).write_text("{{ n }}")
+    calls: list[None] = []
+
+    def dataset() -> dict[str, int]:
+        calls.append(None)
+        return {"n": len(calls)}
+
+    site = Site.make_site(
+        searchpath=template_path,
+        outpath=build_path,
+        contexts=[(r".*\.html", dataset), (".*", {"n": 0})],
+    )
+    site.render()
+    assert len(calls) == 1
+    assert build_path.joinpath("a.html").read_text() == "1"
+    assert build_path.joinpath("b.html").read_text() == "1"
+    assert build_path.joinpath("c.txt").read_text() == "0"
+
+    # Each build starts afresh.
+    site.render(threads=2)
+    assert len(calls) == 2
+    assert build_path.joinpath("b.html").read_text() == "2"
+
+
+def test_cached_context(template_path: Path, build_path: Path) -> None:
+    calls: list[str | None] = []
+
+    @cached_context(key=section, maxsize=1)
+    def context(template: Template) -> dict[str, str]:
+        calls.append(template.name)
+        return {"section": section(template)}
+
+    assert isinstance(context, CachedContext)
+    assert context.__name__ == "context"  # type: ignore[attr-defined]
+    a1, a2, b = Template("a/1"), Template("a/2"), Template("b/1")
+    for tmpl, name in [(a1, "a/1"), (a2, "a/2"), (b, "b/1")]:
+        tmpl.name = name
+    assert context(a1) == context(a2) == {"section": "a"}
+    assert calls == ["a/1"]
+    assert context(b) == {"section": "b"}
+    # The least recently used result was dropped.
+    assert context(a2) == {"section": "a"}
+    assert calls == ["a/1", "b/1", "a/2"]
+
+    site = Site.make_site(searchpath=template_path, contexts=[(".*", context)])
+    site.clear_context_cache()
+    assert context(a1) == {"section": "a"}
+    assert calls == ["a/1", "b/1", "a/2", "a/1"]
+
+
+def test_cached_context_pickle() -> None:
+    assert pickle.loads(pickle.dumps(section_context)) is section_context
+
+
+def test_lazy_context(template_path: Path, build_path: Path) -> None:
+    template_path.joinpath("_b.html").write_text("{{ b }}")
+    template_path.joinpath("a.html").write_text("{{ a }}")
+    template_path.joinpath("b.html").write_text("{% include '_b.html' %}")
+    calls: list[str] = []
+
+    def compute(name: str) -> Lazy[str]:
+        def value() -> str:
+            calls.append(name)
+            return name.upper()
+
+        return Lazy(value)
+
+    def context() -> dict[str, Lazy[str]]:
+        return {name: compute(name) for name in "abc"}
+
+    site = Site.make_site(
+        searchpath=template_path, outpath=build_path, contexts=[(".*", context)]
+    )
+    site.render(incremental=True)
+    assert build_path.joinpath("a.html").read_text() == "A"
+    assert build_path.joinpath("b.html").read_text() == "B"
+    # Each value is computed once, and "c" is never used.
+    assert sorted(calls) == ["a", "b"]
+
+    # Only the values a template uses are part of its incremental build key.
+    calls.clear()
+    assert site.render(incremental=True).skipped == 2
+    assert sorted(calls) == ["a", "b"]
+
+
+def test_failures_not_cached() -> None:
+    """Test that a zero-argument context that raised is called again, both
+    when computed and when awaited."""
+    cache = ContextCache()
+    template = Template("")
+    calls: list[str] = []
+
+    def context() -> Context:
+        calls.append("sync")
+        if calls.count("sync") == 1:
+            raise ValueError("Not yet")
+        return {"a": 1}
+
+    async def acontext() -> Context:
+        calls.append("async")
+        if calls.count("async") == 1:
+            raise ValueError("Not yet")
+        return {"a": 2}
+
+    with pytest.raises(ValueError):
+        cache.compute(context, template)
+    assert cache.compute(context, template) == cache.compute(context, template)
+
+    async def compute_async() -> list[Context]:
+        with pytest.raises(ValueError):
+            await cache.acompute(acontext, template)
+        return [await cache.acompute(acontext, template) for _ in range(2)]
+
+    assert asyncio.run(compute_async()) == [{"a": 2}, {"a": 2}]
+    assert calls == ["sync", "sync", "async", "async"]
+
+
+def test_lazy() -> None:
+    calls: list[None] = []
+
+    def value() -> int:
+        calls.append(None)
+        return 42
+
+    lazy = Lazy(value)
+    computed = [lazy.computed]
+    assert lazy.get() == lazy.get() == 42
+    computed.append(lazy.computed)
+    assert computed == [False, True]
+    assert len(calls) == 1
+    assert repr(lazy).startswith("Lazy(<function")
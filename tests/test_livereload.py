@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import time
+import urllib.error
+import urllib.request
+
+from pytest import raises
+
+from staticjinja import LiveReload, livereload
+
+
+def test_livereload() -> None:
+    reload = LiveReload()
+    httpd = reload.serve_in_thread(port=0)
+    url = f"http://localhost:{httpd.server_address[1]}"
+    try:
+        with urllib.request.urlopen(url + livereload.SCRIPT_PATH) as response:
+            assert response.headers["Content-Type"].startswith("text/javascript")
+            assert livereload.EVENTS_PATH.encode() in response.read()
+        with raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url + "/index.html")
+        assert error.value.code == 404
+
+        with urllib.request.urlopen(url + livereload.EVENTS_PATH) as events:
+            assert events.headers["Content-Type"] == "text/event-stream"
+            assert events.readline() == b"retry: 1000\n"
+            assert events.readline() == b"\n"
+            for _ in range(100):
+                if reload.clients:
+                    break
+                time.sleep(0.01)
+            reload.publish(["b.html", "a.css"])
+            assert events.readline() == b"event: change\n"
+            assert events.readline() == b'data: ["a.css", "b.html"]\n'
+            assert events.readline() == b"\n"
+            reload.close()
+            assert events.read() == b""
+        assert reload.clients == 0
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
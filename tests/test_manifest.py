@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import json
+import os
+import stat
+from pathlib import Path
+
+from pytest import LogCaptureFixture, mark
+
+from staticjinja import BuildManifest
+from staticjinja.manifest import fingerprint_context, write_atomic, write_if_changed
+
+
+def test_round_trip(tmp_path: Path) -> None:
+    path = tmp_path / "cache" / "manifest.json"
+    manifest = BuildManifest.load(path)
+    assert manifest.previous == {}
+    manifest.record("index.html", "source-hash", "key")
+    manifest.save()
+
+    loaded = BuildManifest.load(path)
+    assert loaded.is_fresh("index.html", "key")
+    assert not loaded.is_fresh("index.html", "other-key")
+    assert not loaded.is_fresh("other.html", "key")
+    # Only what is recorded during a build is saved.
+    loaded.save()
+    assert BuildManifest.load(path).previous == {}
+
+
+def test_unreadable(tmp_path: Path, caplog: LogCaptureFixture) -> None:
+    path = tmp_path / "manifest.json"
+    path.write_text("not json")
+    assert BuildManifest.load(path).previous == {}
+    path.write_text(json.dumps({"version": -1, "templates": {"a": {}}}))
+    assert BuildManifest.load(path).previous == {}
+    assert "another version" in caplog.text
+
+
+def test_fingerprint_context() -> None:
+    assert fingerprint_context({"a": 1, "b": [1, 2]}) == fingerprint_context(
+        {"b": [1, 2], "a": 1}
+    )
+    assert fingerprint_context({"a": 1}) != fingerprint_context({"a": 2})
+    # Values that aren't JSON serializable are fingerprinted by their repr()
+    assert fingerprint_context({"p": Path("a")}) != fingerprint_context(
+        {"p": Path("b")}
+    )
+
+
+def test_write_if_changed(tmp_path: Path) -> None:
+    path = tmp_path / "sub" / "out.html"
+    assert write_if_changed(path, b"hello")
+    assert path.read_bytes() == b"hello"
+    assert not write_if_changed(path, b"hello")
+    # Same size, different content
+    assert write_if_changed(path, b"jello")
+    assert path.read_bytes() == b"jello"
+    assert write_if_changed(path, b"hello world")
+    assert path.read_bytes() == b"hello world"
+    # No temporary files are left behind.
+    assert [p.name for p in path.parent.iterdir()] == ["out.html"]
+
+
+@mark.skipif(os.name != "posix", reason="POSIX file modes")
+def test_write_atomic_mode(tmp_path: Path) -> None:
+    path = tmp_path / "out.html"
+    old_umask = os.umask(0o027)
+    try:
+        write_atomic(path, b"new")
+    finally:
+        os.umask(old_umask)
+    # New files follow the umask, and existing files keep their mode.
+    assert stat.S_IMODE(path.stat().st_mode) == 0o640
+    path.chmod(0o600)
+    write_atomic(path, b"changed")
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
+    assert path.read_bytes() == b"changed"
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import tarfile
+import typing as t
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from staticjinja import (
+    ArchiveOutput,
+    FileSystemOutput,
+    MemoryOutput,
+    Output,
+    RecordingOutput,
+)
+
+
+def test_output() -> None:
+    class WriteOnly(Output):
+        def write(self, name: str, chunks: t.Iterable[bytes]) -> None:
+            pass
+
+    # Outputs must also say whether files exist, and remove them.
+    with pytest.raises(TypeError, match="exists, remove"):
+        WriteOnly()  # type: ignore[abstract]
+
+
+def test_filesystem(tmp_path: Path) -> None:
+    output = FileSystemOutput(tmp_path / "out")
+    output.write("sub/a.html", [b"A", b"a"])
+    assert (tmp_path / "out" / "sub" / "a.html").read_bytes() == b"Aa"
+    assert output.exists("sub/a.html")
+    assert not output.write_if_changed("sub/a.html", b"Aa")
+    assert output.write_if_changed("sub/a.html", b"B")
+    src = tmp_path / "src.css"
+    src.write_text("css")
+    assert output.copy("static/src.css", src)
+    assert (tmp_path / "out" / "static" / "src.css").read_text() == "css"
+    output.remove("sub/a.html")
+    output.remove("sub/a.html")
+    assert not output.exists("sub/a.html")
+
+
+def test_memory(tmp_path: Path) -> None:
+    output = MemoryOutput()
+    output.write("a.html", iter([b"A", b"a"]))
+    assert not output.write_if_changed("a.html", b"Aa")
+    src = tmp_path / "src.css"
+    src.write_text("css")
+    assert output.copy("src.css", src)
+    assert output.files == {"a.html": b"Aa", "src.css": b"css"}
+    output.remove("a.html")
+    assert not output.exists("a.html")
+
+
+def test_recording(tmp_path: Path) -> None:
+    output = RecordingOutput(MemoryOutput())
+    output.write("a.html", [b"A"])
+    assert not output.write_if_changed("a.html", b"A")
+    assert output.take() == {"a.html"}
+    assert output.take() == set()
+    src = tmp_path / "src.css"
+    src.write_text("css")
+    assert output.copy("src.css", src)
+    output.remove("a.html")
+    output.remove("nope.html")
+    assert output.take() == {"a.html", "src.css"}
+    assert output.exists("src.css")
+
+
+@pytest.mark.parametrize("name", ["site.zip", "site.tar", "site.tar.gz"])
+def test_archive(tmp_path: Path, name: str) -> None:
+    src = tmp_path / "src.css"
+    src.write_text("css")
+    path = tmp_path / name
+    with ArchiveOutput(path) as output:
+        output.write("sub/a.html", [b"A", b"a"])
+        output.copy("static/src.css", src)
+        assert output.exists("sub/a.html")
+
+    if name.endswith(".zip"):
+        with zipfile.ZipFile(path) as zf:
+            assert zf.namelist() == ["sub/a.html", "static/src.css"]
+            assert zf.read("sub/a.html") == b"Aa"
+            assert zf.read("static/src.css") == b"css"
+    else:
+        with tarfile.open(path) as tf:
+            assert tf.getnames() == ["sub/a.html", "static/src.css"]
+            member = tf.extractfile("sub/a.html")
+            assert member is not None and member.read() == b"Aa"
+
+
+def test_archive_unknown(tmp_path: Path) -> None:
+    with pytest.raises(ValueError, match="Unknown archive type site.rar"):
+        ArchiveOutput(tmp_path / "site.rar")
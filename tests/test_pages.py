@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import csv
+import typing as t
+from pathlib import Path
+
+import pytest
+from jinja2 import Template
+
+from staticjinja import BuildError, CSVRows, Page, Pages, Shard, Site
+from staticjinja.types import Context
+
+
+def write_rows(path: Path, rows: t.Iterable[tuple[int, str]]) -> None:
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "title"])
+        writer.writerows(rows)
+
+
+def make_site(root_path: Path, template_path: Path, build_path: Path) -> Site:
+    write_rows(root_path / "products.csv", [(i, f"Product {i}") for i in range(10)])
+    template_path.joinpath("product.html").write_text("{{ item.title }} {{ n }}")
+    template_path.joinpath("index.html").write_text("Index")
+    pages = Pages(CSVRows(root_path / "products.csv"), "products/{item[id]}.html")
+    return Site.make_site(
+        searchpath=template_path,
+        outpath=build_path,
+        contexts=[("product.html", {"n": 1})],
+        rules=[("product.html", pages)],
+    )
+
+
+def test_pages() -> None:
+    read = []
+
+    def items() -> t.Iterator[int]:
+        for i in range(1, 8):
+            read.append(i)
+            yield i
+
+    pages = Pages(items, "blog/{page.number}.html", per_page=3).pages()
+    first = next(pages)
+    # Only the items of the next page are read ahead.
+    assert read == [1, 2, 3, 4, 5, 6]
+    assert (first.items, first.name, first.previous, first.next) == (
+        [1, 2, 3],
+        "blog/1.html",
+        None,
+        "blog/2.html",
+    )
+    last = list(pages)[-1]
+    assert (last.number, last.items, last.previous, last.next) == (
+        3,
+        [7],
+        "blog/2.html",
+        None,
+    )
+
+    def name(page: Page) -> str:
+        return "index.html" if page.number == 1 else f"{page.number}.html"
+
+    names = [p.name for p in Pages(range(5), name, per_page=2).pages()]
+    assert names == ["index.html", "2.html", "3.html"]
+    assert list(Pages([], "{item}.html").pages()) == []
+    with pytest.raises(ValueError):
+        Pages([], "{item}.html", per_page=0)
+
+
+def test_csv_rows(tmp_path: Path) -> None:
+    path = tmp_path / "rows.csv"
+    path.write_text("id;title\n1;One\n2;Two\n")
+    rows = CSVRows(path, delimiter=";")
+    assert list(rows) == [{"id": "1", "title": "One"}, {"id": "2", "title": "Two"}]
+    # It is read again each time.
+    assert len(list(rows)) == 2
+
+
+@pytest.mark.parametrize("workers, threads", [(1, 1), (1, 4), (2, 1)])
+def test_render_pages(
+    root_path: Path,
+    template_path: Path,
+    build_path: Path,
+    files: t.Callable[..., dict[str, bytes]],
+    workers: int,
+    threads: int,
+) -> None:
+    site = make_site(root_path, template_path, build_path)
+    summary = site.render(workers=workers, threads=threads)
+    expected = {f"products/{i}.html": f"Product {i} 1".encode() for i in range(10)}
+    assert files(build_path, hidden=False) == {"index.html": b"Index", **expected}
+    assert summary.rendered == 11
+
+
+def test_render_pages_incremental(
+    root_path: Path, template_path: Path, build_path: Path
+) -> None:
+    site = make_site(root_path, template_path, build_path)
+    assert site.render(incremental=True).rendered == 11
+    summary = site.render(incremental=True)
+    assert (summary.rendered, summary.skipped) == (0, 11)
+
+    # Only the pages whose items changed are rendered again.
+    rows = [(i, f"Product {i}") for i in range(10)]
+    rows[3] = (3, "New product")
+    write_rows(root_path / "products.csv", rows)
+    (build_path / "products/5.html").unlink()
+    summary = site.render(incremental=True)
+    assert (summary.rendered, summary.skipped) == (2, 9)
+    assert (build_path / "products/3.html").read_text() == "New product 1"
+
+    # And all of them when the template changes.
+    template_path.joinpath("product.html").write_text("{{ item.title }}!")
+    summary = site.render(incremental=True)
+    assert (summary.rendered, summary.skipped) == (10, 1)
+
+
+def test_render_pages_errors(
+    root_path: Path, template_path: Path, build_path: Path
+) -> None:
+    site = make_site(root_path, template_path, build_path)
+    template_path.joinpath("product.html").write_text("{{ 1 // item.id|int }}")
+    with pytest.raises(BuildError) as error:
+        site.render(threads=4)
+    assert list(error.value.errors) == ["products/0.html"]
+    assert (build_path / "products/9.html").read_text() == "0"
+
+
+def failing_context(template: Template) -> Context:
+    raise ValueError("No context")
+
+
+def test_render_pages_workers_errors(
+    root_path: Path, template_path: Path, build_path: Path
+) -> None:
+    site = make_site(root_path, template_path, build_path)
+    site.contexts = [("product.html", failing_context)]
+    with pytest.raises(BuildError) as error:
+        site.render(workers=2)
+    # The template failed, not the first page of its batch.
+    assert list(error.value.errors) == ["product.html"]
+
+
+def test_render_pages_shards(
+    root_path: Path,
+    template_path: Path,
+    build_path: Path,
+    files: t.Callable[..., dict[str, bytes]],
+) -> None:
+    site = make_site(root_path, template_path, build_path)
+    site.render()
+    full = files(build_path, hidden=False)
+    merged: dict[str, bytes] = {}
+    for i in range(1, 4):
+        site.outpath = root_path / f"shard{i}"
+        site.render(shard=Shard(i, 3))
+        shard = files(root_path / f"shard{i}", hidden=False)
+        assert 0 < len(shard) < len(full)
+        assert not set(shard).intersection(merged)
+        merged.update(shard)
+    assert merged == full
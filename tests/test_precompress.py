@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import gzip
+import json
+from pathlib import Path
+
+from pytest import LogCaptureFixture, MonkeyPatch
+
+from staticjinja import MemoryOutput, Precompressor, precompress
+
+
+def test_gzip_compress_is_reproducible() -> None:
+    data = b"<p>hello</p>" * 100
+    compressed = precompress.gzip_compress(data)
+    assert gzip.decompress(compressed) == data
+    assert precompress.gzip_compress(data) == compressed
+
+
+def test_wants() -> None:
+    precompressor = Precompressor("unused.json", min_size=10)
+    assert precompressor.wants("index.html")
+    assert precompressor.wants("css/APP.CSS", 10)
+    assert not precompressor.wants("index.html", 9)
+    assert not precompressor.wants("image.png", 100)
+
+
+def test_submit(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(precompress, "codecs", lambda: {".gz": gzip.compress})
+    path = tmp_path / "precompressed.json"
+    output = MemoryOutput()
+    html = b"<p>hello</p>" * 100
+    precompressor = Precompressor.load(path, min_size=100, threads=2)
+    precompressor.submit(output, "index.html", html)
+    precompressor.submit(output, "small.html", b"<p>hi</p>")
+    precompressor.submit(output, "image.png", html)
+    static = tmp_path / "app.css"
+    static.write_bytes(b"a {}" * 100)
+    precompressor.submit_file(output, "app.css", static)
+    assert precompressor.wait() == {}
+    assert sorted(output.files) == ["app.css.gz", "index.html.gz"]
+    assert gzip.decompress(output.files["index.html.gz"]) == html
+    assert set(json.loads(path.read_text())["files"]) == {"app.css", "index.html"}
+
+    # Unchanged files aren't compressed again, even by a new build.
+    output.files["index.html.gz"] = b"stale"
+    loaded = Precompressor.load(path, min_size=100)
+    loaded.submit(output, "index.html", html)
+    loaded.wait()
+    assert output.files["index.html.gz"] == b"stale"
+    loaded.submit(output, "index.html", html + b"!")
+    loaded.wait()
+    assert gzip.decompress(output.files["index.html.gz"]) == html + b"!"
+
+    # Nor are missing copies left missing.
+    del output.files["app.css.gz"]
+    loaded.submit_file(output, "app.css", static)
+    loaded.wait()
+    assert "app.css.gz" in output.files
+
+    # Copies of files that got too small are removed.
+    loaded.submit(output, "index.html", b"<p>hi</p>")
+    loaded.remove(output, "app.css")
+    loaded.wait()
+    assert output.files == {}
+    assert json.loads(path.read_text())["files"] == {}
+
+
+def test_errors(tmp_path: Path, caplog: LogCaptureFixture) -> None:
+    class FullOutput(MemoryOutput):
+        def write_if_changed(self, name: str, data: bytes) -> bool:
+            raise OSError("No space left on device")
+
+    precompressor = Precompressor(tmp_path / "precompressed.json", min_size=0)
+    precompressor.submit(FullOutput(), "index.html", b"<p>hello</p>")
+    errors = precompressor.wait()
+    assert list(errors) == ["index.html"]
+    assert "Error compressing index.html" in caplog.text
+    assert precompressor.entries == {}
+
+
+def test_unreadable(tmp_path: Path, caplog: LogCaptureFixture) -> None:
+    path = tmp_path / "precompressed.json"
+    path.write_text("not json")
+    assert Precompressor.load(path).entries == {}
+    assert "Ignoring unreadable precompression record" in caplog.text
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import csv
+import json
+import pickle
+from pathlib import Path
+
+import pytest
+
+from staticjinja import BuildProfile
+from staticjinja.profiler import PHASES
+
+
+def test_profile(tmp_path: Path) -> None:
+    profile = BuildProfile()
+    profile.add("a.html", "render", 0.5)
+    profile.add("a.html", "write", 0.25)
+    profile.add("b.html", "render", 1.0)
+    profile.wrote("a.html", 10)
+    profile.count("get_context")
+
+    other = pickle.loads(pickle.dumps(BuildProfile()))
+    with other.time("c.html", "load"):
+        pass
+    other.add("a.html", "render", 0.5)
+    other.count("get_context")
+    profile.merge(other)
+
+    assert profile.total("a.html") == 1.25
+    assert profile.slowest(2) == ["a.html", "b.html"]
+    assert profile.calls == {"get_context": 2}
+    assert profile.rows()[0] == {
+        "name": "a.html",
+        "load": 0.0,
+        "context": 0.0,
+        "rule": 0.0,
+        "render": 1.0,
+        "write": 0.25,
+        "total": 1.25,
+        "bytes": 10,
+    }
+
+    table = profile.format(1).splitlines()
+    assert table[0].split() == ["template", *PHASES, "total", "bytes"]
+    assert table[1].split()[0] == "a.html"
+    assert table[2] == f"3 templates, {profile.total('c.html') + 2.25:.4f}s in total."
+    assert table[3] == "Calls: get_context: 2."
+
+    profile.write(tmp_path / "profile.json")
+    report = json.loads((tmp_path / "profile.json").read_text())
+    assert [row["name"] for row in report["templates"]] == profile.slowest()
+    assert report["calls"] == {"get_context": 2}
+    profile.write(tmp_path / "profile.csv")
+    with open(tmp_path / "profile.csv", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["name"] for row in rows] == profile.slowest()
+    assert rows[0]["bytes"] == "10"
+
+    for name in ["profile.json", "profile.csv"]:
+        loaded = BuildProfile.load(tmp_path / name)
+        assert loaded.rows() == profile.rows()
+    assert BuildProfile.load(tmp_path / "profile.json").calls == profile.calls
+    (tmp_path / "other.json").write_text('{"version": 1}')
+    with pytest.raises(ValueError, match="not a build profile"):
+        BuildProfile.load(tmp_path / "other.json")
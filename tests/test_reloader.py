@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import threading
+import time
+import typing as t
 from pathlib import Path
 
 import pytest
+from jinja2 import Template
 
 import staticjinja
 
@@ -42,6 +46,33 @@ def test_event_handler(
     assert rendered == [reloader.site.get_template("template1.html")]
 
 
+def test_event_handler_partial(
+    monkeypatch: pytest.MonkeyPatch,
+    reloader: staticjinja.Reloader,
+    template_path: Path,
+) -> None:
+    rendered = []
+
+    def fake_renderer(template, context=None, filepath=None):
+        rendered.append(template.name)
+
+    monkeypatch.setattr(reloader.site, "render_template", fake_renderer)
+
+    partial = template_path / "_partial1.html"
+    reloader.event_handler("modified", str(partial))
+    # No template references it, but template2.html's rule may load it.
+    assert rendered == ["template2.html"]
+
+    # A template that starts including the partial is picked up once it is saved.
+    template_path.joinpath("template1.html").write_text(
+        "{% include '_partial1.html' %}"
+    )
+    reloader.event_handler("modified", str(template_path / "template1.html"))
+    rendered.clear()
+    reloader.event_handler("modified", str(partial))
+    assert rendered == ["template1.html", "template2.html"]
+
+
 def test_event_handler_static(
     monkeypatch: pytest.MonkeyPatch,
     reloader: staticjinja.Reloader,
@@ -73,3 +104,211 @@ def test_watch_template_render_error(
 
     assert "Template error in bad.html:" in caplog.text
     assert "Expected an expression" in caplog.text
+
+
+def test_handle_batch(
+    monkeypatch: pytest.MonkeyPatch,
+    reloader: staticjinja.Reloader,
+    template_path: Path,
+) -> None:
+    rendered = []
+
+    def fake_renderer(template, context=None, filepath=None):
+        rendered.append(template.name)
+
+    monkeypatch.setattr(reloader.site, "render_template", fake_renderer)
+    for name in ["template1.html", "template2.html"]:
+        template_path.joinpath(name).write_text("{% include '_partial1.html' %}")
+    partial = str(template_path / "_partial1.html")
+    template1 = str(template_path / "template1.html")
+    reloader.handle_batch(
+        [("modified", partial), ("modified", template1), ("modified", partial)]
+    )
+    # Each dependent is rendered once.
+    assert rendered == ["template1.html", "template2.html"]
+
+
+def test_next_batch(reloader: staticjinja.Reloader, template_path: Path) -> None:
+    partial = str(template_path / "_partial1.html")
+    template1 = str(template_path / "template1.html")
+    reloader.debounce = 0.05
+    reloader.queue_event("created", template1)
+
+    def more_events():
+        reloader.queue_event("modified", partial)
+        reloader.queue_event("modified", template1)
+
+    timer = threading.Timer(0.01, more_events)
+    timer.start()
+    start = time.monotonic()
+    batch = reloader.next_batch()
+    timer.join()
+    assert time.monotonic() - start >= 0.05
+    assert batch == [("modified", template1), ("modified", partial)]
+
+
+def test_handle_batch_interrupted(
+    monkeypatch: pytest.MonkeyPatch,
+    reloader: staticjinja.Reloader,
+    template_path: Path,
+) -> None:
+    rendered: list[str | None] = []
+    template1 = str(template_path / "template1.html")
+
+    def fake_renderer(template, context=None, filepath=None):
+        if not rendered:
+            # Saved again while the batch is rendering.
+            reloader.queue_event("modified", template1)
+        rendered.append(template.name)
+
+    monkeypatch.setattr(reloader.site, "render_template", fake_renderer)
+    for name in ["template1.html", "template2.html", "template4.html"]:
+        template_path.joinpath(name).write_text("{% include '_partial1.html' %}")
+    reloader.handle_batch([("modified", str(template_path / "_partial1.html"))])
+    assert rendered == ["template1.html"]
+
+    # The next batch picks up what the interrupted one didn't get to.
+    reloader.handle_batch(reloader.next_batch())
+    assert rendered == [
+        "template1.html",
+        "template2.html",
+        "template4.html",
+        "template1.html",
+    ]
+
+
+def test_event_handler_deleted(
+    monkeypatch: pytest.MonkeyPatch,
+    reloader: staticjinja.Reloader,
+    template_path: Path,
+    build_path: Path,
+) -> None:
+    site = reloader.site
+    site.staticpaths = ["static_css"]
+    template_path.joinpath("template1.html").write_text("{% include '_nav.html' %}")
+    template_path.joinpath("_nav.html").write_text("Nav")
+    site.render()
+    rendered = []
+
+    def fake_renderer(template, context=None, filepath=None):
+        rendered.append(template.name)
+
+    monkeypatch.setattr(site, "render_template", fake_renderer)
+
+    # The outputs of deleted templates and static files are removed.
+    for name in ["sub/template3.html", "static_css/hello.css"]:
+        template_path.joinpath(name).unlink()
+        reloader.event_handler("deleted", str(template_path / name))
+        assert not build_path.joinpath(name).exists()
+    assert rendered == []
+    assert "sub/template3.html" not in site.dependencies
+
+    # Templates that used a deleted partial are rebuilt.
+    template_path.joinpath("_nav.html").unlink()
+    reloader.event_handler("deleted", str(template_path / "_nav.html"))
+    assert rendered == ["template1.html", "template2.html"]
+    assert "_nav.html" not in site.dependencies
+
+
+def test_event_handler_moved(
+    monkeypatch: pytest.MonkeyPatch,
+    reloader: staticjinja.Reloader,
+    template_path: Path,
+    build_path: Path,
+) -> None:
+    reloader.site.render()
+    old, new = template_path / "template1.html", template_path / "renamed.html"
+    old.rename(new)
+    reloader.event_handler("moved", str(old), str(new))
+    assert not build_path.joinpath("template1.html").exists()
+    assert build_path.joinpath("renamed.html").read_text() == "Test 1"
+    assert "renamed.html" in reloader.site.dependencies
+
+    # Moving a file out of the searchpath deletes it.
+    outside = template_path.parent / "outside.html"
+    new.rename(outside)
+    reloader.queue_event("moved", str(new), str(outside))
+    reloader.handle_batch(reloader.next_batch())
+    assert not build_path.joinpath("renamed.html").exists()
+
+
+def test_callbacks(site: staticjinja.Site, template_path: Path) -> None:
+    site.write_if_changed = True
+    site.render()
+    batches: list[list[str]] = []
+
+    def fail(changed: list[str]) -> None:
+        raise RuntimeError("broken callback")
+
+    reloader = staticjinja.Reloader(site, callbacks=[fail, batches.append])
+    template_path.joinpath("template1.html").write_text("Changed")
+    reloader.handle_batch(
+        [
+            ("modified", str(template_path / "template1.html")),
+            ("modified", str(template_path / "template2.html")),
+        ]
+    )
+    # Only the files whose content changed are passed on, after an error in
+    # another callback.
+    assert batches == [["template1.html"]]
+    assert not isinstance(site.output, staticjinja.RecordingOutput)
+
+    reloader.handle_batch([("modified", str(template_path / "template2.html"))])
+    assert batches == [["template1.html"]]
+
+
+def test_handle_batch_rule_layout(root_path: Path, template_path: Path) -> None:
+    """Test that a layout that only a rule loads is picked up, as in the
+    markdown example."""
+    posts = template_path / "posts"
+    posts.mkdir()
+    posts.joinpath("post1.md").write_text("Post")
+    layout = template_path / "_post.html"
+    layout.write_text("<p>{{ content }}</p>")
+
+    def render_md(site: staticjinja.Site, template: Template, **kwargs: t.Any) -> None:
+        assert template.filename is not None
+        content = Path(template.filename).read_text()
+        out = Path(str(template.name)).with_suffix(".html")
+        site.write(out, site.get_template("_post.html").render(content=content))
+
+    site = staticjinja.Site.make_site(
+        searchpath=template_path,
+        outpath=root_path / "build",
+        rules=[(r".*\.md", render_md)],
+    )
+    site.render()
+    layout.write_text("<div>{{ content }}</div>")
+    staticjinja.Reloader(site).handle_batch([("modified", str(layout))])
+    assert (root_path / "build/posts/post1.html").read_text() == "<div>Post</div>"
+
+
+def test_handle_batch_rule_error(
+    site: staticjinja.Site,
+    caplog: pytest.LogCaptureFixture,
+    template_path: Path,
+    build_path: Path,
+) -> None:
+    """Test that an error raised by a rule is logged, and that the rest of the
+    batch and later changes are still rebuilt."""
+
+    def broken(site: staticjinja.Site, template: Template, **kwargs: t.Any) -> None:
+        raise RuntimeError("Broken rule")
+
+    site.rules = [("template2.html", broken)]
+    reloader = staticjinja.Reloader(site)
+    template1 = template_path / "template1.html"
+    template1.write_text("One")
+    reloader.handle_batch(
+        [
+            ("modified", str(template_path / "template2.html")),
+            ("modified", str(template1)),
+        ]
+    )
+    assert "Error rebuilding template2.html" in caplog.text
+    assert "RuntimeError: Broken rule" in caplog.text
+    assert (build_path / "template1.html").read_text() == "One"
+
+    template1.write_text("Two")
+    reloader.handle_batch([("modified", str(template1))])
+    assert (build_path / "template1.html").read_text() == "Two"
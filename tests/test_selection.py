@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from staticjinja import Selection, Site, changed_since
+from staticjinja.selection import git_changes
+
+
+def test_selection() -> None:
+    names = ["index.html", "blog/post.html", "blog/post.md", "static/app.css"]
+    assert Selection(["blog/*"]).select(names) == ["blog/post.html", "blog/post.md"]
+    assert Selection(["*.html"]).select(names) == ["index.html", "blog/post.html"]
+    assert Selection([r"blog/.*\.md", "static/"], regex=True).select(names) == [
+        "blog/post.md",
+        "static/app.css",
+    ]
+    changed = {"index.html", "blog/post.md"}.__contains__
+    assert Selection(changed=changed).select(names) == ["index.html", "blog/post.md"]
+    assert Selection(["blog/*"], changed=changed).select(names) == ["blog/post.md"]
+    assert Selection().select(names) == names
+
+
+def test_changed_since_file(tmp_path: Path) -> None:
+    for name in ["old.html", "new.html"]:
+        tmp_path.joinpath(name).write_text(name)
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text("{}")
+    os.utime(tmp_path / "old.html", ns=(0, 0))
+    os.utime(manifest, ns=(10**18, 10**18))
+    os.utime(tmp_path / "new.html", ns=(2 * 10**18, 2 * 10**18))
+    changed = changed_since(tmp_path, str(manifest))
+    assert [changed(n) for n in ["old.html", "new.html", "gone.html"]] == [
+        False,
+        True,
+        True,
+    ]
+
+
+def test_git_changes(tmp_path: Path) -> None:
+    def git(*args: str) -> None:
+        subprocess.run(["git", "-C", str(tmp_path), *args], check=True)
+
+    git("init", "-q")
+    git("config", "user.email", "test@example.com")
+    git("config", "user.name", "Test")
+    templates = tmp_path / "templates"
+    templates.mkdir()
+    for name in ["a.html", "b.html", "c.html"]:
+        templates.joinpath(name).write_text(name)
+    tmp_path.joinpath("build.py").write_text("")
+    git("add", ".")
+    git("commit", "-q", "-m", "Initial")
+    templates.joinpath("a.html").write_text("changed")
+    templates.joinpath("b.html").unlink()
+    templates.joinpath("d.html").write_text("new")
+    tmp_path.joinpath("build.py").write_text("changed")
+
+    assert git_changes(templates, "HEAD") == {"a.html", "b.html", "d.html"}
+    assert changed_since(templates, "HEAD")("a.html")
+    for rev in ["nope", "--output=x"]:
+        with pytest.raises(ValueError):
+            git_changes(templates, rev)
+
+
+def test_render_only(template_path: Path, build_path: Path) -> None:
+    template_path.joinpath("_base.html").write_text("{% block b %}{% endblock %}")
+    template_path.joinpath("_css.html").write_text("{{ asset_url('static/app.css') }}")
+    template_path.joinpath("index.html").write_text(
+        "{% extends '_base.html' %}{% block b %}{% include '_css.html' %}{% endblock %}"
+    )
+    template_path.joinpath("about.html").write_text("{% extends '_base.html' %}")
+    template_path.joinpath("plain.html").write_text("Plain")
+    static = template_path / "static"
+    static.mkdir()
+    static.joinpath("app.css").write_text("a {}")
+    static.joinpath("other.css").write_text("b {}")
+    site = Site.make_site(searchpath=template_path, outpath=build_path)
+    site.staticpaths = ["static"]
+
+    def built(only: Selection) -> list[str]:
+        for path in sorted(build_path.rglob("*"), reverse=True):
+            path.unlink() if path.is_file() else path.rmdir()
+        site.render(only=only)
+        return sorted(
+            p.relative_to(build_path).as_posix()
+            for p in build_path.rglob("*")
+            if p.is_file() and not p.name.startswith(".")
+        )
+
+    # Selected partials are expanded to the templates that depend on them.
+    assert built(Selection(["_base.html"])) == ["about.html", "index.html"]
+    assert built(Selection(["*.css"])) == ["static/app.css", "static/other.css"]
+    assert built(Selection([r"p", r"static/o"], regex=True)) == [
+        "plain.html",
+        "static/other.css",
+    ]
+
+    # With fingerprinting, so are static files, to the templates that may
+    # get their URLs.
+    site.fingerprint_static = True
+    assert built(Selection(["static/app.css"])) == [
+        "index.html",
+        "static/app.9a4487cc.css",
+    ]
+
+    # Incremental builds keep the entries of the templates that aren't built.
+    site.render(incremental=True)
+    summary = site.render(incremental=True, only=Selection(["plain.html"]))
+    assert (summary.rendered, summary.skipped) == (0, 1)
+    manifest = json.loads((build_path / ".staticjinja-manifest.json").read_text())
+    assert sorted(manifest["templates"]) == ["about.html", "index.html", "plain.html"]
+
+    # Deleted files are expanded to the templates that still reference them.
+    template_path.joinpath("nav.html").write_text(
+        "{% include '_nav.html' ignore missing %}"
+    )
+    assert built(Selection(changed={"_nav.html"}.__contains__)) == ["nav.html"]
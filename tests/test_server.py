@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import threading
+import typing as t
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+from jinja2 import Template
+from pytest import raises
+
+from staticjinja import Server, Site
+from staticjinja.server import _inject_script
+
+
+def rule(site: Site, template: Template, **kwargs: t.Any) -> None:
+    assert template.name is not None
+    site.write(template.name.replace(".md", ".html"), template.render(**kwargs))
+
+
+def make_server(template_path: Path, build_path: Path) -> Server:
+    template_path.joinpath("_base.html").write_text("<h1>{% block b %}{% endblock %}")
+    template_path.joinpath("index.html").write_text(
+        "{% extends '_base.html' %}{% block b %}Home{% endblock %}"
+    )
+    template_path.joinpath("about.html").write_text("About")
+    blog = template_path / "blog"
+    blog.mkdir()
+    blog.joinpath("index.html").write_text("Blog")
+    blog.joinpath("post.md").write_text("Post")
+    blog.joinpath("other.md").write_text("Other")
+    static = template_path / "static"
+    static.mkdir()
+    static.joinpath("app.css").write_text("a {}")
+    site = Site.make_site(
+        searchpath=template_path, outpath=build_path, rules=[(r".*\.md", rule)]
+    )
+    site.staticpaths = ["static"]
+    return Server(site, port=0)
+
+
+def test_get(template_path: Path, build_path: Path) -> None:
+    server = make_server(template_path, build_path)
+    assert server.get("/") == ("index.html", b"<h1>Home")
+    assert server.get("/about.html") == ("about.html", b"About")
+    assert server.get("/blog") == ("blog/index.html", b"Blog")
+    assert server.get("/static/app.css") == ("static/app.css", b"a {}")
+    assert server.get("/blog/post.html") == ("blog/post.html", b"Post")
+    # Only the pages that were requested were rendered, and nothing was
+    # written to the outpath.
+    assert sorted(server.output.files) == [
+        "about.html",
+        "blog/index.html",
+        "blog/post.html",
+        "index.html",
+        "static/app.css",
+    ]
+    assert list(build_path.iterdir()) == []
+
+    # Other files are looked for by running all the rules, once.
+    assert server.get("/nope.html") is None
+    assert "blog/other.html" in server.output.files
+    assert server.get("/blog/other.html") == ("blog/other.html", b"Other")
+    assert server.get("/../templates/about.html") is None
+
+
+def test_invalidate(template_path: Path, build_path: Path) -> None:
+    server = make_server(template_path, build_path)
+    server.get("/")
+    server.get("/about.html")
+    server.get("/blog/post.html")
+    template_path.joinpath("_base.html").write_text("<h2>{% block b %}{% endblock %}")
+    template_path.joinpath("blog", "post.md").write_text("New post")
+    server.reloader.handle_batch(
+        [
+            ("modified", str(template_path / "_base.html")),
+            ("modified", str(template_path / "blog" / "post.md")),
+        ]
+    )
+    # Only the pages that depend on the changes are dropped.
+    assert sorted(server.output.files) == ["about.html"]
+    assert server.get("/") == ("index.html", b"<h2>Home")
+    assert server.get("/blog/post.html") == ("blog/post.html", b"New post")
+
+    template_path.joinpath("blog", "post.md").unlink()
+    server.reloader.handle_batch([("deleted", str(template_path / "blog/post.md"))])
+    assert server.get("/blog/post.html") is None
+
+
+def test_http(template_path: Path, build_path: Path) -> None:
+    server = make_server(template_path, build_path)
+    template_path.joinpath("broken.html").write_text("{{ 1 / 0 }}")
+    httpd = server.http_server()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://localhost:{server.port}"
+    try:
+        with urllib.request.urlopen(url + "/blog") as response:
+            assert response.url == url + "/blog/"
+            # The live reload script is added to pages.
+            assert response.read() == (
+                b'Blog<script src="/_staticjinja/livereload.js"></script>'
+            )
+        with urllib.request.urlopen(url + "/_staticjinja/livereload.js") as response:
+            assert b"EventSource" in response.read()
+        with urllib.request.urlopen(url + "/static/app.css") as response:
+            assert response.headers["Content-Type"] == "text/css; charset=utf8"
+        with raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url + "/nope.html")
+        assert error.value.code == 404
+        with raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url + "/broken.html")
+        assert error.value.code == 500
+        assert b"ZeroDivisionError" in error.value.read()
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_livereload(template_path: Path, build_path: Path) -> None:
+    server = make_server(template_path, build_path)
+    assert server.livereload is not None
+    assert server.reloader.callbacks == [server.livereload.publish]
+    published: list[list[str]] = []
+    server.reloader.callbacks = [published.append]
+    server.get("/")
+    server.get("/about.html")
+    template_path.joinpath("_base.html").write_text("<h2>{% block b %}{% endblock %}")
+    server.reloader.handle_batch([("modified", str(template_path / "_base.html"))])
+    # The pages that were dropped are published, so browsers reload them.
+    assert published == [["index.html"]]
+
+    assert _inject_script(b"<body>a</body>") == (
+        b'<body>a<script src="/_staticjinja/livereload.js"></script></body>'
+    )
+    off = Server(server.site, port=0, livereload=False)
+    assert off.livereload is None
+    assert off.reloader.callbacks == []
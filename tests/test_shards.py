@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import sys
+import typing as t
+from pathlib import Path
+
+import pytest
+
+from staticjinja import BuildError, FileSystemOutput, Shard, Site, merge_shards
+from staticjinja.manifest import MANIFEST_NAME
+from staticjinja.shards import partition
+
+
+def make_templates(template_path: Path) -> None:
+    template_path.joinpath("_base.html").write_text(
+        "<link href=\"{{ asset_url('static/app.css') }}\">{% block b %}{% endblock %}"
+    )
+    for i in range(20):
+        page = template_path / f"pages/page{i}.html"
+        page.parent.mkdir(exist_ok=True)
+        page.write_text(
+            f"{{% extends '_base.html' %}}{{% block b %}}{i}{{% endblock %}}"
+        )
+    static = template_path / "static"
+    static.mkdir()
+    for i in range(5):
+        static.joinpath(f"file{i}.txt").write_text(str(i))
+    static.joinpath("app.css").write_text("a {}")
+
+
+def test_partition() -> None:
+    names = [f"page{i}.html" for i in range(100)]
+    shards = partition(names, 3)
+    assert sorted(n for shard in shards for n in shard) == sorted(names)
+    assert partition(names, 3) == shards
+    assert all(shard == sorted(shard, key=names.index) for shard in shards)
+    # Adding a name doesn't move the others.
+    for old, new in zip(shards, partition([*names, "new.html"], 3)):
+        assert [n for n in new if n != "new.html"] == old
+
+    # Costs are balanced, and names without a cost get the average.
+    costs = {"a": 6.0, "b": 3.0, "c": 2.0, "d": 1.0}
+    assert partition(["a", "b", "c", "d", "e"], 2, costs) == [
+        ["a", "c"],
+        ["b", "d", "e"],
+    ]
+    assert partition(["a", "b"], 3, costs) == [["a"], ["b"], []]
+
+
+def test_shard() -> None:
+    shard = Shard.parse("2/3")
+    assert (shard.index, shard.count, str(shard)) == (2, 3, "2/3")
+    names = [f"page{i}.html" for i in range(10)]
+    assert shard.select(names) == partition(names, 3)[1]
+    costs = dict.fromkeys(names, 1.0)
+    costs["page0.html"] = 100.0
+    assert Shard(1, 3, costs).select(names) == ["page0.html"]
+    assert Shard(1, 3, costs).select(names, balance=False) == partition(names, 3)[0]
+    for spec in ["2", "0/3", "4/3", "a/b", "-1/3"]:
+        with pytest.raises(ValueError):
+            Shard.parse(spec)
+
+
+def test_render_shards(
+    root_path: Path, template_path: Path, files: t.Callable[..., dict[str, bytes]]
+) -> None:
+    make_templates(template_path)
+
+    def build(outpath: Path, shard: Shard | None = None) -> None:
+        site = Site.make_site(
+            searchpath=template_path, outpath=outpath, fingerprint_static=True
+        )
+        site.staticpaths = ["static"]
+        site.render(incremental=True, shard=shard)
+
+    build(root_path / "full")
+    for i in range(1, 4):
+        build(root_path / f"shard{i}", Shard(i, 3))
+    shard_files = [files(root_path / f"shard{i}") for i in range(1, 4)]
+    # Each shard only built some of the pages.
+    assert all(0 < len(f) < len(files(root_path / "full")) for f in shard_files)
+
+    merged = root_path / "merged"
+    sources = [root_path / f"shard{i}" for i in range(1, 4)]
+    with FileSystemOutput(merged) as output:
+        merge_shards(sources, output, merged)
+    full = files(root_path / "full")
+    assert files(merged) == full
+    assert json.loads(full[MANIFEST_NAME])["templates"]
+
+    # The merged records let later builds of the whole site be incremental.
+    site = Site.make_site(searchpath=template_path, outpath=merged)
+    site.staticpaths = ["static"]
+    site.fingerprint_static = True
+    assert site.render(incremental=True).skipped == 20
+
+
+def test_merge_conflicts(
+    tmp_path: Path, files: t.Callable[..., dict[str, bytes]]
+) -> None:
+    for name, content in [("a", "same"), ("b", "other")]:
+        tmp_path.joinpath(name, "sub").mkdir(parents=True)
+        tmp_path.joinpath(name, "sub", "same.txt").write_text("same")
+        tmp_path.joinpath(name, "sub", "differs.txt").write_text(content)
+        tmp_path.joinpath(name, f"{name}.txt").write_text(name)
+    output = tmp_path / "out"
+    with pytest.raises(BuildError) as error:
+        merge_shards([tmp_path / "a", tmp_path / "b"], FileSystemOutput(output))
+    assert list(error.value.errors) == ["sub/differs.txt"]
+    assert files(output) == {
+        "a.txt": b"a",
+        "b.txt": b"b",
+        "sub/differs.txt": b"same",
+        "sub/same.txt": b"same",
+    }
+
+
+def test_cli(
+    root_path: Path, template_path: Path, files: t.Callable[..., dict[str, bytes]]
+) -> None:
+    """Build the shards in separate processes, as if on separate machines."""
+    make_templates(template_path)
+    command = [sys.executable, "-m", "staticjinja"]
+    options = ["--static=static", "--fingerprint-static", "--log=error"]
+    subprocess.run([*command, "build", "--outpath=full", *options], check=True)
+    costs = root_path / "costs.json"
+    costs.write_text(json.dumps({"templates": [{"name": "_base.html", "total": 1}]}))
+    shards = [
+        subprocess.Popen(
+            [
+                *command,
+                "build",
+                f"--outpath=shard{i}",
+                f"--shard={i}/3",
+                f"--shard-costs={costs}",
+                *options,
+            ]
+        )
+        for i in range(1, 4)
+    ]
+    assert [shard.wait() for shard in shards] == [0, 0, 0]
+    subprocess.run(
+        [*command, "merge", "--outpath=merged", "shard1", "shard2", "shard3"],
+        check=True,
+    )
+    assert files(root_path / "merged") == files(root_path / "full")
+
+    result = subprocess.run(
+        [*command, "build", "--shard=4/3"], capture_output=True, check=False
+    )
+    assert result.returncode == 1
+    assert b"Shard 4 of 3 doesn't exist" in result.stdout
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+
+from staticjinja.static import STRATEGIES, copy_file, is_unchanged
+
+
+@pytest.fixture
+def src(tmp_path: Path) -> Path:
+    src = tmp_path / "src.txt"
+    src.write_text("hello")
+    return src
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_copy_file(tmp_path: Path, src: Path, strategy: str) -> None:
+    dst = tmp_path / "dst.txt"
+    dst.write_text("old")
+    assert copy_file(src, dst, strategy)
+    assert dst.read_text() == "hello"
+    assert dst.is_symlink() == (strategy == "symlink")
+    assert os.path.samefile(src, dst) == (strategy in ("hardlink", "symlink"))
+    if strategy in ("copy", "reflink"):
+        assert dst.stat().st_mtime_ns == src.stat().st_mtime_ns
+
+    # Up to date, whether linked or copied.
+    for check in ["mtime", "hash"]:
+        assert is_unchanged(src, dst, strategy, check)
+        assert not copy_file(src, dst, strategy, check)
+    assert copy_file(src, dst, strategy)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["dst.txt", "src.txt"]
+
+
+def test_copy_file_switch_strategy(tmp_path: Path, src: Path) -> None:
+    dst = tmp_path / "dst.txt"
+    copy_file(src, dst, "hardlink")
+    # A link isn't an up to date copy. Copying replaces it instead of writing
+    # through it to src.
+    assert not is_unchanged(src, dst, "copy", "mtime")
+    assert copy_file(src, dst, "copy", "mtime")
+    assert not os.path.samefile(src, dst)
+    assert not is_unchanged(src, dst, "symlink", "mtime")
+    copy_file(src, dst, "symlink")
+    assert not is_unchanged(src, dst, "hardlink", "mtime")
+    assert src.read_text() == "hello"
+
+
+def test_is_unchanged(tmp_path: Path, src: Path) -> None:
+    dst = tmp_path / "dst.txt"
+    assert not is_unchanged(src, dst, "copy", "mtime")
+    copy_file(src, dst)
+
+    # Same size and time, but different content.
+    dst.write_text("HELLO")
+    os.utime(dst, ns=(src.stat().st_atime_ns, src.stat().st_mtime_ns))
+    assert is_unchanged(src, dst, "copy", "mtime")
+    assert not is_unchanged(src, dst, "copy", "hash")
+
+    # Same content, but a different time.
+    dst.write_text("hello")
+    os.utime(dst, ns=(0, 0))
+    assert not is_unchanged(src, dst, "copy", "mtime")
+    assert is_unchanged(src, dst, "copy", "hash")
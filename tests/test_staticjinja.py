@@ -1,13 +1,20 @@
 from __future__ import annotations
 
+import asyncio
+import gzip
 import os
+import re
+import subprocess
+import sys
+import threading
+import typing as t
 from pathlib import Path
 
-from jinja2 import Template
-from pytest import MonkeyPatch, mark, raises
+from jinja2 import Environment, FileSystemLoader, Template
+from pytest import LogCaptureFixture, MonkeyPatch, mark, raises
 
-from staticjinja import Reloader, Site
-from staticjinja.types import Context, FilePath
+from staticjinja import BuildError, Lazy, MemoryOutput, Reloader, Site
+from staticjinja.types import Context, ContextMapping, FilePath
 
 
 def test_template_names(site: Site) -> None:
@@ -16,6 +23,7 @@ def test_template_names(site: Site) -> None:
         ["template1.html", "template2.html", "sub/template3.html", "template4.html"]
     )
     assert set(site.template_names) == expected_templates
+    assert site.template_names == sorted(site.template_names)
 
 
 def test_templates(site: Site) -> None:
@@ -23,6 +31,59 @@ def test_templates(site: Site) -> None:
     assert [t.name for t in site.templates] == expected
 
 
+def test_discover(site: Site, template_path: Path, monkeypatch: MonkeyPatch) -> None:
+    site.staticpaths = ["static_css", ".ignoreds/ignored3.html"]
+    scanned = []
+    scandir = os.scandir
+
+    def spy_scandir(path: str) -> t.Any:
+        scanned.append(Path(path).relative_to(template_path).as_posix())
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", spy_scandir)
+    assert list(site.discover()) == [
+        (".ignoreds/ignored3.html", "static"),
+        ("_partial1.html", "partial"),
+        ("_partials/partial3.html", "partial"),
+        ("favicon.ico", "template"),
+        ("static_css/hello.css", "static"),
+        ("static_js/hello.js", "template"),
+        ("sub/template3.html", "template"),
+        ("sub2/_partial2.html", "partial"),
+        ("template1.html", "template"),
+        ("template2.html", "template"),
+        ("template4.html", "template"),
+    ]
+    # Ignored directories are only read if they may contain static files.
+    site.staticpaths = []
+    scanned.clear()
+    assert [name for name, _ in site.discover(partials=False)] == [
+        "favicon.ico",
+        "static_css/hello.css",
+        "static_js/hello.js",
+        "sub/template3.html",
+        "template1.html",
+        "template2.html",
+        "template4.html",
+    ]
+    assert scanned == [".", "static_css", "static_js", "sub", "sub1", "sub2"]
+
+
+def test_discover_sorted(tmp_path: Path, build_path: Path) -> None:
+    """Test that names are sorted like list_templates() sorts them."""
+    names = ["a.html", "a/b.html", "a-b.html", "a/b/c.html", "b", "ab/c.html"]
+    for i, name in enumerate(names):
+        path = tmp_path / f"searchpath{i % 2}" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(name)
+    (tmp_path / "searchpath1/a.html").write_text("shadowed")
+    env = Environment(
+        loader=FileSystemLoader([tmp_path / "searchpath0", tmp_path / "searchpath1"])
+    )
+    site = Site(env, searchpath=str(tmp_path), outpath=build_path)
+    assert site.template_names == env.list_templates() == sorted(names)
+
+
 def test_get_context(site: Site) -> None:
     assert site.get_context(site.get_template("template1.html")) == {}
     assert site.get_context(site.get_template("template2.html")) == {"a": 1}
@@ -44,19 +105,132 @@ def test_get_rule(site: Site) -> None:
     assert site.get_rule("template2.html")
 
 
-def test_get_dependents(monkeypatch: MonkeyPatch, site: Site) -> None:
+@mark.parametrize(
+    "regexes",
+    [
+        # Combined into single regexes.
+        [r".*\.css", r"sub/.*", r"template\d\.html", r".*"],
+        # Groups and flags are matched one by one instead.
+        [r"(.*)\.css", r"sub/.*", r"TEMPLATE\d\.HTML", r"(?i).*"],
+        [r"(?i).*\.css", r"SUB/.*", r"(t)emplate\d\.html\1?", r".*"],
+    ],
+)
+def test_get_context_dispatch(site: Site, regexes: list[str]) -> None:
+    """Test that contexts and rules match the same templates however their
+    regexes are compiled."""
+    site.contexts = [(regex, {str(i): i}) for i, regex in enumerate(regexes)]
+    site.rules = [(regex, lambda site, template, **kwargs: None) for regex in regexes]
+    for name in site.template_names:
+        matches = [i for i, regex in enumerate(regexes) if re.match(regex, name)]
+        context = site.get_context(site.get_template(name))
+        assert context == {str(matches[0]): matches[0]}
+        assert site.get_rule(name) is site.rules[matches[0]][1]
+        site.mergecontexts = True
+        context = site.get_context(site.get_template(name))
+        assert list(context.values()) == matches
+        site.mergecontexts = False
+
+
+def test_get_context_changed(site: Site) -> None:
+    """Test that contexts and rules changed after the Site was created are used."""
+    assert site.get_context(site.get_template("template1.html")) == {}
+    site.contexts.insert(0, ("template1.html", {"new": True}))
+    assert site.get_context(site.get_template("template1.html")) == {"new": True}
+    site.contexts = [("template2.html", {"other": True})]
+    assert site.get_context(site.get_template("template1.html")) == {}
+    assert site.get_context(site.get_template("template2.html")) == {"other": True}
+
+    def rule(site: Site, template: Template, **kwargs: t.Any) -> None:
+        pass
+
+    site.rules = [("template1.html", rule)]
+    assert site.get_rule("template1.html") is rule
+    site.rules[0] = ("template2.html", rule)
+    with raises(ValueError):
+        site.get_rule("template1.html")
+    # The lists are used as given, so changes to them apply too.
+    contexts: ContextMapping = []
+    site.contexts = contexts
+    contexts.append(("template1.html", {"given": True}))
+    assert site.get_context(site.get_template("template1.html")) == {"given": True}
+
+
+def test_get_dependents(site: Site, template_path: Path) -> None:
     filename = "test.txt"
     # An ignored file has no dependendents
     assert site.get_dependents(".%s" % filename) == []
-    # All the other templates might depend on a partial
-    mock_template_names = ["a", "b", "c"]
-    monkeypatch.setattr(Site, "template_names", mock_template_names)
-    assert list(site.get_dependents("_%s" % filename)) == mock_template_names
+    # A partial that no template references may still be loaded by a rule
+    assert list(site.get_dependents("_%s" % filename)) == ["template2.html"]
     # A normal template only has itself as a dependent
     assert list(site.get_dependents("%s" % filename)) == [filename]
     # TODO maybe test that static files only have themselves as dependents
 
 
+def test_get_dependents_partials(site: Site, template_path: Path) -> None:
+    # Without the rule of template2.html, which may load any partial.
+    site.rules = []
+    template_path.joinpath("_base.html").write_text("{% block body %}{% endblock %}")
+    template_path.joinpath("_nav.html").write_text("{% include '_partial1.html' %}")
+    template_path.joinpath("page1.html").write_text(
+        "{% extends '_base.html' %}{% block body %}"
+        "{% include 'sub2/_partial2.html' %}{% endblock %}"
+    )
+    template_path.joinpath("page2.html").write_text("{% include '_nav.html' %}")
+    template_path.joinpath("page3.html").write_text(
+        "{% from '_partials/partial3.html' import x %}{% include 'page2.html' %}"
+    )
+    assert site.get_dependents("_base.html") == ["page1.html"]
+    assert site.get_dependents("sub2/_partial2.html") == ["page1.html"]
+    # Dependents are found transitively, including through other templates.
+    assert site.get_dependents("_partial1.html") == ["page2.html", "page3.html"]
+    assert site.get_dependents("_partials/partial3.html") == ["page3.html"]
+    assert site.get_dependents("page2.html") == ["page2.html", "page3.html"]
+    assert site.get_dependents("_unused.html") == []
+
+
+def test_get_dependents_dynamic(site: Site, template_path: Path) -> None:
+    site.rules = []
+    template_path.joinpath("_dynamic.html").write_text("{% include name %}")
+    template_path.joinpath("page1.html").write_text("{% include '_dynamic.html' %}")
+    template_path.joinpath("page2.html").write_text("{% extends layout %}")
+    template_path.joinpath("page3.html").write_text("{% include '_other.html' %}")
+    # Templates with dynamic references may depend on anything.
+    assert site.get_dependents("_partial1.html") == ["page1.html", "page2.html"]
+    assert site.get_dependents("_other.html") == [
+        "page1.html",
+        "page2.html",
+        "page3.html",
+    ]
+
+
+def test_dependencies(site: Site, template_path: Path) -> None:
+    template_path.joinpath("_a.html").write_text("{% include '_b.html' %}")
+    template_path.joinpath("_b.html").write_text("{{ b }}")
+    template_path.joinpath("page.html").write_text(
+        "{% set a = 1 %}{{ a }}{{ c }}{% include '_a.html' %}"
+    )
+    graph = site.dependencies
+    assert graph.dependencies("page.html") == {"_a.html", "_b.html"}
+    assert graph.variables("page.html") == {"b", "c"}
+    assert graph.globals("page.html") == set()
+    template_path.joinpath("_b.html").write_text("{{ asset_url('a.css') }}")
+    site.env.globals["asset_url"] = lambda name: name
+    graph.update("_b.html")
+    assert graph.globals("page.html") == {"asset_url"}
+    assert graph.dependents("_b.html") == {"_a.html", "page.html"}
+    assert "page.html" in graph
+    # Changes are only seen once the graph is updated.
+    template_path.joinpath("page.html").write_text("{% include name %}")
+    assert graph.dependencies("page.html") == {"_a.html", "_b.html"}
+    graph.update("page.html")
+    assert graph.dependencies("page.html") is None
+    assert graph.variables("page.html") is None
+    assert graph.dynamic == {"page.html"}
+    graph.remove("page.html")
+    assert "page.html" not in graph
+    assert graph.dependents("_b.html") == {"_a.html"}
+
+
 def test_render_template(site: Site, build_path: Path) -> None:
     site.render_template(site.get_template("template1.html"))
     template1 = build_path.joinpath("template1.html")
@@ -92,6 +266,615 @@ def test_render_templates(site: Site, build_path: Path) -> None:
     assert template3.read_text() == "Test 3"
 
 
+def double_context(template: Template) -> Context:
+    return {"b": 2 * len(str(template.name))}
+
+
+def render_upper(site: Site, template: Template, **context: object) -> None:
+    assert template.name is not None
+    out = Path(site.outpath) / template.name
+    out.write_text(template.render(**context).upper())
+
+
+def test_render_templates_workers(
+    template_path: Path, build_path: Path, root_path: Path, caplog: LogCaptureFixture
+) -> None:
+    for i in range(10):
+        template_path.joinpath(f"page{i}.html").write_text("Page {{b}}")
+    template_path.joinpath("page0.html").write_text("Rule {{b}}")
+
+    def build(outpath: Path, workers: int) -> None:
+        site = Site.make_site(
+            searchpath=template_path,
+            outpath=outpath,
+            contexts=[(r".*\.html", double_context)],
+            rules=[("page0.html", render_upper)],
+        )
+        site.render(workers=workers)
+
+    serial = root_path / "serial"
+    serial.mkdir()
+    build(serial, 1)
+    build(build_path, 3)
+    names = sorted(p.name for p in serial.iterdir())
+    assert len(names) == 10
+    assert sorted(p.name for p in build_path.iterdir()) == names
+    for name in names:
+        assert (
+            build_path.joinpath(name).read_text() == serial.joinpath(name).read_text()
+        )
+    assert build_path.joinpath("page0.html").read_text() == "RULE 20"
+    # Log messages from the workers end up in the parent's handlers.
+    assert "Rendering page7.html..." in caplog.text
+
+
+def test_render_workers_collects_errors(template_path: Path, build_path: Path) -> None:
+    template_path.joinpath("good.html").write_text("Good")
+    template_path.joinpath("bad.html").write_text("{{ 1 / 0 }}")
+    site = Site.make_site(searchpath=template_path, outpath=build_path)
+    with raises(BuildError) as exc_info:
+        site.render(workers=2)
+    assert list(exc_info.value.errors) == ["bad.html"]
+    assert isinstance(exc_info.value.errors["bad.html"], ZeroDivisionError)
+    assert build_path.joinpath("good.html").read_text() == "Good"
+
+
+def exit_rule(site: Site, template: Template, **context: object) -> None:
+    raise SystemExit(f"Can't build {template.name}")
+
+
+def test_render_workers_error_names(template_path: Path, build_path: Path) -> None:
+    """Test that errors are reported under the template that failed, rather
+    than the first one of its batch."""
+    for i in range(16):
+        template_path.joinpath(f"page{i:02}.html").write_text("Page")
+    site = Site.make_site(
+        searchpath=template_path,
+        outpath=build_path,
+        rules=[("page01.html", exit_rule)],
+    )
+    with raises(BuildError) as exc_info:
+        site.render(workers=2)
+    assert list(exc_info.value.errors) == ["page01.html"]
+    assert isinstance(exc_info.value.errors["page01.html"], SystemExit)
+    assert len(list(build_path.glob("page*.html"))) == 15
+
+
+def test_render_templates_workers_unpicklable(site: Site) -> None:
+    with raises(TypeError, match="picklable"):
+        site.render_templates(site.templates, workers=2)
+
+
+def test_render_templates_workers_requires_make_site(template_path: Path) -> None:
+    env = Environment(loader=FileSystemLoader(template_path))
+    site = Site(env, searchpath=template_path)
+    with raises(ValueError, match="make_site"):
+        site.render(workers=2)
+
+
+def test_render_templates_threads(site: Site, build_path: Path) -> None:
+    site.render_templates(site.templates, threads=4)
+    assert build_path.joinpath("template1.html").read_text() == "Test 1"
+    assert build_path.joinpath("sub", "template3.html").read_text() == "Test 3"
+    assert build_path.joinpath("template4.html").read_text() == "Test 4 and 5"
+
+
+def test_render_threads_collects_errors(
+    site: Site, template_path: Path, build_path: Path
+) -> None:
+    template_path.joinpath("bad1.html").write_text("{{ 1 / 0 }}")
+    template_path.joinpath("bad2.html").write_text("{% for x in %}")
+    with raises(BuildError) as exc_info:
+        site.render(threads=3)
+    errors = exc_info.value.errors
+    assert sorted(errors) == ["bad1.html", "bad2.html"]
+    assert isinstance(errors["bad1.html"], ZeroDivisionError)
+    # The other templates were still rendered.
+    assert build_path.joinpath("template1.html").read_text() == "Test 1"
+
+
+def test_copy_static_threads(site: Site, build_path: Path) -> None:
+    site.staticpaths = ["static_css", "static_js"]
+    site.copy_static(site.static_names, threads=2)
+    assert build_path.joinpath("static_css", "hello.css").exists()
+    assert build_path.joinpath("static_js", "hello.js").exists()
+    with raises(BuildError, match="missing.css"):
+        site.copy_static(["missing.css"], threads=2)
+
+
+def test_copy_static_check(site: Site, template_path: Path, build_path: Path) -> None:
+    site.staticpaths = ["static_css", "static_js"]
+    site.static_strategy = "hardlink"
+    site.static_check = "mtime"
+    site.render()
+    assert (site.summary.copied, site.summary.up_to_date) == (2, 0)
+    hello = build_path / "static_css" / "hello.css"
+    assert hello.samefile(template_path / "static_css" / "hello.css")
+    summary = site.render(threads=2)
+    assert (summary.copied, summary.up_to_date) == (0, 2)
+    assert str(summary).endswith("0 static files copied, 2 up to date")
+
+    with raises(ValueError, match="static_strategy"):
+        Site.make_site(searchpath=template_path, static_strategy="move")
+    with raises(ValueError, match="static_check"):
+        Site.make_site(searchpath=template_path, static_check="size")
+
+
+def test_fingerprint_static(template_path: Path, build_path: Path) -> None:
+    css = template_path / "static" / "app.css"
+    css.parent.mkdir()
+    css.write_text("a {}")
+    template_path.joinpath("_head.html").write_text(
+        "<link href='{{ asset_url('static/app.css') }}'>"
+    )
+    template_path.joinpath("index.html").write_text("{% include '_head.html' %}")
+    template_path.joinpath("about.html").write_text("{{ asset_url('about.html') }}")
+    site = Site.make_site(
+        searchpath=template_path, outpath=build_path, fingerprint_static=True
+    )
+    site.staticpaths = ["static"]
+    with raises(ValueError, match="about.html is not a static file"):
+        site.render()
+    template_path.joinpath("about.html").unlink()
+
+    def url() -> str:
+        assert site.assets is not None
+        return "/" + str(site.assets.get("static/app.css"))
+
+    summary = site.render(incremental=True)
+    assert summary.rendered == 1
+    assert re.fullmatch(r"/static/app\.[0-9a-f]{8}\.css", url())
+    assert build_path.joinpath(url()[1:]).read_text() == "a {}"
+    assert not build_path.joinpath("static", "app.css").exists()
+    assert build_path.joinpath("index.html").read_text() == f"<link href='{url()}'>"
+    assert site.asset_url("static/app.css", "https://cdn.test/") == (
+        f"https://cdn.test{url()}"
+    )
+    assert site.get_dependents("static/app.css") == ["static/app.css", "index.html"]
+
+    # Pages are rendered again when a static file gets a new name.
+    old_url = url()
+    assert site.render(incremental=True).skipped == 1
+    css.write_text("b {}")
+    assert site.render(incremental=True).rendered == 1
+    assert url() != old_url
+    assert build_path.joinpath("index.html").read_text() == f"<link href='{url()}'>"
+
+    output = build_path / url()[1:]
+    css.unlink()
+    site.remove_output("static/app.css")
+    assert not output.exists()
+    assert site.assets is not None and site.assets.get("static/app.css") is None
+
+
+@mark.filterwarnings("ignore:staticpaths are deprecated")
+def test_fingerprint_static_workers(template_path: Path, build_path: Path) -> None:
+    """Test that templates get the new URL of a static file changed after a
+    build in worker processes, which don't report which files they used."""
+    css = template_path / "static" / "app.css"
+    css.parent.mkdir()
+    css.write_text("a {}")
+    template_path.joinpath("_head.html").write_text("{{ asset_url('static/app.css') }}")
+    template_path.joinpath("index.html").write_text("{% include '_head.html' %}")
+    template_path.joinpath("about.html").write_text("About")
+    site = Site.make_site(
+        searchpath=template_path,
+        outpath=build_path,
+        staticpaths=["static"],
+        fingerprint_static=True,
+    )
+    site.render(workers=2)
+    old_url = build_path.joinpath("index.html").read_text()
+    css.write_text("b {}")
+    Reloader(site).handle_batch([("modified", str(css))])
+    assert site.assets is not None
+    url = "/" + str(site.assets.get("static/app.css"))
+    assert url != old_url
+    assert build_path.joinpath("index.html").read_text() == url
+    assert site.get_dependents("static/app.css") == ["static/app.css", "index.html"]
+
+
+def test_render_output(site: Site, build_path: Path) -> None:
+    def rule(site: Site, template: Template, **kwargs: t.Any) -> None:
+        site.write("rule/" + str(template.name), template.generate(**kwargs))
+
+    site.output = output = MemoryOutput()
+    site.rules = [("template2.html", rule)]
+    site.staticpaths = ["static_css"]
+    site.write_if_changed = True
+    summary = site.render(incremental=True)
+    assert output.files["template1.html"] == b"Test 1"
+    assert output.files["rule/template2.html"] == b"Test 2"
+    assert output.files["static_css/hello.css"] == b"a { color: blue; }"
+    assert list(build_path.iterdir()) == [build_path / ".staticjinja-manifest.json"]
+    assert site.render(incremental=True).skipped == summary.rendered
+
+    site.remove_output("static_css/hello.css")
+    assert "static_css/hello.css" not in output.files
+    with raises(ValueError, match="output to be on the filesystem"):
+        site.render(workers=2)
+
+
+def test_precompress(template_path: Path, build_path: Path) -> None:
+    page = "<p>" + "hello " * 300 + "</p>"
+    template_path.joinpath("index.html").write_text(page)
+    template_path.joinpath("small.html").write_text("<p>hi</p>")
+    template_path.joinpath("rule.html").write_text(page)
+    css = template_path / "static" / "app.css"
+    css.parent.mkdir()
+    css.write_text("a { color: blue; }" * 100)
+
+    def rule(site: Site, template: Template, **kwargs: t.Any) -> None:
+        site.write("out/rule.html", template.generate(**kwargs))
+
+    site = Site.make_site(
+        searchpath=template_path,
+        outpath=build_path,
+        rules=[("rule.html", rule)],
+        precompress=True,
+    )
+    site.staticpaths = ["static"]
+    site.render(threads=2)
+    for name in ["index.html", "out/rule.html", "static/app.css"]:
+        compressed = build_path.joinpath(name + ".gz").read_bytes()
+        assert gzip.decompress(compressed) == build_path.joinpath(name).read_bytes()
+    assert not build_path.joinpath("small.html.gz").exists()
+    assert site.precompressed_path.exists()
+
+    # Unchanged files aren't compressed again.
+    assert site.precompressor is not None
+    entries = dict(site.precompressor.entries)
+    index_gz = build_path / "index.html.gz"
+    os.utime(index_gz, ns=(0, 0))
+    site.render()
+    assert index_gz.stat().st_mtime_ns == 0
+    assert site.precompressor.entries == entries
+
+    css.unlink()
+    site.remove_output("static/app.css")
+    assert not build_path.joinpath("static", "app.css.gz").exists()
+
+
+def test_precompress_workers(template_path: Path, build_path: Path) -> None:
+    """Test that compressed copies removed in worker processes are forgotten
+    by the parent too."""
+    page = template_path / "index.html"
+    page.write_text("<p>" + "hello " * 300 + "</p>")
+    site = Site.make_site(
+        searchpath=template_path, outpath=build_path, precompress=True
+    )
+    site.render(workers=2)
+    assert site.precompressor is not None
+    assert "index.html" in site.precompressor.entries
+    assert build_path.joinpath("index.html.gz").exists()
+
+    page.write_text("<p>hi</p>")
+    site.render(workers=2)
+    assert not build_path.joinpath("index.html.gz").exists()
+    assert "index.html" not in site.precompressor.entries
+    assert "index.html" not in site.precompressed_path.read_text()
+
+
+def test_render_incremental(template_path: Path, build_path: Path) -> None:
+    template_path.joinpath("_base.html").write_text("Base {% block b %}{% endblock %}")
+    template_path.joinpath("a.html").write_text(
+        "{% extends '_base.html' %}{% block b %}{{ x }}{% endblock %}"
+    )
+    template_path.joinpath("b.html").write_text("B")
+    template_path.joinpath("c.html").write_text("{% include name %}")
+    data = {"x": 1, "name": "b.html"}
+    site = Site.make_site(
+        searchpath=template_path, outpath=build_path, contexts=[(".*", data)]
+    )
+
+    def render() -> tuple[int, int]:
+        summary = site.render(incremental=True)
+        return summary.rendered, summary.skipped
+
+    assert render() == (3, 0)
+    assert site.manifest_path == build_path / ".staticjinja-manifest.json"
+    assert site.manifest_path.exists()
+    assert render() == (0, 3)
+    # Changing a template only re-renders it, and any dynamic templates.
+    template_path.joinpath("b.html").write_text("B2")
+    assert render() == (2, 1)
+    assert build_path.joinpath("c.html").read_text() == "B2"
+    # Changing a partial re-renders the templates that use it.
+    template_path.joinpath("_base.html").write_text("Base2 {% block b %}{% endblock %}")
+    assert render() == (2, 1)
+    assert build_path.joinpath("a.html").read_text() == "Base2 1"
+    # Changing a context re-renders the templates that use it.
+    data["x"] = 2
+    assert render() == (3, 0)
+    # A missing output is rendered again.
+    build_path.joinpath("b.html").unlink()
+    assert render() == (1, 2)
+    # Changing the globals or filters of the environment re-renders everything.
+    site.env.globals["greeting"] = "Hello"
+    assert render() == (3, 0)
+    site.env.filters["shout"] = str.upper
+    assert render() == (3, 0)
+    assert render() == (0, 3)
+    # A normal build renders everything.
+    assert site.render().rendered == 3
+
+
+def test_render_incremental_rule_layout(template_path: Path, build_path: Path) -> None:
+    """Test that the templates a rule loads itself, like the layout of the
+    markdown example, are part of what incremental builds compare."""
+    template_path.joinpath("post.md").write_text("Post")
+    layout = template_path / "_post.html"
+    layout.write_text("<p>{{ title }} {{ content }}</p>")
+    titles = ["Title"]
+
+    def render_md(site: Site, template: Template, **kwargs: t.Any) -> None:
+        assert template.filename is not None
+        content = Path(template.filename).read_text()
+        layout = site.get_template("_post.html")
+        site.write("post.html", layout.render(content=content, **kwargs))
+
+    site = Site.make_site(
+        searchpath=template_path,
+        outpath=build_path,
+        # Only the layout reads it.
+        contexts=[(r".*\.md", lambda: {"title": Lazy(lambda: titles[0])})],
+        rules=[(r".*\.md", render_md)],
+    )
+    assert site.render(incremental=True).rendered == 1
+    assert site.render(incremental=True).skipped == 1
+    layout.write_text("<div>{{ title }} {{ content }}</div>")
+    assert site.render(incremental=True).rendered == 1
+    assert build_path.joinpath("post.html").read_text() == "<div>Title Post</div>"
+    titles[0] = "New title"
+    assert site.render(incremental=True).rendered == 1
+    assert build_path.joinpath("post.html").read_text() == "<div>New title Post</div>"
+
+
+def test_render_incremental_between_runs(template_path: Path, build_path: Path) -> None:
+    """The keys of templates are the same in the next process to build them."""
+    template_path.joinpath("a.html").write_text("{{ 'a' | upper }}")
+    code = (
+        "import sys, staticjinja\n"
+        "site = staticjinja.Site.make_site(*sys.argv[1:])\n"
+        "print(site.render(incremental=True).skipped)"
+    )
+    command = [sys.executable, "-c", code, str(template_path), str(build_path)]
+    runs = [
+        subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        for _ in range(2)
+    ]
+    assert runs == ["0\n", "1\n"]
+
+
+def test_render_incremental_workers(template_path: Path, build_path: Path) -> None:
+    for i in range(4):
+        template_path.joinpath(f"page{i}.html").write_text(f"Page {i}")
+    cache_dir = build_path / "cache"
+    site = Site.make_site(
+        searchpath=template_path, outpath=build_path, cache_dir=cache_dir
+    )
+    assert site.render(incremental=True, workers=2).rendered == 4
+    assert site.manifest_path == cache_dir / ".staticjinja-manifest.json"
+    template_path.joinpath("page1.html").write_text("Changed")
+    summary = site.render(incremental=True, workers=2, profile=True)
+    assert (summary.rendered, summary.skipped) == (1, 3)
+    assert build_path.joinpath("page1.html").read_text() == "Changed"
+    # Profiles are gathered from the workers.
+    assert site.profile is not None
+    assert site.profile.bytes_written == {"page1.html": len("Changed")}
+    assert site.profile.calls["get_context"] == 4
+
+
+def test_write_if_changed(template_path: Path, build_path: Path) -> None:
+    template_path.joinpath("a.html").write_text("A {{ x }}")
+    template_path.joinpath("b.html").write_text("B")
+    data = {"x": 1}
+    site = Site.make_site(
+        searchpath=template_path,
+        outpath=build_path,
+        contexts=[(".*", data)],
+        write_if_changed=True,
+    )
+    summary = site.render()
+    assert (summary.rendered, summary.unchanged) == (2, 0)
+    a, b = build_path / "a.html", build_path / "b.html"
+    os.utime(a, (0, 0))
+    os.utime(b, (0, 0))
+
+    data["x"] = 2
+    summary = site.render()
+    assert (summary.rendered, summary.unchanged) == (2, 1)
+    assert "1 unchanged" in str(summary)
+    assert a.read_text() == "A 2"
+    assert a.stat().st_mtime != 0
+    assert b.stat().st_mtime == 0
+
+
+def test_bytecode_cache(
+    monkeypatch: MonkeyPatch, template_path: Path, build_path: Path, root_path: Path
+) -> None:
+    template_path.joinpath("a.html").write_text("A {{ x }}")
+    cache_dir = root_path / "bytecode"
+
+    def make_site(**kwargs: t.Any) -> Site:
+        return Site.make_site(
+            searchpath=template_path,
+            outpath=build_path,
+            bytecode_cache_dir=cache_dir,
+            env_globals={"x": 1},
+            **kwargs,
+        )
+
+    make_site().render()
+    cached = list(cache_dir.iterdir())
+    assert len(cached) == 1
+
+    # A new Site loads the compiled template instead of compiling it again.
+    site = make_site()
+    compiled = []
+    compile = site.env.compile
+
+    def spy_compile(*args: t.Any, **kwargs: t.Any) -> t.Any:
+        compiled.append(args)
+        return compile(*args, **kwargs)
+
+    monkeypatch.setattr(site.env, "compile", spy_compile)
+    site.render()
+    assert compiled == []
+    assert build_path.joinpath("a.html").read_text() == "A 1"
+
+    # Changing the template invalidates its cached bytecode.
+    template_path.joinpath("a.html").write_text("A2 {{ x }}")
+    make_site().render()
+    assert build_path.joinpath("a.html").read_text() == "A2 1"
+
+    # So does changing how the Environment compiles templates.
+    template_path.joinpath("a.html").write_text("A <<x}}")
+    make_site().render()
+    assert build_path.joinpath("a.html").read_text() == "A <<x}}"
+    make_site(env_kwargs={"variable_start_string": "<<"}).render()
+    assert build_path.joinpath("a.html").read_text() == "A 1"
+    assert len(list(cache_dir.iterdir())) == 2
+
+
+def test_arender(template_path: Path, build_path: Path) -> None:
+    template_path.joinpath("a.html").write_text("{{ greeting }} {{ name }}")
+    template_path.joinpath("b.html").write_text("{{ greeting }}")
+    template_path.joinpath("rule.txt").write_text("ignored")
+    calls: list[str] = []
+    rendered: list[str] = []
+
+    async def greeting() -> Context:
+        calls.append("greeting")
+        await asyncio.sleep(0)
+        return {"greeting": "Hello"}
+
+    async def name(template: Template) -> Context:
+        return {"name": template.name}
+
+    async def rule(site: Site, template: Template, **kwargs: t.Any) -> None:
+        await asyncio.sleep(0)
+        rendered.append(kwargs["greeting"])
+
+    site = Site.make_site(
+        searchpath=template_path,
+        outpath=build_path,
+        contexts=[(r".*", greeting), ("a.html", name)],
+        rules=[(r".*\.txt", rule)],
+        mergecontexts=True,
+        env_kwargs={"enable_async": True},
+    )
+    summary = asyncio.run(site.arender())
+    assert summary.rendered == 3
+    assert build_path.joinpath("a.html").read_text() == "Hello a.html"
+    assert build_path.joinpath("b.html").read_text() == "Hello"
+    assert rendered == ["Hello"]
+    # Zero-argument contexts are awaited once per build.
+    assert calls == ["greeting"]
+
+    # Sync rendering can't await contexts.
+    with raises(TypeError, match="Async contexts"):
+        site.get_context(site.get_template("a.html"))
+
+
+def test_arender_threads(
+    template_path: Path, build_path: Path, monkeypatch: MonkeyPatch
+) -> None:
+    """Test that sync steps of arender() don't run in the event loop's thread."""
+    template_path.joinpath("a.html").write_text("{{ where() }}")
+    template_path.joinpath("rule.txt").write_text("ignored")
+    threads: dict[str, int] = {}
+
+    def where() -> str:
+        threads["render"] = threading.get_ident()
+        return "a"
+
+    def rule(site: Site, template: Template, **kwargs: t.Any) -> None:
+        threads["rule"] = threading.get_ident()
+
+    site = Site.make_site(
+        searchpath=template_path,
+        outpath=build_path,
+        rules=[(r".*\.txt", rule)],
+        env_globals={"where": where},
+    )
+    get_template = site.env.get_template
+
+    def load(name: str) -> Template:
+        threads.setdefault("load", threading.get_ident())
+        return get_template(name)
+
+    monkeypatch.setattr(site.env, "get_template", load)
+    asyncio.run(site.arender())
+    assert build_path.joinpath("a.html").read_text() == "a"
+    assert set(threads) == {"render", "rule", "load"}
+    assert threading.get_ident() not in threads.values()
+
+
+def test_arender_incremental(template_path: Path, build_path: Path) -> None:
+    """Test that arender() sets up incremental builds like render() does."""
+    template_path.joinpath("_partial.html").write_text("one")
+    template_path.joinpath("a.html").write_text("{% include '_partial.html' %}")
+    template_path.joinpath("b.html").write_text("b")
+    site = Site.make_site(searchpath=template_path, outpath=build_path)
+    assert asyncio.run(site.arender(incremental=True)).rendered == 2
+    assert asyncio.run(site.arender(incremental=True)).skipped == 2
+
+    template_path.joinpath("_partial.html").write_text("two")
+    summary = asyncio.run(site.arender(incremental=True))
+    assert (summary.rendered, summary.skipped) == (1, 1)
+    assert build_path.joinpath("a.html").read_text() == "two"
+    assert site.manifest is None
+
+
+def test_arender_templates_concurrency(site: Site, build_path: Path) -> None:
+    running: list[None] = []
+    most = 0
+
+    async def context() -> Context:
+        nonlocal most
+        running.append(None)
+        most = max(most, len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        return {"b": 1, "c": 2}
+
+    async def build() -> None:
+        # Several requests at once share the Site's limit.
+        await asyncio.gather(
+            site.arender_templates(site.templates),
+            site.arender_templates(site.templates),
+        )
+
+    site.contexts = [(".*", lambda t: context())]
+    site.async_concurrency = 2
+    asyncio.run(build())
+    assert most == 2
+    assert build_path.joinpath("template4.html").read_text() == "Test 1 and 2"
+
+
+@mark.parametrize("threads", [1, 2])
+def test_render_profile(site: Site, threads: int) -> None:
+    site.render(threads=threads, profile=True)
+    profile = site.profile
+    assert profile is not None
+    assert set(profile.timings) == set(site.template_names)
+    assert set(profile.timings["template1.html"]) == {
+        "load",
+        "context",
+        "rule",
+        "render",
+        "write",
+    }
+    # template2.html is rendered by a rule, which doesn't write through the Site.
+    assert "write" not in profile.timings["template2.html"]
+    assert profile.bytes_written["template4.html"] == len("Test 4 and 5")
+    count = len(site.template_names)
+    assert profile.calls == {"get_context": count, "get_rule": count}
+    site.render()
+    assert site.profile is None
+
+
 def test_build(monkeypatch: MonkeyPatch, site: Site) -> None:
     templates: list[Template] = []
 